@@ -0,0 +1,304 @@
+'''Benchmark of the annotators on the fixtures of the tests.
+
+    python3 .checker/bench/bench.py -o bench.json .checker/tests/mecab .checker/tests/udpipe
+    python3 .checker/bench/bench.py -o new.json --baseline bench.json .checker/tests/mecab
+
+Each fixture (a test case with `exe` and `input_text`; see .checker/tests) is scaled
+to a corpus of about `--sizes` sentences by copying `input_text`, and is annotated:
+
+- cli: by the command of the test (`sbt "runMain ..."`, `java ...` or `docker ...`) with
+  `-file`. `sentences_per_sec` is the total throughput of the command, including the
+  startup and the loading of the models, which are not separable from the annotation
+  in a run. `load_seconds` is the time of the command on a single copy, which roughly
+  shows their share.
+- server: by PipelineServer (see server.py), a request for each copy, by `--clients`
+  clients. `load_seconds` is the time of the first request (the loading of the models),
+  which is excluded from the other metrics. Not available for the tests in docker.
+
+`peak_rss_mb` is the peak resident memory of the command (of the docker client in
+docker), or of the processes of the server. With `--baseline`, the results are
+compared with those of a previous run, and the run fails if a metric is worse by more
+than `--tolerance`.
+'''
+import argparse
+import json
+import math
+import multiprocessing.pool
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append(".checker/tests")
+
+import server  # noqa: E402
+
+DEFAULT_DIRECTORIES = ['corenlp', 'knp', 'mecab', 'udpipe', 'depccg', 'benepar']
+
+# The metrics compared with a baseline, and whether a larger value is better.
+METRICS = {
+    'sentences_per_sec': True,
+    'p50': False,
+    'p95': False,
+    'p99': False,
+    'peak_rss_mb': False,
+    'load_seconds': False,
+}
+
+
+class Fixture:
+    '''The command and the input of a test case.
+    '''
+    def __init__(self, test: unittest.TestCase):
+        test.setUp()
+        self.id = '{}.{}'.format(type(test).__module__, type(test).__name__)
+        self.exe = test.exe
+        self.input_text = test.input_text
+        self.sentences = max(1, len(re.findall(r'<sentence\b', test.expected_text)))
+
+    def copies(self, size: int) -> int:
+        '''the number of copies of the input for a corpus of about `size` sentences.
+        '''
+        return max(1, math.ceil(size / self.sentences))
+
+
+def fixtures(directories: list) -> list:
+    '''the fixtures of the test cases under the directories.
+    '''
+    def flatten(suite):
+        for test in suite:
+            if isinstance(test, unittest.TestSuite):
+                yield from flatten(test)
+            else:
+                yield test
+    tests = [t for d in directories for t in flatten(unittest.TestLoader().discover(d))]
+    # Test methods of the same class share a fixture.
+    unique = {}
+    for test in tests:
+        unique.setdefault(type(test), test)
+    result = []
+    for test in unique.values():
+        try:
+            result.append(Fixture(test))
+        except AttributeError:
+            # Not a test of an annotator (e.g., a module failed to import).
+            print('Skipped: {}'.format(test.id()), file=sys.stderr)
+    return result
+
+
+def percentile(values: list, p: float) -> float:
+    '''the p-th percentile by the nearest rank.
+
+    >>> percentile([4, 1, 3, 2], 50)
+    2
+    >>> percentile(list(range(1, 101)), 99)
+    99
+    '''
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def latencies(seconds: list) -> dict:
+    return {'p50': percentile(seconds, 50), 'p95': percentile(seconds, 95),
+            'p99': percentile(seconds, 99)}
+
+
+def run_command(exe: str, input_text: str, directory: str) -> tuple:
+    '''run the command of a test on the input, in the same way as BaseTest. Return the
+    seconds and the peak RSS (MB) of the command and its children.
+    '''
+    path = os.path.join(directory, 'input.txt')
+    with open(path, mode='w', encoding='utf-8') as f:
+        f.write(input_text)
+    cwd = None
+    if exe.startswith('docker'):
+        command, cwd = '{} -file /mnt/{}'.format(exe, os.path.basename(path)), directory
+    elif exe.startswith('runMain'):
+        command = 'sbt "{} -file {}"'.format(exe, path)
+    else:
+        command = '{} -file {}'.format(exe, path)
+
+    start = time.time()
+    process = subprocess.Popen(command, shell=True, cwd=cwd, stdout=subprocess.DEVNULL)
+    # wait4 for the peak RSS, which covers the waited descendants (e.g., the JVM of sbt).
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.time() - start
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    if process.returncode != 0 or not os.path.exists(path + '.xml'):
+        raise RuntimeError('The command failed ({}): {}'.format(process.returncode, command))
+    # ru_maxrss is in KB on Linux.
+    return seconds, usage.ru_maxrss / 1024
+
+
+def bench_cli(fixture: Fixture, sizes: list) -> list:
+    directory = tempfile.mkdtemp(prefix='jigg-bench-')
+    try:
+        load_seconds, _ = run_command(fixture.exe, fixture.input_text, directory)
+        results = []
+        for size in sizes:
+            copies = fixture.copies(size)
+            seconds, rss = run_command(fixture.exe, '\n'.join([fixture.input_text] * copies), directory)
+            sentences = copies * fixture.sentences
+            results.append({
+                'fixture': fixture.id, 'mode': 'cli', 'size': size, 'sentences': sentences,
+                'seconds': seconds, 'load_seconds': load_seconds,
+                'sentences_per_sec': sentences / max(seconds, 1e-9),
+                'peak_rss_mb': rss,
+            })
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def process_group_rss(pgid: int) -> float:
+    '''the sum of the peak RSS (MB) of the processes in the process group (Linux).
+    '''
+    total = 0
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            if os.getpgid(int(pid)) != pgid:
+                continue
+            with open('/proc/{}/status'.format(pid)) as f:
+                total += sum(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+        except (OSError, ValueError):
+            pass
+    return total / 1024
+
+
+def bench_server(fixture: Fixture, sizes: list, clients: int) -> list:
+    command = server.split_command(fixture.exe)
+    if command is None:
+        return []
+    launcher, properties = command
+    s = server.Server.launch(launcher)
+    try:
+        start = time.time()
+        s.annotate(fixture.input_text, properties)
+        load_seconds = time.time() - start
+
+        def annotate(_):
+            start = time.time()
+            s.annotate(fixture.input_text, properties)
+            return time.time() - start
+
+        results = []
+        with multiprocessing.pool.ThreadPool(clients) as pool:
+            for size in sizes:
+                copies = fixture.copies(size)
+                start = time.time()
+                seconds = pool.map(annotate, range(copies))
+                elapsed = time.time() - start
+                sentences = copies * fixture.sentences
+                result = {
+                    'fixture': fixture.id, 'mode': 'server', 'size': size,
+                    'sentences': sentences, 'seconds': elapsed, 'load_seconds': load_seconds,
+                    'sentences_per_sec': sentences / max(elapsed, 1e-9),
+                    'peak_rss_mb': process_group_rss(s.process.pid),
+                }
+                result.update(latencies(seconds))
+                results.append(result)
+        return results
+    finally:
+        s.stop()
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    '''the regressions of the results from the baseline: the metrics worse by more
+    than the tolerance (a ratio).
+
+    >>> old = [{'fixture': 'a', 'mode': 'cli', 'size': 10, 'sentences_per_sec': 100.0, 'peak_rss_mb': 500}]
+    >>> new = [{'fixture': 'a', 'mode': 'cli', 'size': 10, 'sentences_per_sec': 80.0, 'peak_rss_mb': 520}]
+    >>> compare(new, old, 0.1)
+    [('a', 'cli', 10, 'sentences_per_sec', 100.0, 80.0)]
+    '''
+    def key(r):
+        return r['fixture'], r['mode'], r['size']
+    old = {key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = old.get(key(r))
+        if b is None:
+            continue
+        for metric, larger_is_better in METRICS.items():
+            if r.get(metric) is None or b.get(metric) is None:
+                continue
+            change = (r[metric] - b[metric]) / max(abs(b[metric]), 1e-9)
+            if (-change if larger_is_better else change) > tolerance:
+                regressions.append(key(r) + (metric, b[metric], r[metric]))
+    return regressions
+
+
+def meta() -> dict:
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directories', nargs='*',
+                        help='directories of the tests (default: {})'.format(', '.join(DEFAULT_DIRECTORIES)))
+    parser.add_argument('-o', '--output', default='bench.json', help='output JSON file (default: bench.json)')
+    parser.add_argument('--sizes', default='100,1000',
+                        help='comma-separated numbers of sentences of the corpora (default: 100,1000)')
+    parser.add_argument('--modes', default='cli,server', help='cli, server or both (default: cli,server)')
+    parser.add_argument('--clients', type=int, default=1, help='number of concurrent requests to a server')
+    parser.add_argument('--pool-size', type=int, default=1,
+                        help='number of pipelines of a server annotating in parallel')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='ratio of a change of a metric regarded as a regression (default: 0.1)')
+    args = parser.parse_args()
+
+    directories = args.directories or ['.checker/tests/' + d for d in DEFAULT_DIRECTORIES]
+    sizes = [int(s) for s in args.sizes.split(',')]
+    modes = args.modes.split(',')
+    os.environ[server.POOL_SIZE_ENV] = str(args.pool_size)
+
+    results = []
+    for fixture in fixtures(directories):
+        for mode in modes:
+            print('{} ({}) ...'.format(fixture.id, mode), flush=True)
+            try:
+                if mode == 'cli':
+                    rs = bench_cli(fixture, sizes)
+                elif mode == 'server':
+                    rs = bench_server(fixture, sizes, args.clients)
+                else:
+                    parser.error('Unknown mode: {}'.format(mode))
+            except Exception as e:
+                print('  failed: {}'.format(e), flush=True)
+                rs = [{'fixture': fixture.id, 'mode': mode, 'error': str(e)}]
+            for r in rs:
+                if 'error' not in r:
+                    print('  {size} sentences: {sentences_per_sec:.1f} sentences/sec, '
+                          'load {load_seconds:.1f}s, peak RSS {peak_rss_mb:.0f}MB'.format(**r), flush=True)
+            results.extend(rs)
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': meta(), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare([r for r in results if 'error' not in r],
+                              [r for r in baseline if 'error' not in r], args.tolerance)
+        for fixture, mode, size, metric, old, new in regressions:
+            print('Regression: {} ({}, {}): {} {:.3f} -> {:.3f}'.format(fixture, mode, size, metric, old, new))
+        if regressions:
+            sys.exit(1)
+    if any('error' in r for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
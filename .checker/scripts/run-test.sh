@@ -5,4 +5,10 @@ set -e
 source .checker/scripts/set-env.sh
 
 # run a unit test for the files under the directory `.checker/tests/${ANNOTATORS}`.
-python3 -m unittest discover -s .checker/tests/${ANNOTATORS}
+# If `JOBS` is set, the tests run in parallel by `JOBS` processes through shared
+# PipelineServers (see .checker/tests/run_parallel.py).
+if [ -n "${JOBS}" ]; then
+    python3 .checker/tests/run_parallel.py -j ${JOBS} .checker/tests/${ANNOTATORS}
+else
+    python3 -m unittest discover -s .checker/tests/${ANNOTATORS}
+fi
@@ -1,42 +1,38 @@
+from contextlib import contextmanager
 from unittest import TestCase
+import os
+import shutil
 import subprocess
+import tempfile
 import xml.etree.ElementTree as ET
+from xml.etree.ElementTree import Element
 
-from comparison import elements_equal
+from comparison import diff
+import server
 
 
 class BaseTest(TestCase):
     '''
     '''
+    # The tags of the elements whose children are compared regardless of the order
+    # (e.g., `('coreferences',)`; see comparison.diff).
+    unordered = ()
+
     def check_equal(self,
                     exe: str,
                     input_text: str,
                     expected_text: str):
         '''check the expected text and the result text are equal.
         '''
-        # The constants
-        self.input_file_name = 'input_.txt'
-        self.output_file_name = self.input_file_name + '.xml'
-
-        # Write to the input file `input_.txt`
-        with open(self.input_file_name, mode='w', encoding='utf-8') as f:
-            f.write(input_text)
-
-        # Add the command option
-        exe = exe + ' -file ' + self.input_file_name
-
-        # The execution of the command `sbt "exe"`. The output file is generated.
-        subprocess.Popen('sbt "{}"'.format(exe), shell=True).wait()
-
-        # Read the output file
-        result_text = ''
-        with open(self.output_file_name, mode='r', encoding='utf-8') as f:
-            result_text = f.read()
+        if self.check_equal_with_server(exe, input_text, expected_text):
+            return
 
-        # Remove the input file and the output file
-        subprocess.Popen(['rm', self.input_file_name, self.output_file_name]).wait()
+        with self.input_file(input_text) as input_file:
+            # The execution of the command `sbt "exe"`. The output file is generated.
+            subprocess.Popen('sbt "{} -file {}"'.format(exe, input_file), shell=True).wait()
+            result_text = self.read_output(input_file)
 
-        self.assertTrue(elements_equal(ET.fromstring(result_text), ET.fromstring(expected_text)))
+        self.assert_elements_equal(ET.fromstring(result_text), ET.fromstring(expected_text))
 
     def check_equal_with_java(self,
                               exe: str,
@@ -45,29 +41,14 @@ class BaseTest(TestCase):
         '''check the expected text and the result text are equal.
         This function uses java command.
         '''
-        # The constants
-        self.input_file_name = 'input_.txt'
-        self.output_file_name = self.input_file_name + '.xml'
-
-        # Write to the input file `input_.txt`
-        with open(self.input_file_name, mode='w', encoding='utf-8') as f:
-            f.write(input_text)
-
-        # Add the command option
-        exe = exe + ' -file ' + self.input_file_name
-
-        # The execution of the command `sbt "exe"`. The output file is generated.
-        subprocess.Popen('{}'.format(exe), shell=True).wait()
-
-        # Read the output file
-        result_text = ''
-        with open(self.output_file_name, mode='r', encoding='utf-8') as f:
-            result_text = f.read()
+        if self.check_equal_with_server(exe, input_text, expected_text):
+            return
 
-        # Remove the input file and the output file
-        subprocess.Popen(['rm', self.input_file_name, self.output_file_name]).wait()
+        with self.input_file(input_text) as input_file:
+            subprocess.Popen('{} -file {}'.format(exe, input_file), shell=True).wait()
+            result_text = self.read_output(input_file)
 
-        self.assertTrue(elements_equal(ET.fromstring(result_text), ET.fromstring(expected_text)))
+        self.assert_elements_equal(ET.fromstring(result_text), ET.fromstring(expected_text))
 
     def check_equal_with_docker(self,
                                 exe: str,
@@ -75,32 +56,67 @@ class BaseTest(TestCase):
                                 expected_text: str):
         '''
         '''
-        self.input_file_name = 'input_.txt'
-        self.output_file_name = self.input_file_name + '.xml'
+        with self.input_file(input_text) as input_file:
+            # mount directory for the docker container.
+            # plase, set the mount path name '/mnt/'.
+            # The command runs in the directory of the input file, which is "$(pwd)".
+            container_location = "/mnt/"
 
-        # Write to the input file `input_.txt`
-        with open(self.input_file_name, mode='w', encoding='utf-8') as f:
-            f.write(input_text)
+            exe = exe + ' -file ' + container_location + os.path.basename(input_file)
+            subprocess.Popen(exe, shell=True, cwd=os.path.dirname(input_file)).wait()
+            result_text = self.read_output(input_file)
 
-        # mount directory for the docker container.
-        # plase, set the mount path name '/mnt/'.
-        container_location = "/mnt/"
+        self.assert_elements_equal(ET.fromstring(result_text), ET.fromstring(expected_text))
 
-        # Add the command option
-        exe = exe + ' -file ' + container_location + self.input_file_name
-        subprocess.Popen(exe, shell=True).wait()
-
-        # Read the output file
-        result_text = ''
-        with open(self.output_file_name, mode='r', encoding='utf-8') as f:
-            result_text = f.read()
-
-        # Remove the input file and the output file
-        subprocess.Popen(['rm', '-f', self.input_file_name, self.output_file_name]).wait()
+    def check_equal_with_server(self,
+                                exe: str,
+                                input_text: str,
+                                expected_text: str) -> bool:
+        '''check the expected text and the result text by PipelineServer are equal,
+        if the environment variable JIGG_CHECKER_SERVER is set (see server.py).
+        Return False if the test should be run by the command instead.
+        '''
+        if not server.enabled():
+            return False
+        result = server.annotate(exe, input_text)
+        if result is None:
+            return False
+
+        expected = ET.fromstring(expected_text)
+        self.assert_elements_equal(server.align_ids(result, expected), expected)
+        return True
+
+    def assert_elements_equal(self, result: Element, expected: Element):
+        '''fail with the first difference (see comparison.Diff) if the result and the
+        expected are not equivalent.
+        '''
+        d = diff(result, expected, self.unordered)
+        if d is not None:
+            self.fail('{} (result != expected)'.format(d))
+
+    @contextmanager
+    def input_file(self, input_text: str):
+        '''write the input text to a file in a new temporary directory, which is
+        removed with the output file on exit. Each test has its own directory and
+        file name, so tests can run in parallel.
+        '''
+        directory = tempfile.mkdtemp(prefix='jigg-checker-')
+        try:
+            path = os.path.join(directory, self.id().split('.')[-1] + '.txt')
+            with open(path, mode='w', encoding='utf-8') as f:
+                f.write(input_text)
+            yield path
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def read_output(self, input_file: str) -> str:
+        '''read the output file of the pipeline for the input file.
+        '''
+        with open(input_file + '.xml', mode='r', encoding='utf-8') as f:
+            return f.read()
 
-        self.assertTrue(elements_equal(ET.fromstring(result_text), ET.fromstring(expected_text)))
-            
     def check_any(self):
         '''you can add any function.
         '''
         return None
+
@@ -1,40 +1,175 @@
+from collections import Counter
 from xml.etree.ElementTree import Element
 
 
-def elements_equal(e1: Element, e2: Element) -> bool:
-    ''' check equivalence of two xml elements.
+class Diff:
+    '''The first difference of two xml elements.
+
+    `path` addresses the differing element from the roots, by the tags and the ids
+    (or the positions among the siblings of the same tag, if an element has no id),
+    e.g., `root/document[d0]/sentences/sentence[s3]/tokens/token[t12]@pos`. `what` is
+    one of 'tag', 'text', 'tail', 'attribute', 'length' and 'child' (a child of an
+    order-insensitive element not found in the other), and `value1` and `value2` are
+    the values of the two elements.
+    '''
+    def __init__(self, path: str, what: str, value1, value2):
+        self.path = path
+        self.what = what
+        self.value1 = value1
+        self.value2 = value2
+
+    def __str__(self):
+        return '{}: {} differs: {!r} != {!r}'.format(self.path, self.what, self.value1, self.value2)
+
+    def __repr__(self):
+        return 'Diff({!r}, {!r}, {!r}, {!r})'.format(self.path, self.what, self.value1, self.value2)
+
+
+def elements_equal(e1: Element, e2: Element, unordered=()) -> bool:
+    ''' check equivalence of two xml elements. The first difference is printed, if any.
+    See `diff` for `unordered`.
     '''
-    if _compare_tag(e1, e2):
-        pass
-    else:
-        print(e1.tag, e2.tag)
-        return False
-
-    if _compare_text(e1, e2):
-        pass
-    else:
-        print(e1.text, e2.text)
-        return False
-
-    if _compare_tail(e1, e2):
-        pass
-    else:
-        print(e1.tail, e2.tail)
-        return False
-
-    if _compare_attributes(e1, e2):
-        pass
-    else:
-        print(e1.attrib, e2.attrib)
-        return False
-
-    if _compare_length(e1, e2):
-        pass
-    else:
-        print(len(e1), len(e2))
-        return False
-
-    return all(elements_equal(c1, c2) for c1, c2 in zip(e1, e2))
+    d = diff(e1, e2, unordered)
+    if d is not None:
+        print(d)
+    return d is None
+
+
+def diff(e1: Element, e2: Element, unordered=()):
+    '''find the first difference of two xml elements in the document order, or return
+    None if they are equivalent. The children of the elements with a tag in `unordered`
+    (e.g., `('coreferences',)`) are compared regardless of the order, and of their `id`
+    attributes (and those of their descendants), which usually follow the order.
+
+    The trees are traversed with an explicit stack, so a large or deep output does not
+    hit the recursion limit, and the traversal stops at the first difference.
+
+    >>> import xml.etree.ElementTree as ET
+    >>> a = ET.fromstring('<s id="s3"><tokens><token id="t11" pos="DT"/><token id="t12" pos="NN"/></tokens></s>')
+    >>> b = ET.fromstring('<s id="s3"><tokens><token id="t11" pos="DT"/><token id="t12" pos="VB"/></tokens></s>')
+    >>> diff(a, a) is None
+    True
+    >>> print(diff(a, b))
+    s[s3]/tokens/token[t12]@pos: attribute differs: 'NN' != 'VB'
+    >>> print(diff(ET.fromstring('<a><b/><b>x</b></a>'), ET.fromstring('<a><b/><b>y</b></a>')))
+    a/b[2]: text differs: 'x' != 'y'
+    >>> c1 = ET.fromstring('<r><cs><c m="1"/><c m="2"/></cs></r>')
+    >>> c2 = ET.fromstring('<r><cs><c m="2"/><c m="1"/></cs></r>')
+    >>> print(diff(c1, c2))
+    r/cs/c[1]@m: attribute differs: '1' != '2'
+    >>> diff(c1, c2, unordered=('cs',)) is None
+    True
+    >>> c3 = ET.fromstring('<r><cs><c id="c0" m="2"/><c id="c1" m="1"/></cs></r>')
+    >>> c4 = ET.fromstring('<r><cs><c id="c0" m="1"/><c id="c1" m="2"/></cs></r>')
+    >>> diff(c3, c4, unordered=('cs',)) is None
+    True
+    >>> print(diff(c1, ET.fromstring('<r><cs><c m="2"/><c m="3"/></cs></r>'), unordered=('cs',)))
+    r/cs/c[1]: child differs: '<c m="1" />' != '<c m="3" />'
+    '''
+    # The path of an element is built only on a difference, from `trail`: the parent's
+    # trail, the parent and the index of the element.
+    stack = [(e1, e2, None)]
+    while stack:
+        e1, e2, trail = stack.pop()
+        if not _element_equal(e1, e2):
+            return _diff_element(e1, e2, _path(e1, trail))
+        if e1.tag in unordered:
+            d = _diff_unordered(e1, e2, trail, unordered)
+            if d is not None:
+                return d
+            continue
+        # Pushed in the reverse order, to visit the children in the document order.
+        for i in range(len(e1) - 1, -1, -1):
+            stack.append((e1[i], e2[i], (trail, e1, i)))
+    return None
+
+
+def _element_equal(e1: Element, e2: Element) -> bool:
+    # The element itself, not the children; the same as the _compare_* below.
+    return e1.tag == e2.tag and e1.attrib == e2.attrib and len(e1) == len(e2) and \
+        (e1.text == e2.text or _strip(e1.text) == _strip(e2.text)) and \
+        (e1.tail == e2.tail or _strip(e1.tail) == _strip(e2.tail))
+
+
+def _diff_element(e1: Element, e2: Element, path: str):
+    if not _compare_tag(e1, e2):
+        return Diff(path, 'tag', e1.tag, e2.tag)
+    if not _compare_text(e1, e2):
+        return Diff(path, 'text', _strip(e1.text), _strip(e2.text))
+    if not _compare_tail(e1, e2):
+        return Diff(path, 'tail', _strip(e1.tail), _strip(e2.tail))
+    if not _compare_attributes(e1, e2):
+        key = min(k for k in e1.attrib.keys() | e2.attrib.keys() if e1.get(k) != e2.get(k))
+        return Diff(path + '@' + key, 'attribute', e1.get(key), e2.get(key))
+    return Diff(path, 'length', len(e1), len(e2))
+
+
+def _diff_unordered(e1: Element, e2: Element, trail, unordered):
+    # The children as multisets of their canonical forms.
+    keys1 = [_canonical(c, unordered) for c in e1]
+    keys2 = [_canonical(c, unordered) for c in e2]
+    missing1 = Counter(keys1) - Counter(keys2)
+    if not missing1:
+        return None
+    missing2 = Counter(keys2) - Counter(keys1)
+    i = next(i for i, k in enumerate(keys1) if missing1[k] > 0)
+    other = next((c for c, k in zip(e2, keys2) if missing2[k] > 0), None)
+    return Diff(_path(e1[i], (trail, e1, i)), 'child', _tostring(e1[i]),
+                None if other is None else _tostring(other))
+
+
+def _canonical(e: Element, unordered) -> tuple:
+    '''a hashable form of an element, which is equal for equivalent elements, ignoring
+    the `id` attributes.
+    '''
+    # Post-order with an explicit stack; `done` holds the forms of the finished children.
+    stack = [(e, False)]
+    done = []
+    while stack:
+        node, visited = stack.pop()
+        if not visited:
+            stack.append((node, True))
+            stack.extend((c, False) for c in reversed(node))
+            continue
+        children = done[len(done) - len(node):] if len(node) else []
+        del done[len(done) - len(children):]
+        if node.tag in unordered:
+            children.sort()
+        done.append((node.tag, _strip(node.text), _strip(node.tail),
+                     tuple(sorted(kv for kv in node.attrib.items() if kv[0] != 'id')),
+                     tuple(children)))
+    return done[0]
+
+
+def _path(e: Element, trail) -> str:
+    steps = []
+    while trail is not None:
+        trail, parent, i = trail
+        steps.append(_step(e, parent, i))
+        e = parent
+    steps.append(_step(e, None, 0))
+    return '/'.join(reversed(steps))
+
+
+def _step(e: Element, parent, i: int) -> str:
+    '''`tag[id]`, or `tag[n]` (from 1) among the siblings of the same tag if there
+    are several and the element (the i-th child of the parent) has no id.
+    '''
+    if 'id' in e.attrib:
+        return '{}[{}]'.format(e.tag, e.get('id'))
+    if parent is not None and sum(c.tag == e.tag for c in parent) > 1:
+        return '{}[{}]'.format(e.tag, sum(c.tag == e.tag for c in parent[:i + 1]))
+    return e.tag
+
+
+def _strip(text):
+    return text if text is None else text.strip()
+
+
+def _tostring(e: Element) -> str:
+    attributes = ''.join(' {}="{}"'.format(k, v) for k, v in e.attrib.items())
+    return '<{}{} />'.format(e.tag, attributes) if len(e) == 0 and not _strip(e.text) else \
+        '<{}{}>...</{}>'.format(e.tag, attributes, e.tag)
 
 
 def _compare_tag(e1: Element, e2: Element) -> bool:
@@ -5,6 +5,7 @@ from basetest import BaseTest
 
 
 class TestBerkeleyParserAndDcoref(BaseTest):
+    unordered = ('coreferences',)
     '''
     '''
     def setUp(self):
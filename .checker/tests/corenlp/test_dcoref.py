@@ -5,6 +5,7 @@ from basetest import BaseTest
 
 
 class TestDcoref(BaseTest):
+    unordered = ('coreferences',)
 
     def setUp(self):
         self.input_text = 'Joe Smith was born in California. In 2017, he went to Paris, France in the summer. His flight left at 3:00pm on July 10th, 2017. After eating some escargot for the first time, Joe said, "That was delicious!"'
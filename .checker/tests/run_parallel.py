@@ -0,0 +1,93 @@
+'''Run the tests under the directories in parallel.
+
+    python3 .checker/tests/run_parallel.py -j 4 .checker/tests/corenlp .checker/tests/mecab
+
+Each test case runs in a worker process of a pool, with its own temporary directory
+(see BaseTest.input_file). The tests are run through PipelineServer (see server.py),
+and the servers are shared by the workers: a server for each annotator configuration
+is started by the first test using it, and all servers are stopped at the end. Tests
+in docker run their own containers.
+'''
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append(".checker/tests")
+
+import server  # noqa: E402
+
+# The tests, which the forked workers refer to by the index.
+_tests = []
+
+
+def collect(directories: list) -> list:
+    '''discover the test cases under the directories.
+    '''
+    def flatten(suite):
+        for test in suite:
+            if isinstance(test, unittest.TestSuite):
+                yield from flatten(test)
+            else:
+                yield test
+    # A new loader for each directory, since a loader keeps the top level directory.
+    return [t for d in directories for t in flatten(unittest.TestLoader().discover(d))]
+
+
+def run_test(i: int):
+    test = _tests[i]
+    result = unittest.TestResult()
+    start = time.time()
+    test.run(result)
+    problems = [('ERROR', tb) for _, tb in result.errors] + \
+               [('FAIL', tb) for _, tb in result.failures]
+    if problems:
+        status = problems[0][0]
+    elif result.skipped:
+        status = 'skipped'
+    else:
+        status = 'ok'
+    return test.id(), status, [tb for _, tb in problems], time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directories', nargs='+', help='directories of the tests')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='number of tests run at once (default: number of processors)')
+    parser.add_argument('--pool-size', type=int, default=1,
+                        help='number of pipelines of a server annotating in parallel')
+    args = parser.parse_args()
+
+    shared = tempfile.mkdtemp(prefix='jigg-servers-')
+    os.environ[server.SERVER_ENV] = '1'
+    os.environ[server.SHARED_DIR_ENV] = shared
+    os.environ[server.POOL_SIZE_ENV] = str(args.pool_size)
+
+    _tests.extend(collect(args.directories))
+    failures = 0
+    start = time.time()
+    try:
+        with multiprocessing.get_context('fork').Pool(args.jobs) as pool:
+            for test_id, status, tracebacks, seconds in \
+                    pool.imap_unordered(run_test, range(len(_tests))):
+                print('{} ... {} ({:.1f}s)'.format(test_id, status, seconds), flush=True)
+                for tb in tracebacks:
+                    print(tb, flush=True)
+                if tracebacks:
+                    failures += 1
+    finally:
+        server.stop_shared(shared)
+        shutil.rmtree(shared, ignore_errors=True)
+
+    print('Ran {} tests in {:.1f}s: {} failed'.format(len(_tests), time.time() - start, failures))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import atexit
+import fcntl
+import hashlib
+import os
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import time
+from xml.etree.ElementTree import Element
+
+sys.path.append("python")
+
+# Set this environment variable (e.g., `JIGG_CHECKER_SERVER=1`) to run the tests
+# through PipelineServer.
+SERVER_ENV = "JIGG_CHECKER_SERVER"
+# Set this to a directory to share the servers among processes (e.g., the workers of
+# run_parallel.py). The servers are then stopped by `stop_shared`, not at exit.
+SHARED_DIR_ENV = "JIGG_CHECKER_SERVER_DIR"
+# The number of pipelines of a server annotating in parallel (`-poolSize`).
+POOL_SIZE_ENV = "JIGG_CHECKER_POOL_SIZE"
+
+PIPELINE_RE = re.compile(r'^(.*?)\s*\bjigg\.pipeline\.Pipeline\b(.*)$')
+SERVER_CLASS = "jigg.pipeline.PipelineServer"
+
+# Seconds to wait for a server to start (which may include the compilation by sbt),
+# and for a response (which may include loading the models).
+STARTUP_TIMEOUT = 1800
+REQUEST_TIMEOUT = 1800
+
+_servers = {}
+
+
+def enabled() -> bool:
+    '''check whether the tests run through PipelineServer.
+    '''
+    return os.environ.get(SERVER_ENV, "") not in ("", "0")
+
+
+def split_command(exe: str):
+    '''split a command of a test into the launcher of the JVM and the properties
+    of the pipeline. Return None if the command does not run jigg.pipeline.Pipeline
+    on this machine (e.g., in docker).
+
+    >>> split_command('runMain jigg.pipeline.Pipeline -annotators ssplit,mecab')
+    ('runMain', {'annotators': 'ssplit,mecab'})
+    >>> split_command('java -cp "jar/*" -Xmx6g jigg.pipeline.Pipeline -annotators corenlp[tokenize] ')
+    ('java -cp "jar/*" -Xmx6g', {'annotators': 'corenlp[tokenize]'})
+    >>> split_command('runMain jigg.pipeline.Pipeline -annotators udpipe[parse] -udpipe.model m -x')
+    ('runMain', {'annotators': 'udpipe[parse]', 'udpipe.model': 'm', 'x': 'true'})
+    >>> split_command('docker run --rm jigg/jigg:knp java jigg.pipeline.Pipeline -annotators knp') is None
+    True
+    '''
+    m = PIPELINE_RE.match(exe.strip())
+    if m is None or m.group(1).startswith("docker"):
+        return None
+    launcher, args = m.group(1), shlex.split(m.group(2))
+
+    # The same as jigg.util.ArgumentsParser: `-key value` or `-key` (true).
+    properties = {}
+    i = 0
+    while i < len(args):
+        key = args[i].lstrip("-")
+        if i + 1 < len(args) and not args[i + 1].startswith("-"):
+            properties[key] = args[i + 1]
+            i += 2
+        else:
+            properties[key] = "true"
+            i += 1
+    return launcher, properties
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    '''A client of PipelineServer on the port. Use `launch` to start a server.
+    '''
+    def __init__(self, port: int, process: subprocess.Popen = None):
+        from pyjigg import Pipeline
+
+        self.port = port
+        self.process = process
+        self.pipeline = Pipeline("http://localhost:{}".format(port))
+
+    @classmethod
+    def launch(cls, launcher: str):
+        '''start PipelineServer by the same way as a test command: `runMain` (by sbt)
+        or a java command.
+        '''
+        port = _free_port()
+        options = "-port {} -poolSize {}".format(port, os.environ.get(POOL_SIZE_ENV, "1"))
+        if launcher == "runMain":
+            command = 'sbt "runMain {} {}"'.format(SERVER_CLASS, options)
+        else:
+            command = "{} {} {}".format(launcher, SERVER_CLASS, options)
+        # In a new session, so that the JVM forked by sbt is also stopped.
+        process = subprocess.Popen(command, shell=True, start_new_session=True)
+        server = cls(port, process)
+        server._wait(command)
+        return server
+
+    def _wait(self, command: str):
+        deadline = time.time() + STARTUP_TIMEOUT
+        while True:
+            try:
+                self.pipeline.check_server(force=True)
+                return
+            except Exception:
+                if self.process.poll() is not None:
+                    raise RuntimeError("The server exited: {}".format(command))
+                if time.time() > deadline:
+                    self.stop()
+                    raise RuntimeError("The server did not start: {}".format(command))
+                time.sleep(1)
+
+    def annotate(self, text: str, properties: dict) -> Element:
+        properties = dict(properties, timeout=str(REQUEST_TIMEOUT))
+        return self.pipeline.annotate(text, properties)
+
+    def stop(self):
+        '''stop the server if this process started it.
+        '''
+        if self.process is not None and self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            self.process.wait()
+        self.pipeline.close()
+
+
+def _shared_server(launcher: str, key: tuple, directory: str) -> Server:
+    # The first process locking the file of the configuration starts the server, and
+    # the others wait for it and connect to the port written in the file.
+    name = os.path.join(directory, hashlib.sha1(repr(key).encode()).hexdigest())
+    with open(name + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(name + ".server"):
+            with open(name + ".server") as f:
+                port, _ = f.read().split()
+            return Server(int(port))
+        server = Server.launch(launcher)
+        with open(name + ".server", "w") as f:
+            f.write("{} {}".format(server.port, server.process.pid))
+        # Not stopped by this process; see stop_shared.
+        server.process = None
+        return server
+
+
+def stop_shared(directory: str):
+    '''stop the servers shared through the directory, and wait for them to exit.
+    '''
+    pids = []
+    for name in os.listdir(directory):
+        if name.endswith(".server"):
+            with open(os.path.join(directory, name)) as f:
+                pids.append(int(f.read().split()[1]))
+    for pid in pids:
+        try:
+            os.killpg(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.time() + 60
+    while pids and time.time() < deadline:
+        try:
+            os.killpg(pids[-1], 0)
+            time.sleep(0.5)
+        except ProcessLookupError:
+            pids.pop()
+
+
+def annotate(exe: str, input_text: str):
+    '''annotate the input text by a server for the command of a test. Return None if
+    the command cannot run on a server (see `split_command`).
+
+    A server is started for each annotator configuration (the launcher and the
+    properties) when it is first used, and is kept until the process exits (or
+    shared with the other processes; see SHARED_DIR_ENV).
+    '''
+    command = split_command(exe)
+    if command is None:
+        return None
+    launcher, properties = command
+    key = (launcher, tuple(sorted(properties.items())))
+    if key not in _servers:
+        directory = os.environ.get(SHARED_DIR_ENV)
+        if directory:
+            _servers[key] = _shared_server(launcher, key, directory)
+        else:
+            _servers[key] = Server.launch(launcher)
+    return _servers[key].annotate(input_text, properties)
+
+
+@atexit.register
+def stop_all():
+    for server in _servers.values():
+        server.stop()
+    _servers.clear()
+
+
+def align_ids(result: Element, expected: Element) -> Element:
+    '''rename the ids in the result to those at the same positions in the expected.
+
+    A server does not reset the id generators between requests, so its ids may
+    differ from those of a new process (e.g., `t7` instead of `t0`). Each `id`
+    attribute is renamed to the `id` at the same position in the document order of
+    the expected, and so are the references to it (e.g., `head` and `children`).
+    If the numbers of ids differ, the result is returned as is.
+
+    >>> import xml.etree.ElementTree as ET
+    >>> r = ET.fromstring('<a><t id="t7" form="t1"/><t id="t8"/><s id="sp3" children="t7 t8"/></a>')
+    >>> e = ET.fromstring('<a><t id="t0" form="t1"/><t id="t1"/><s id="sp0" children="t0 t1"/></a>')
+    >>> ET.tostring(align_ids(r, e)) == ET.tostring(e)
+    True
+    '''
+    ids = [e.get("id") for e in result.iter() if "id" in e.attrib]
+    expected_ids = [e.get("id") for e in expected.iter() if "id" in e.attrib]
+    if len(ids) != len(expected_ids):
+        return result
+    mapping = dict(zip(ids, expected_ids))
+    for e in result.iter():
+        for key, value in e.attrib.items():
+            refs = value.split(" ")
+            if key == "id" or all(r in mapping for r in refs):
+                e.set(key, " ".join(mapping.get(r, r) for r in refs))
+    return result
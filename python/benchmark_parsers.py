@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+'''Benchmark of the parsers of pyjigg on a large response.
+
+This does not need a server; a response of the PipelineServer with `-n` sentences
+(default: 10000), each with tokens and dependencies, is synthesized. For each parser,
+this reports the best time of `-r` runs and the peak memory (max RSS of a child process
+minus that of a child which only holds the response).
+
+ $ python benchmark_parsers.py -n 10000
+'''
+
+import argparse
+import io
+import multiprocessing
+import resource
+import time
+
+from pyjigg.parsing import iter_sentences, lxml_etree, parse_xml
+
+
+def make_response(n_sentences, n_tokens=20):
+    out = ['<?xml version="1.0" encoding="UTF-8"?>\n<root><document id="d0"><sentences>']
+    for i in range(n_sentences):
+        words = ['word%d' % j for j in range(n_tokens)]
+        out.append('<sentence id="s%d" characterOffsetBegin="0" characterOffsetEnd="0">%s'
+                   % (i, ' '.join(words)))
+        out.append('<tokens annotators="corenlp">')
+        for j, w in enumerate(words):
+            out.append('<token id="s%d_%d" form="%s" lemma="%s" pos="NN" '
+                       'characterOffsetBegin="%d" characterOffsetEnd="%d"/>'
+                       % (i, j, w, w, j * 7, j * 7 + 6))
+        out.append('</tokens><dependencies type="basic" annotators="corenlp">')
+        for j in range(1, n_tokens):
+            out.append('<dependency id="s%d_dep%d" head="s%d_%d" dependent="s%d_%d" deprel="dep"/>'
+                       % (i, j, i, j - 1, i, j))
+        out.append('</dependencies></sentence>')
+    out.append('</sentences></document></root>')
+    return ''.join(out).encode('utf-8')
+
+
+def count_tokens(sentence):
+    return len(sentence.find('tokens'))
+
+
+def run_etree(data):
+    root = parse_xml(data, 'etree')
+    return sum(count_tokens(s) for s in root.iter('sentence'))
+
+
+def run_lxml(data):
+    root = parse_xml(data, 'lxml')
+    return sum(count_tokens(s) for s in root.iter('sentence'))
+
+
+def run_etree_iter(data):
+    return sum(count_tokens(s) for s in iter_sentences(io.BytesIO(data), 'etree'))
+
+
+def run_lxml_iter(data):
+    return sum(count_tokens(s) for s in iter_sentences(io.BytesIO(data), 'lxml'))
+
+
+def run_raw(data):
+    return len(data)
+
+
+def run_nothing(data):
+    return 0
+
+
+def _max_rss_of(target, data):
+    def child(conn):
+        target(data)
+        conn.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    # fork, so that the child shares `data` without pickling.
+    ctx = multiprocessing.get_context('fork')
+    parent_conn, child_conn = ctx.Pipe()
+    p = ctx.Process(target=child, args=(child_conn,))
+    p.start()
+    rss = parent_conn.recv()
+    p.join()
+    return rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=10000, help='number of sentences')
+    parser.add_argument('-r', type=int, default=3, help='number of runs')
+    args = parser.parse_args()
+
+    data = make_response(args.n)
+    print('response: %d sentences, %.1f MB' % (args.n, len(data) / 1e6))
+
+    runs = [('etree', run_etree), ('etree iter_sentences', run_etree_iter)]
+    if lxml_etree is not None:
+        runs += [('lxml', run_lxml), ('lxml iter_sentences', run_lxml_iter)]
+    else:
+        print('lxml is not installed; skipped.')
+    runs.append(('raw', run_raw))
+
+    base_rss = _max_rss_of(run_nothing, data)
+    print('%-22s %10s %14s' % ('parser', 'time (s)', 'peak mem (MB)'))
+    for name, run in runs:
+        best = float('inf')
+        for _ in range(args.r):
+            start = time.perf_counter()
+            run(data)
+            best = min(best, time.perf_counter() - start)
+        # ru_maxrss is in kilobytes on Linux.
+        mem = (_max_rss_of(run, data) - base_rss) / 1024.0
+        print('%-22s %10.3f %14.1f' % (name, best, mem))
+
+
+if __name__ == '__main__':
+    main()
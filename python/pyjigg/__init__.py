@@ -1 +1,3 @@
 from pyjigg.pipeline import Pipeline
+from pyjigg.async_pipeline import AsyncPipeline
+from pyjigg.parsing import JiggError, ServerError, ResponseParseError
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import asyncio
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from pyjigg.parsing import ServerError, check_parser
+from pyjigg.pipeline import decode_output, server_error, split_documents
+
+class AsyncPipeline:
+    '''An asyncio client of Jigg's PipelineServer.
+
+    This requires `aiohttp` (pip install aiohttp). The results are the same as those
+    of `Pipeline.annotate`, i.e., an XML element or a JSON object.
+
+    At most `concurrency` requests are in flight at the same time, and they are
+    multiplexed over a pool of at most `pool_size` connections (default: the same as
+    `concurrency`). The liveness of the server, `parser`, and the errors are the same
+    as in `Pipeline`. A request taking longer than `timeout` seconds (default: the
+    default of aiohttp) raises `asyncio.TimeoutError`.
+
+        async with AsyncPipeline('http://localhost:8080', concurrency=16) as pipeline:
+            annotations = await pipeline.annotate_many(texts, properties)
+    '''
+
+    def __init__(self, server_url, concurrency=10, pool_size=None,
+                 health_check_interval=None, parser='etree', timeout=None):
+        if aiohttp is None:
+            raise ImportError('AsyncPipeline requires aiohttp; install it by `pip install aiohttp`.')
+        if server_url[-1] == '/':
+            server_url = server_url[:-1]
+        check_parser(parser)
+        self.parser = parser
+        self.server_url = server_url
+        self.concurrency = concurrency
+        self.pool_size = pool_size or concurrency
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+
+        # These are created in the running event loop at the first call.
+        self._session = None
+        self._semaphore = None
+        self._check_lock = None
+        self._last_checked = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        '''Releases the pooled connections.'''
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _ensure_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            if self.timeout is None:
+                self._session = aiohttp.ClientSession(connector=connector)
+            else:
+                self._session = aiohttp.ClientSession(
+                    connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._check_lock = asyncio.Lock()
+        return self._session
+
+    async def check_server(self, force=False):
+        '''Checks that the Jigg Pipeline server is started.'''
+        session = self._ensure_session()
+        async with self._check_lock:
+            now = time.time()
+            if not force and self._last_checked is not None:
+                interval = self.health_check_interval
+                if interval is None or now - self._last_checked < interval:
+                    return
+            try:
+                async with session.get(self.server_url) as r:
+                    await r.read()
+            except aiohttp.ClientConnectionError:
+                self._last_checked = None
+                raise server_error()
+            self._last_checked = now
+
+    async def annotate(self, text, properties=None):
+        assert isinstance(text, str)
+        if properties is None:
+            properties = {}
+        else:
+            assert isinstance(properties, dict)
+
+        await self.check_server()
+
+        data = properties.copy()
+        data['q'] = text
+        return decode_output(await self._post('/annotate', data), properties, self.parser)
+
+    async def annotate_batch(self, texts, properties=None):
+        '''Annotates many texts in one request; see `Pipeline.annotate_batch`.'''
+        assert all(isinstance(text, str) for text in texts)
+        if properties is None:
+            properties = {}
+        else:
+            assert isinstance(properties, dict)
+
+        await self.check_server()
+
+        data = list(properties.items()) + [('q', text) for text in texts]
+        output = await self._post('/annotate_batch', data)
+        return split_documents(decode_output(output, properties, self.parser))
+
+    async def annotate_many(self, texts, properties=None):
+        '''Annotates all `texts` concurrently and returns the results in the same order.'''
+        return await asyncio.gather(
+            *[self.annotate(text, properties) for text in texts])
+
+    async def _post(self, path, data):
+        async with self._semaphore:
+            try:
+                async with self._session.post(self.server_url + path, data=data) as r:
+                    body = await r.read()
+                    if r.status >= 400:
+                        raise ServerError(r.status, body.decode('utf-8', 'replace'))
+                    return body
+            except aiohttp.ClientConnectionError:
+                self._last_checked = None
+                raise server_error()
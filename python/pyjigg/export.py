@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+'''Columnar export of the token-level annotations of Jigg.
+
+A token table has one row per token and the columns:
+
+- `document`, `sentence`, `token`: indices of the document (in the order added), of
+  the sentence in the document, and of the token in the sentence.
+- `begin`, `end`: character offsets (`-1` if not annotated).
+- `head`: the token index of the head in the dependencies (`-1` for the root or if not
+  annotated).
+- `form`, `lemma`, `pos`, `deprel`: strings, dictionary-encoded into int32 codes (`-1`
+  for missing values). The codes are consistent within a table or a writer.
+
+This requires NumPy; Arrow tables and Parquet files require pyarrow (pip install pyarrow).
+
+    >>> with ColumnarWriter('tokens.parquet') as writer:
+    ...     for text in texts:
+    ...         writer.write(pipeline.annotate(text, properties))
+'''
+
+import json
+import os
+from array import array
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from pyjigg.model import Document, load_documents
+
+INT_COLUMNS = ('document', 'sentence', 'token', 'begin', 'end', 'head')
+STRING_COLUMNS = ('form', 'lemma', 'pos', 'deprel')
+COLUMNS = INT_COLUMNS + STRING_COLUMNS
+
+
+class Dictionary(object):
+    '''Assigns int32 codes to strings in the order of appearance.'''
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {v: i for i, v in enumerate(self.values)}
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value):
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def decode(self, codes):
+        '''Returns an object array of the strings (`None` for `-1`).'''
+        values = np.array(self.values + [None], dtype=object)
+        return values[np.asarray(codes)]
+
+
+class TokenTable(object):
+    '''Accumulates the tokens of annotated documents as columns.
+
+    `dependencies` is the type of dependencies (e.g., `basic`) used for `head` and
+    `deprel`; if the sentence does not have it, the first token-level dependencies
+    are used.
+    '''
+
+    def __init__(self, dependencies='basic', dictionaries=None):
+        self.dependencies = dependencies
+        self.dictionaries = dictionaries or {c: Dictionary() for c in STRING_COLUMNS}
+        self.num_documents = 0
+        self._columns = {c: array('i') for c in COLUMNS}
+
+    def __len__(self):
+        return len(self._columns['token'])
+
+    def add(self, output):
+        '''Adds the documents of `output`: an XML element or a JSON object (see
+        `pyjigg.model.load_documents`), a `Document`, or a list of them (e.g., returned by
+        `Pipeline.annotate_batch`).'''
+        outputs = output if isinstance(output, list) else [output]
+        documents = [d for o in outputs
+                     for d in ([o] if isinstance(o, Document) else load_documents(o))]
+
+        c = self._columns
+        encode = {k: self.dictionaries[k].encode for k in STRING_COLUMNS}
+        for document in documents:
+            d = self.num_documents
+            self.num_documents += 1
+            for sentence in document.sentences:
+                n = len(sentence.tokens)
+                heads = [-1] * n
+                deprels = [-1] * n
+                deps = self._dependencies(sentence)
+                if deps is not None:
+                    for head, dep, rel in zip(deps.heads, deps.dependents, deps.deprels):
+                        heads[dep] = head
+                        deprels[dep] = encode['deprel'](rel)
+                for t in sentence.tokens:
+                    c['document'].append(d)
+                    c['sentence'].append(sentence.index)
+                    c['token'].append(t.index)
+                    c['begin'].append(-1 if t.begin is None else t.begin)
+                    c['end'].append(-1 if t.end is None else t.end)
+                    c['form'].append(encode['form'](t.form))
+                    c['lemma'].append(encode['lemma'](t.lemma))
+                    c['pos'].append(encode['pos'](t.pos))
+                c['head'].extend(heads)
+                c['deprel'].extend(deprels)
+
+    def _dependencies(self, sentence):
+        deps = sentence.dependencies.get(self.dependencies)
+        if deps is None:
+            token_level = [d for d in sentence.dependencies.values() if d.unit is None]
+            deps = token_level[0] if token_level else None
+        return deps
+
+    def columns(self):
+        '''Returns the columns as a dict of int32 NumPy arrays (codes for strings).'''
+        return {k: np.frombuffer(v, dtype=np.int32).copy() if len(v) else
+                np.zeros(0, dtype=np.int32) for k, v in self._columns.items()}
+
+    def to_arrow(self):
+        '''Returns a `pyarrow.Table`, in which the string columns are dictionary arrays.'''
+        _require_arrow()
+        columns = self.columns()
+        arrays = []
+        for k in COLUMNS:
+            if k in STRING_COLUMNS:
+                codes = pa.array(columns[k], mask=columns[k] < 0)
+                values = pa.array(self.dictionaries[k].values, type=pa.string())
+                arrays.append(pa.DictionaryArray.from_arrays(codes, values))
+            else:
+                arrays.append(pa.array(columns[k]))
+        return pa.Table.from_arrays(arrays, names=list(COLUMNS))
+
+    def clear(self):
+        '''Removes the rows but keeps the dictionaries, so codes stay consistent.'''
+        self._columns = {c: array('i') for c in COLUMNS}
+
+
+class ColumnarWriter(object):
+    '''Writes token tables to `path` in batches of about `batch_size` tokens.
+
+    With `format='parquet'` (the default if pyarrow is installed), `path` is a Parquet
+    file with one row group per batch. With `format='npz'`, `path` is a directory of
+    `part-NNNNN.npz` files, one per batch, and `dictionaries.json`; see `load_npz`.
+    '''
+
+    def __init__(self, path, format=None, batch_size=1000000, dependencies='basic'):
+        if format is None:
+            format = 'parquet' if pa is not None else 'npz'
+        if format == 'parquet':
+            _require_arrow()
+        elif format == 'npz':
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        else:
+            raise ValueError('Unknown format: %s. Choose from parquet, npz.' % format)
+        self.path = path
+        self.format = format
+        self.batch_size = batch_size
+        self.table = TokenTable(dependencies)
+        self._parquet_writer = None
+        self._num_parts = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, output):
+        '''Adds `output` (see `TokenTable.add`) and writes a batch if it is full.'''
+        self.table.add(output)
+        if len(self.table) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.table) == 0:
+            return
+        if self.format == 'parquet':
+            table = self.table.to_arrow()
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            part = os.path.join(self.path, 'part-%05d.npz' % self._num_parts)
+            np.savez(part, **self.table.columns())
+        self._num_parts += 1
+        self.table.clear()
+
+    def close(self):
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self.format == 'npz':
+            dictionaries = {k: d.values for k, d in self.table.dictionaries.items()}
+            with open(os.path.join(self.path, 'dictionaries.json'), 'w') as f:
+                json.dump(dictionaries, f, ensure_ascii=False)
+
+
+def export(outputs, path, **kwargs):
+    '''Writes a stream of outputs (see `TokenTable.add`) with `ColumnarWriter`.'''
+    with ColumnarWriter(path, **kwargs) as writer:
+        for output in outputs:
+            writer.write(output)
+
+
+def load_npz(path):
+    '''Loads a directory written with `format='npz'`. Returns the concatenated columns
+    and the `Dictionary` of each string column.'''
+    with open(os.path.join(path, 'dictionaries.json')) as f:
+        dictionaries = {k: Dictionary(v) for k, v in json.load(f).items()}
+    parts = sorted(p for p in os.listdir(path) if p.endswith('.npz'))
+    loaded = [np.load(os.path.join(path, p)) for p in parts]
+    columns = {k: np.concatenate([l[k] for l in loaded]) if loaded else
+               np.zeros(0, dtype=np.int32) for k in COLUMNS}
+    return columns, dictionaries
+
+
+def _require_arrow():
+    if pa is None:
+        raise ImportError('Arrow/Parquet output requires pyarrow; install it by '
+                          '`pip install pyarrow`.')
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+'''Helpers to read the metrics of Jigg's PipelineServer (`/metrics`).'''
+
+import re
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text):
+    '''Parses metrics in the Prometheus text format.
+
+    Returns a dict from `(name, labels)` to the value, where `labels` is a tuple of
+    sorted `(key, value)` pairs.
+
+    >>> parse_metrics('# TYPE a counter\\na{annotator="ssplit"} 3\\nb 1.5\\n')
+    {('a', (('annotator', 'ssplit'),)): 3.0, ('b', ()): 1.5}
+    '''
+    samples = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        m = _SAMPLE.match(line)
+        if m is None:
+            continue
+        name, labels, value = m.groups()
+        labels = tuple(sorted(
+            (k, v.replace('\\n', '\n').replace('\\"', '"').replace('\\\\', '\\'))
+            for k, v in _LABEL.findall(labels or '')))
+        samples[(name, labels)] = float(value)
+    return samples
+
+
+def annotator_profile(samples):
+    '''Summarizes parsed metrics into a profile of each annotator.
+
+    Returns a list of dicts, sorted by the total time in descending order, with keys:
+    `annotator`, `calls`, `seconds` (total wall time), `share` (of the time of all
+    annotators), `sentences`, `ms_per_sentence`, `process_calls`, and
+    `process_seconds` (round trip time of the external process, if any).
+    '''
+    profile = {}
+
+    def entry(labels):
+        name = dict(labels).get('annotator')
+        if name not in profile:
+            profile[name] = {'annotator': name, 'calls': 0, 'seconds': 0.0,
+                             'sentences': 0, 'process_calls': 0, 'process_seconds': 0.0}
+        return profile[name]
+
+    keys = {'jigg_annotator_seconds_count': 'calls',
+            'jigg_annotator_seconds_sum': 'seconds',
+            'jigg_annotator_sentences_total': 'sentences',
+            'jigg_process_roundtrip_seconds_count': 'process_calls',
+            'jigg_process_roundtrip_seconds_sum': 'process_seconds'}
+    for (name, labels), value in samples.items():
+        if name in keys:
+            entry(labels)[keys[name]] += value
+
+    total = sum(p['seconds'] for p in profile.values())
+    for p in profile.values():
+        p['calls'] = int(p['calls'])
+        p['sentences'] = int(p['sentences'])
+        p['process_calls'] = int(p['process_calls'])
+        p['share'] = p['seconds'] / total if total > 0 else 0.0
+        p['ms_per_sentence'] = 1000 * p['seconds'] / p['sentences'] if p['sentences'] else None
+
+    return sorted(profile.values(), key=lambda p: -p['seconds'])
+
+
+def format_profile(profile):
+    '''Formats the result of `annotator_profile` as a table.'''
+    lines = ['%-20s %8s %10s %7s %10s %8s %10s' % (
+        'annotator', 'calls', 'seconds', 'share', 'sentences', 'ms/sent', 'process(s)')]
+    for p in profile:
+        ms = '%.3f' % p['ms_per_sentence'] if p['ms_per_sentence'] is not None else '-'
+        lines.append('%-20s %8d %10.3f %6.1f%% %10d %8s %10.3f' % (
+            p['annotator'], p['calls'], p['seconds'], 100 * p['share'], p['sentences'],
+            ms, p['process_seconds']))
+    return '\n'.join(lines)
@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+
+'''A compact document model of the annotations of Jigg.
+
+The XML and JSON outputs of Jigg refer to other elements by string ids such as `t3`
+or `s1_berksp0`. Here all such references are resolved to integer indices when a
+document is loaded, and every object uses `__slots__`:
+
+- `Token.index` is the position in `Sentence.tokens`.
+- `Dependencies` holds `heads`/`dependents` as arrays of indices into the tokens (or
+  into the chunks or basic phrases if `unit` is not `None`); the root is `-1`.
+- `Tree` (constituency `parse` and `ccgs`) is array-backed; see its docstring.
+- `Span` (named entities, chunks, basic phrases) holds token indices.
+- `Mention` holds a sentence index and token indices; `Coreference` holds indices into
+  `Document.mentions`. A coreference of basic phrases (documentKNP) adds a mention for
+  each of its basic phrases.
+
+    >>> documents = load_documents(pipeline.annotate(text, properties))
+    >>> for sentence in documents[0].sentences:
+    ...     deps = sentence.dependencies.get('basic')
+'''
+
+from array import array
+
+
+class Token(object):
+    '''`begin` and `end` are character offsets (or `None`). Other attributes of the
+    token (e.g., `ne`, `pos1` of MeCab) are in `attrs`.'''
+    __slots__ = ('index', 'id', 'form', 'lemma', 'pos', 'begin', 'end', 'attrs')
+
+    def __init__(self, index, id, form, lemma=None, pos=None, begin=None, end=None,
+                 attrs=None):
+        self.index = index
+        self.id = id
+        self.form = form
+        self.lemma = lemma
+        self.pos = pos
+        self.begin = begin
+        self.end = end
+        self.attrs = attrs
+
+    def __repr__(self):
+        return 'Token(%d, %r, pos=%r)' % (self.index, self.form, self.pos)
+
+
+class Dependencies(object):
+    '''`deprels[i]` is the label of the arc from `heads[i]` to `dependents[i]`.'''
+    __slots__ = ('type', 'unit', 'heads', 'dependents', 'deprels')
+
+    def __init__(self, type, unit, heads, dependents, deprels):
+        self.type = type
+        self.unit = unit
+        self.heads = heads
+        self.dependents = dependents
+        self.deprels = deprels
+
+    def __len__(self):
+        return len(self.dependents)
+
+    def head_of(self, n):
+        '''Returns the array `h` of length `n` such that `h[d]` is the head of `d`
+        (`-1` for the root or if `d` has no head).'''
+        h = array('i', [-1]) * n
+        for head, dep in zip(self.heads, self.dependents):
+            h[dep] = head
+        return h
+
+
+class Tree(object):
+    '''A tree of spans, e.g., a constituency parse or a CCG derivation.
+
+    Span `i` has the label `symbols[i]`, covers the tokens `begins[i]` to
+    `ends[i]` (exclusive), and has the children `children[i]`, a tuple of references.
+    A reference `r >= 0` is a span index and `r < 0` is the token `-r - 1`
+    (see `is_token` and `token_of`). `rules` is the list of the CCG combinators, or
+    `None` for a constituency parse. `roots` are the references of the roots.
+    '''
+    __slots__ = ('ids', 'symbols', 'rules', 'begins', 'ends', 'children', 'roots', 'attrs')
+
+    def __init__(self, ids, symbols, rules, begins, ends, children, roots, attrs=None):
+        self.ids = ids
+        self.symbols = symbols
+        self.rules = rules
+        self.begins = begins
+        self.ends = ends
+        self.children = children
+        self.roots = roots
+        self.attrs = attrs
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @staticmethod
+    def is_token(ref):
+        return ref < 0
+
+    @staticmethod
+    def token_of(ref):
+        return -ref - 1
+
+    @property
+    def root(self):
+        return self.roots[0] if self.roots else None
+
+
+class Span(object):
+    '''A sequence of tokens with a label, e.g., a named entity or a chunk. `head` is a
+    token index or `None`.'''
+    __slots__ = ('id', 'label', 'tokens', 'head', 'attrs')
+
+    def __init__(self, id, label, tokens, head=None, attrs=None):
+        self.id = id
+        self.label = label
+        self.tokens = tokens
+        self.head = head
+        self.attrs = attrs
+
+    def __repr__(self):
+        return 'Span(%r, %r, %r)' % (self.id, self.label, list(self.tokens))
+
+
+class Mention(object):
+    __slots__ = ('id', 'sentence', 'tokens', 'head')
+
+    def __init__(self, id, sentence, tokens, head=None):
+        self.id = id
+        self.sentence = sentence
+        self.tokens = tokens
+        self.head = head
+
+
+class Coreference(object):
+    __slots__ = ('id', 'mentions', 'representative')
+
+    def __init__(self, id, mentions, representative=None):
+        self.id = id
+        self.mentions = mentions
+        self.representative = representative
+
+
+class Sentence(object):
+    '''`dependencies` maps the type of dependencies between tokens (e.g., `basic`; `None`
+    if not given) to `Dependencies`, and `(type, unit)` for those between chunks or basic
+    phrases (e.g., `(None, 'chunk')` of KNP). `chunks` and `basic_phrases` are lists of `Span`, and `nes` is
+    the list of named entities.'''
+    __slots__ = ('index', 'id', 'text', 'begin', 'end', 'tokens', 'dependencies', 'parse',
+                 'ccgs', 'chunks', 'basic_phrases', 'nes', 'attrs')
+
+    def __init__(self, index, id, text, begin=None, end=None, attrs=None):
+        self.index = index
+        self.id = id
+        self.text = text
+        self.begin = begin
+        self.end = end
+        self.tokens = []
+        self.dependencies = {}
+        self.parse = None
+        self.ccgs = []
+        self.chunks = []
+        self.basic_phrases = []
+        self.nes = []
+        self.attrs = attrs
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __repr__(self):
+        return 'Sentence(%r, %d tokens)' % (self.id, len(self.tokens))
+
+
+class Document(object):
+    __slots__ = ('id', 'text', 'sentences', 'mentions', 'coreferences', 'attrs')
+
+    def __init__(self, id, text=None, attrs=None):
+        self.id = id
+        self.text = text
+        self.sentences = []
+        self.mentions = []
+        self.coreferences = []
+        self.attrs = attrs
+
+    def __repr__(self):
+        return 'Document(%r, %d sentences)' % (self.id, len(self.sentences))
+
+    @staticmethod
+    def from_xml(element):
+        '''Loads a `<document>` element (of `xml.etree` or `lxml`).'''
+        return _build_document(_XMLNode(element))
+
+    @staticmethod
+    def from_json(obj):
+        '''Loads a document object of the JSON output.'''
+        return _build_document(_JSONNode(obj))
+
+
+def load_documents(output):
+    '''Loads all documents in an output of Jigg: an XML element or a JSON object, either
+    the root or a document.'''
+    node = _JSONNode(output) if isinstance(output, dict) else _XMLNode(output)
+    if node.tag == 'document':
+        return [_build_document(node)]
+    return [_build_document(c) for c in node.children() if c.tag == 'document']
+
+
+def load_sentence(output, index=0):
+    '''Loads a sentence, an XML element or a JSON object, e.g., yielded by
+    `Pipeline.iter_sentences` or `Pipeline.iter_annotate`. Its `index` is `index`.'''
+    node = _JSONNode(output) if isinstance(output, dict) else _XMLNode(output)
+    return _build_sentence(index, node)
+
+
+# Uniform accessors of the XML and JSON outputs.
+
+class _XMLNode(object):
+    __slots__ = ('e', 'tag', 'attrs')
+
+    def __init__(self, e):
+        self.e = e
+        self.tag = e.tag
+        self.attrs = e.attrib
+
+    def text(self):
+        return (self.e.text or '').strip()
+
+    def children(self):
+        return [_XMLNode(c) for c in self.e if isinstance(c.tag, str)]
+
+
+class _JSONNode(object):
+    __slots__ = ('d', 'tag', 'attrs')
+
+    _SPECIAL = ('.tag', '.child', 'text')
+
+    def __init__(self, d):
+        self.d = d
+        self.tag = d.get('.tag')
+        self.attrs = {k: v for k, v in d.items() if k not in self._SPECIAL}
+
+    def text(self):
+        return self.d.get('text', '')
+
+    def children(self):
+        return [_JSONNode(c) for c in self.d.get('.child', ())]
+
+
+_TOKEN_KEYS = ('id', 'form', 'lemma', 'pos', 'characterOffsetBegin', 'characterOffsetEnd')
+
+
+def _int_or_none(v):
+    return int(v) if v is not None and v != '' else None
+
+
+def _rest(attrs, keys):
+    rest = {k: v for k, v in attrs.items() if k not in keys}
+    return rest or None
+
+
+def _build_document(node):
+    doc = Document(node.attrs.get('id'), node.text() or None,
+                   _rest(node.attrs, ('id',)))
+    # token id -> (sentence index, token index), for document-level annotations.
+    token_positions = {}
+    deferred = []
+    for child in node.children():
+        if child.tag == 'sentences':
+            for s in child.children():
+                if s.tag == 'sentence':
+                    sentence = _build_sentence(len(doc.sentences), s)
+                    for t in sentence.tokens:
+                        token_positions[t.id] = (sentence.index, t.index)
+                    doc.sentences.append(sentence)
+        else:
+            deferred.append(child)
+
+    mention_index = {}
+
+    def add_mention(mention):
+        mention_index[mention.id] = len(doc.mentions)
+        doc.mentions.append(mention)
+
+    for child in deferred:
+        if child.tag == 'mentions':
+            for m in child.children():
+                positions = [token_positions[t] for t in m.attrs.get('tokens', '').split()]
+                sentence = positions[0][0] if positions else -1
+                head = token_positions.get(m.attrs.get('head'))
+                add_mention(Mention(m.attrs.get('id'), sentence,
+                                    array('i', [p[1] for p in positions]),
+                                    head[1] if head else None))
+
+    # The coreferences of documentKNP refer to basic phrases instead of mentions.
+    basic_phrases = {bp.id: (s.index, bp) for s in doc.sentences for bp in s.basic_phrases}
+
+    def resolve(id):
+        if id not in mention_index and id in basic_phrases:
+            sentence, bp = basic_phrases[id]
+            add_mention(Mention(id, sentence, bp.tokens, bp.head))
+        return mention_index.get(id)
+
+    for child in deferred:
+        if child.tag == 'coreferences':
+            for c in child.children():
+                mentions = [resolve(m) for m in c.attrs.get('mentions', '').split()]
+                if None in mentions:
+                    continue  # refers to an unknown element
+                doc.coreferences.append(Coreference(
+                    c.attrs.get('id'), array('i', mentions),
+                    resolve(c.attrs.get('representative'))))
+
+    return doc
+
+
+def _build_sentence(index, node):
+    attrs = node.attrs
+    sentence = Sentence(index, attrs.get('id'), node.text(),
+                        _int_or_none(attrs.get('characterOffsetBegin')),
+                        _int_or_none(attrs.get('characterOffsetEnd')),
+                        _rest(attrs, ('id', 'characterOffsetBegin', 'characterOffsetEnd')))
+    children = node.children()
+
+    token_index = {}
+    for child in children:
+        if child.tag == 'tokens':
+            for t in child.children():
+                a = t.attrs
+                token = Token(len(sentence.tokens), a.get('id'), a.get('form'),
+                              a.get('lemma'), a.get('pos'),
+                              _int_or_none(a.get('characterOffsetBegin')),
+                              _int_or_none(a.get('characterOffsetEnd')),
+                              _rest(a, _TOKEN_KEYS))
+                token_index[token.id] = token.index
+                sentence.tokens.append(token)
+
+    # Chunks and basic phrases are needed to resolve the dependencies between them.
+    unit_index = {}
+    for child in children:
+        if child.tag in ('chunks', 'basicPhrases'):
+            spans = _build_spans(child, token_index)
+            unit_index[child.tag] = {s.id: i for i, s in enumerate(spans)}
+            if child.tag == 'chunks':
+                sentence.chunks = spans
+            else:
+                sentence.basic_phrases = spans
+
+    for child in children:
+        tag = child.tag
+        if tag == 'dependencies':
+            unit = child.attrs.get('unit')
+            index = unit_index.get({'chunk': 'chunks', 'basicPhrase': 'basicPhrases'}.get(unit),
+                                   token_index) if unit else token_index
+            deps = _build_dependencies(child, unit, index)
+            sentence.dependencies[(deps.type, unit) if unit else deps.type] = deps
+        elif tag == 'parse':
+            sentence.parse = _build_tree(child, token_index, ccg=False)
+        elif tag == 'ccg':
+            sentence.ccgs.append(_build_tree(child, token_index, ccg=True))
+        elif tag == 'NEs':
+            sentence.nes = _build_spans(child, token_index)
+    return sentence
+
+
+def _build_spans(node, token_index):
+    spans = []
+    for s in node.children():
+        a = s.attrs
+        tokens = array('i', [token_index[t] for t in a.get('tokens', '').split()])
+        head = token_index.get(a.get('head'))
+        spans.append(Span(a.get('id'), a.get('label') or a.get('type'), tokens, head,
+                          _rest(a, ('id', 'label', 'tokens', 'head'))))
+    return spans
+
+
+def _build_dependencies(node, unit, index):
+    heads = array('i')
+    dependents = array('i')
+    deprels = []
+    for d in node.children():
+        a = d.attrs
+        heads.append(index.get(a.get('head'), -1))  # ROOT or root
+        dependents.append(index[a.get('dependent')])
+        deprels.append(a.get('deprel'))
+    return Dependencies(node.attrs.get('type'), unit, heads, dependents, deprels)
+
+
+def _build_tree(node, token_index, ccg):
+    spans = node.children()
+    span_index = {s.attrs.get('id'): i for i, s in enumerate(spans)}
+
+    def ref(id):
+        i = span_index.get(id)
+        return i if i is not None else -token_index[id] - 1
+
+    ids = [s.attrs.get('id') for s in spans]
+    symbols = [s.attrs.get('symbol') for s in spans]
+    rules = [s.attrs.get('rule') for s in spans] if ccg else None
+    children = [tuple(ref(c) for c in s.attrs.get('children', '').split()) for s in spans]
+    roots = [ref(r) for r in node.attrs.get('root', '').split()]
+
+    n = len(spans)
+    begins = array('i', [-1]) * n
+    ends = array('i', [-1]) * n
+    if ccg:
+        for i, s in enumerate(spans):
+            begins[i] = int(s.attrs.get('begin'))
+            ends[i] = int(s.attrs.get('end'))
+    else:
+        # Spans of a constituency parse have no offsets, so compute them bottom-up.
+        # Iterative, as parses of long sentences may be deep.
+        for r in roots:
+            if r < 0:
+                continue
+            stack = [(r, False)]
+            while stack:
+                i, visited = stack.pop()
+                if begins[i] >= 0:
+                    continue
+                if visited:
+                    bs = [-c - 1 if c < 0 else begins[c] for c in children[i]]
+                    es = [-c if c < 0 else ends[c] for c in children[i]]
+                    begins[i] = min(bs)
+                    ends[i] = max(es)
+                else:
+                    stack.append((i, True))
+                    stack.extend((c, False) for c in children[i] if c >= 0)
+
+    return Tree(ids, symbols, rules, begins, ends, children, roots,
+                _rest(node.attrs, ('root',)))
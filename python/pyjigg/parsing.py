@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+'''Parsers of the responses of Jigg's PipelineServer.
+
+`parser` is one of:
+
+- `'etree'`: `xml.etree.ElementTree` of the standard library (default).
+- `'lxml'`: `lxml.etree`, which is much faster for large responses (pip install lxml).
+- `'raw'`: no parsing; the response body is returned as bytes.
+'''
+
+import json
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+PARSERS = ('etree', 'lxml', 'raw')
+
+
+class JiggError(Exception):
+    '''Base class of the errors raised by pyjigg.'''
+
+
+class ServerError(JiggError):
+    '''The server responded with an error, e.g., an annotator failed.
+
+    `status` is the HTTP status code and `body` is the message of the server.
+    '''
+
+    def __init__(self, status, body):
+        super(ServerError, self).__init__('Server error (%d): %s' % (status, body))
+        self.status = status
+        self.body = body
+
+
+class ResponseParseError(JiggError, ValueError):
+    '''The response could not be parsed. `data` is the raw response.'''
+
+    def __init__(self, message, data):
+        super(ResponseParseError, self).__init__(message)
+        self.data = data
+
+
+def check_parser(parser):
+    if parser not in PARSERS:
+        raise ValueError('Unknown parser: %s. Choose from %s.' % (parser, ', '.join(PARSERS)))
+    if parser == 'lxml' and lxml_etree is None:
+        raise ImportError('parser="lxml" requires lxml; install it by `pip install lxml`.')
+
+
+def _syntax_errors():
+    if lxml_etree is None:
+        return (ET.ParseError,)
+    return (ET.ParseError, lxml_etree.XMLSyntaxError)
+
+
+def _as_bytes(data):
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+
+def parse_xml(data, parser='etree'):
+    '''Parses an XML response (str or bytes) into an element.'''
+    try:
+        if parser == 'lxml':
+            return lxml_etree.fromstring(_as_bytes(data))
+        return ET.fromstring(data)
+    except _syntax_errors() as e:
+        raise ResponseParseError('Failed to parse the response as XML: %s' % e, data)
+
+
+def parse_json(data):
+    '''Parses a JSON response (str or bytes) into a dict.'''
+    try:
+        return json.loads(data, strict=True)
+    except ValueError as e:
+        raise ResponseParseError('Failed to parse the response as JSON: %s' % e, data)
+
+
+def iter_sentences(source, parser='etree'):
+    '''Yields the `<sentence>` elements in an XML response one by one.
+
+    `source` is a file-like object (e.g., a streamed response) or a file name. Each
+    sentence is cleared and detached from the tree after it is yielded, so the memory
+    use does not grow with the number of sentences; copy what you need before
+    advancing the iterator.
+    '''
+    try:
+        if parser == 'lxml':
+            for _, elem in lxml_etree.iterparse(source, events=('end',), tag='sentence'):
+                yield elem
+                elem.clear()
+                parent = elem.getparent()
+                if parent is not None:
+                    parent.remove(elem)
+        else:
+            # ElementTree has no link to the parent, so we keep the open elements.
+            stack = []
+            for event, elem in ET.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    stack.append(elem)
+                    continue
+                stack.pop()
+                if elem.tag == 'sentence':
+                    yield elem
+                    elem.clear()
+                    if stack:
+                        stack[-1].remove(elem)
+    except _syntax_errors() as e:
+        raise ResponseParseError('Failed to parse the response as XML: %s' % e, None)
@@ -1,17 +1,82 @@
 #!/usr/bin/env python
 
-import xml.etree.ElementTree as ET
-import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
+
+from pyjigg.metrics import annotator_profile, parse_metrics
+from pyjigg.parsing import (ServerError, check_parser, iter_sentences, parse_json,
+                            parse_xml)
 
 JIGG = 'jigg-0.6.2'
 
 class Pipeline:
+    '''A client of Jigg's PipelineServer.
+
+    All requests are sent through one pooled `requests.Session`, so connections to
+    the server are kept alive and reused across calls. `pool_size` is the maximum
+    number of connections kept in the pool, which should be at least the number of
+    threads sharing this instance.
+
+    The liveness of the server is checked only at the first call. If
+    `health_check_interval` (in seconds) is given, the check is repeated when that
+    interval has passed since the last successful check.
+
+    The pipeline can be used as a context manager, which closes the pooled
+    connections on exit:
 
-    def __init__(self, server_url):
+        with Pipeline('http://localhost:8080') as pipeline:
+            pipeline.annotate(...)
+
+    `parser` selects how XML responses are parsed: `'etree'` (default), `'lxml'`
+    (faster, requires lxml), or `'raw'`, which returns the response body as bytes
+    without parsing (see `pyjigg.parsing`). An error response of the server raises
+    `ServerError`, and a response that cannot be parsed raises `ResponseParseError`.
+    '''
+
+    def __init__(self, server_url, pool_size=10, health_check_interval=None,
+                 parser='etree'):
         if server_url[-1] == '/':
             server_url = server_url[:-1]
+        check_parser(parser)
         self.server_url = server_url
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
+        self.parser = parser
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._last_checked = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''Releases the pooled connections.'''
+        self.session.close()
+
+    def check_server(self, force=False):
+        '''Checks that the Jigg Pipeline server is started.
+
+        The result is cached; see `health_check_interval`.
+        '''
+        now = time.time()
+        if not force and self._last_checked is not None:
+            interval = self.health_check_interval
+            if interval is None or now - self._last_checked < interval:
+                return
+        try:
+            self.session.get(self.server_url)
+        except requests.exceptions.ConnectionError:
+            self._last_checked = None
+            raise server_error()
+        self._last_checked = now
 
     def annotate(self, text, properties=None):
         assert isinstance(text, str)
@@ -20,29 +85,136 @@ class Pipeline:
         else:
             assert isinstance(properties, dict)
 
-        # Checks that the Jigg Pipeline server is started.
-        try:
-            requests.get(self.server_url)
-        except requests.exceptions.ConnectionError:
-            raise Exception('Check whether you have started the Jigg\'s PipelineServer e.g.\n'
-                            '$ cd %s/ \n'
-                            '$ java -Xmx4g -cp "*" jigg.pipeline.PipelineServer' % (JIGG))
+        self.check_server()
 
-        url = self.server_url + '/annotate'
         text = text.encode()
         data = properties.copy()
         data['q'] = text
-        r = requests.post(url, data=data)
-        output = r.text
-        if ('outputFormat' in properties and properties['outputFormat'] == 'json'):
-            try:
-                output = json.loads(output, encoding='utf-8', strict=True)
-            except:
-                pass
+        return decode_output(self._post('/annotate', data).content, properties, self.parser)
+
+    def annotate_batch(self, texts, properties=None):
+        '''Annotates many texts in one request, each as a separate document.
+
+        Returns the list of annotated documents in the order of `texts`: each is a
+        `<document>` element, or a JSON object if `outputFormat` is `json`.
+        '''
+        assert all(isinstance(text, str) for text in texts)
+        if properties is None:
+            properties = {}
+        else:
+            assert isinstance(properties, dict)
+
+        self.check_server()
+
+        data = list(properties.items()) + [('q', text.encode()) for text in texts]
+        output = self._post('/annotate_batch', data).content
+        return split_documents(decode_output(output, properties, self.parser))
+
+    def iter_sentences(self, text, properties=None):
+        '''Annotates `text` and yields the `<sentence>` elements while parsing the
+        response incrementally.
+
+        Each sentence is freed after it is yielded (see `pyjigg.parsing.iter_sentences`),
+        so the whole annotated document is never built on the client. The output is
+        always XML, and the parser is `lxml` if this pipeline uses it, otherwise `etree`.
+        '''
+        assert isinstance(text, str)
+        properties = dict(properties or {}, outputFormat='xml')
+
+        self.check_server()
+
+        data = properties.copy()
+        data['q'] = text.encode()
+        with self._post('/annotate', data, stream=True) as r:
+            r.raw.decode_content = True
+            parser = 'lxml' if self.parser == 'lxml' else 'etree'
+            for sentence in iter_sentences(r.raw, parser):
+                yield sentence
+
+    def iter_annotate(self, texts, properties=None, unit='sentence'):
+        '''Annotates `texts` (a text or a list of texts, each a separate document) and
+        yields the results one by one as they arrive from the server.
+
+        With `unit='sentence'`, each `<sentence>` is yielded, followed by its
+        `<document>` without `<sentences>`; with `unit='document'`, each `<document>` is
+        yielded. Elements are XML elements, or JSON objects if `outputFormat` is `json`.
+        Only one element is held at a time, so the memory use is bounded by the size
+        of a sentence (or a document) rather than the whole input.
+        '''
+        if isinstance(texts, str):
+            texts = [texts]
+        assert all(isinstance(text, str) for text in texts)
+        if properties is None:
+            properties = {}
         else:
-            try:
-                output = ET.fromstring(output)
-            except:
-                pass
+            assert isinstance(properties, dict)
+
+        self.check_server()
+
+        data = list(properties.items()) + [('unit', unit)] + \
+               [('q', text.encode()) for text in texts]
+        with self._post('/annotate_stream', data, stream=True) as r:
+            for line in r.iter_lines():
+                if line:
+                    yield decode_output(line, properties, self.parser)
+
+    def metrics(self):
+        '''Returns the metrics of the server (see `pyjigg.metrics.parse_metrics`).'''
+        try:
+            r = self.session.get(self.server_url + '/metrics')
+        except requests.exceptions.ConnectionError:
+            self._last_checked = None
+            raise server_error()
+        if r.status_code >= 400:
+            raise ServerError(r.status_code, r.text)
+        return parse_metrics(r.text)
+
+    def profile(self):
+        '''Returns the time spent by each annotator on the server so far
+        (see `pyjigg.metrics.annotator_profile`).'''
+        return annotator_profile(self.metrics())
+
+    def _post(self, path, data, stream=False):
+        try:
+            r = self.session.post(self.server_url + path, data=data, stream=stream)
+        except requests.exceptions.ConnectionError:
+            # The server may have been stopped after the last health check.
+            self._last_checked = None
+            raise server_error()
+        if r.status_code >= 400:
+            # The body of an error response is the message (e.g., stack trace) of the server.
+            body = r.text
+            r.close()
+            raise ServerError(r.status_code, body)
+        return r
+
 
+def decode_output(output, properties, parser='etree'):
+    '''Converts a response body (bytes or str) of the server into an XML element or a
+    JSON object, according to `outputFormat` in `properties`.
+
+    With `parser='raw'`, `output` is returned as is. Raises `ResponseParseError` if
+    `output` cannot be parsed.
+    '''
+    if parser == 'raw':
+        return output
+    if properties.get('outputFormat') == 'json':
+        return parse_json(output)
+    return parse_xml(output, parser)
+
+
+def split_documents(output):
+    '''Returns the list of documents in a decoded output of the server. A raw output
+    (`parser='raw'`) is returned as is.'''
+    if isinstance(output, dict):
+        return [c for c in output.get('.child', []) if c.get('.tag') == 'document']
+    elif isinstance(output, (str, bytes)):
         return output
+    else:
+        return output.findall('document')
+
+
+def server_error():
+    return Exception('Check whether you have started the Jigg\'s PipelineServer e.g.\n'
+                     '$ cd %s/ \n'
+                     '$ java -Xmx4g -cp "*" jigg.pipeline.PipelineServer' % (JIGG))
@@ -4,4 +4,11 @@ setup(
     name = "pyjigg",
     packages=['pyjigg'],
     version = "0.1.0",
+    install_requires=['requests'],
+    extras_require={
+        'async': ['aiohttp'],
+        'lxml': ['lxml'],
+        'export': ['numpy'],
+        'parquet': ['numpy', 'pyarrow'],
+    },
 )
@@ -0,0 +1,60 @@
+'''Outputs of Jigg: those taken from the tests in .checker/tests, in the XML and JSON
+forms, and of /metrics of PipelineServer.'''
+
+import ast
+import os
+import xml.etree.ElementTree as ET
+
+CHECKER_TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', '.checker', 'tests')
+
+# An output of /metrics of PipelineServer (see jigg.util.Metrics.render).
+METRICS = '''# HELP jigg_annotator_seconds Wall time of the annotate calls of each annotator in a pipeline.
+# TYPE jigg_annotator_seconds summary
+jigg_annotator_seconds_sum{annotator="depccg"} 3.5
+jigg_annotator_seconds_count{annotator="depccg"} 2
+jigg_annotator_seconds_sum{annotator="ssplit"} 0.5
+jigg_annotator_seconds_count{annotator="ssplit"} 2
+jigg_annotator_seconds_sum{annotator="tokenize"} 1
+jigg_annotator_seconds_count{annotator="tokenize"} 4
+# HELP jigg_annotator_sentences_total Number of sentences processed by each annotator.
+# TYPE jigg_annotator_sentences_total counter
+jigg_annotator_sentences_total{annotator="depccg"} 10
+jigg_annotator_sentences_total{annotator="tokenize"} 10
+# HELP jigg_process_roundtrip_seconds Time from writing an input to an external process until reading its output.
+# TYPE jigg_process_roundtrip_seconds summary
+jigg_process_roundtrip_seconds_sum{annotator="depccg"} 3.25
+jigg_process_roundtrip_seconds_count{annotator="depccg"} 10
+# HELP jigg_server_rejected_requests_total Number of requests rejected because the queue is full.
+# TYPE jigg_server_rejected_requests_total counter
+jigg_server_rejected_requests_total 3
+'''
+
+
+def checker_output(name):
+    '''The root element of the expected output of a test, e.g., `knp/test_knp.py`, or
+    None if the test is not found.'''
+    path = os.path.join(CHECKER_TESTS, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and \
+           any(isinstance(t, ast.Attribute) and t.attr == 'expected_text' for t in node.targets):
+            return ET.fromstring(ast.literal_eval(node.value).encode('utf-8'))
+    return None
+
+
+def to_json(element):
+    '''The JSON output of Jigg for an XML element (see JSONUtil.toJSON).'''
+    def convert(e):
+        d = {'.tag': e.tag}
+        text = (e.text or '').strip()
+        if text:
+            d['text'] = text
+        d.update(e.attrib)
+        if len(e):
+            d['.child'] = [convert(c) for c in e]
+        return d
+    return {'.tag': element.tag, '.child': [convert(c) for c in element]}
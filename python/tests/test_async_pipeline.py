@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from pyjigg import AsyncPipeline
+from pyjigg.parsing import ServerError
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    '''A stub of PipelineServer, which returns a document with the text of a request
+    after `delay` seconds, or the status `q` of a request like `error:500`.'''
+    daemon_threads = True
+
+    def __init__(self, delay=0.0):
+        super(StubServer, self).__init__(('127.0.0.1', 0), StubHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.respond(200, b'Jigg PipelineServer')
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+        text = form['q'][0]
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.delay)
+        finally:
+            with server.lock:
+                server.active -= 1
+        if text.startswith('error:'):
+            self.respond(int(text[6:]), b'annotation failed')
+        else:
+            body = '<root><document id="d0">%s</document></root>' % text
+            self.respond(200, body.encode('utf-8'))
+
+    def respond(self, status, body):
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/xml; charset=UTF-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up (a timeout).
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class TestAsyncPipeline(unittest.TestCase):
+
+    def start_server(self, delay=0.0):
+        server = StubServer(delay)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def run_pipeline(self, url, f, **kwargs):
+        async def main():
+            async with AsyncPipeline(url, **kwargs) as pipeline:
+                return await f(pipeline)
+        return asyncio.run(main())
+
+    def test_annotate(self):
+        server = self.start_server()
+        root = self.run_pipeline(server.url, lambda p: p.annotate('日本語のテキスト'))
+        self.assertEqual(root.find('document').text, '日本語のテキスト')
+
+    def test_annotate_many_in_order(self):
+        server = self.start_server(delay=0.01)
+        texts = ['text%d' % i for i in range(20)]
+        roots = self.run_pipeline(server.url, lambda p: p.annotate_many(texts))
+        self.assertEqual([r.find('document').text for r in roots], texts)
+
+    def test_concurrency_limit(self):
+        server = self.start_server(delay=0.1)
+        texts = ['text%d' % i for i in range(12)]
+        self.run_pipeline(server.url, lambda p: p.annotate_many(texts), concurrency=3)
+        self.assertEqual(server.max_active, 3)
+
+    def test_server_error(self):
+        server = self.start_server()
+        with self.assertRaises(ServerError) as cm:
+            self.run_pipeline(server.url, lambda p: p.annotate('error:500'))
+        self.assertEqual(cm.exception.status, 500)
+        self.assertIn('annotation failed', cm.exception.body)
+
+    def test_timeout(self):
+        server = self.start_server(delay=1.0)
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_pipeline(server.url, lambda p: p.annotate('slow'), timeout=0.2)
+
+    def test_server_not_started(self):
+        server = self.start_server()
+        url = server.url
+        server.shutdown()
+        server.server_close()
+        with self.assertRaisesRegex(Exception, 'PipelineServer'):
+            self.run_pipeline(url, lambda p: p.annotate('text'))
+
+
+if __name__ == '__main__':
+    unittest.main()
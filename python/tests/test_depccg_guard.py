@@ -0,0 +1,80 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'src', 'main', 'resources', 'python'))
+
+try:
+    import _depccg
+except ImportError:  # depccg is not installed
+    _depccg = None
+
+
+class StubParser(object):
+    '''A parser that takes `seconds` for each sentence, or sleeps long for a sentence
+    `slow`. Each call of `parse_doc` is logged to `log` by the number of sentences,
+    since it runs in a forked process.'''
+
+    def __init__(self, log, seconds):
+        self.log = log
+        self.seconds = seconds
+
+    def parse_doc(self, doc):
+        with open(self.log, 'a') as f:
+            f.write('%d\n' % len(doc))
+        time.sleep(60 if 'slow' in doc else self.seconds * len(doc))
+        return [[(sent, 0.0)] for sent in doc]
+
+    def calls(self):
+        with open(self.log) as f:
+            return [int(line) for line in f]
+
+
+@unittest.skipUnless(_depccg, 'depccg is not installed')
+@unittest.skipUnless(hasattr(os, 'fork'), 'fork is not available')
+class TestGuard(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(_depccg, 'compact_tree', lambda tree: tree)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def parser(self, seconds=0.0):
+        return StubParser(os.path.join(self.dir, 'log'), seconds)
+
+    def test_block_longer_than_a_few_timeouts(self):
+        # 8 sentences of 0.1 seconds take 4 times the timeout in total, and are
+        # parsed together within the budget of 8 timeouts.
+        parser = self.parser(0.1)
+        guard = _depccg.Guard(timeout=0.2)
+        doc = ['s%d' % i for i in range(8)]
+        outputs = guard.parse_sentences(parser, doc, list(range(8)), compact=True)
+        self.assertEqual(outputs, ['%d\ts%d' % (i + 1, i) for i in range(8)])
+        self.assertEqual(parser.calls(), [8])
+
+    def test_timeout_keeps_parsed_buckets(self):
+        # Buckets of two sentences: only those in the bucket of `slow` are parsed again.
+        parser = self.parser()
+        guard = _depccg.Guard(timeout=0.5)
+        doc = ['a', 'b', 'slow', 'd']
+        outputs = guard.parse_sentences(parser, doc, list(range(4)), bucket_tokens=2,
+                                        compact=True)
+        self.assertEqual(outputs, ['1\ta', '2\tb', '3\t!timeout', '4\td'])
+        self.assertEqual(parser.calls(), [2, 2, 1, 1])
+
+    def test_length_cap(self):
+        guard = _depccg.Guard(max_tokens=2)
+        outputs = guard.parse_sentences(self.parser(), ['a b c', 'a b'], [0, 1],
+                                        compact=True)
+        self.assertEqual(outputs, ['1\t!length', '2\ta b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
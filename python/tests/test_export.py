@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+    from pyjigg import export
+except ImportError:  # NumPy is not installed
+    export = None
+
+from pyjigg.model import load_documents
+
+from fixtures import checker_output, to_json
+
+PARSE = checker_output('udpipe/test_udpipe_parse.py')
+
+
+@unittest.skipUnless(export, 'NumPy is not installed')
+@unittest.skipUnless(PARSE is not None, 'the UDPipe fixture is not found')
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        # Documents as returned by Pipeline.annotate_batch.
+        self.outputs = PARSE.findall('document') * 2
+        self.documents = load_documents(PARSE) * 2
+
+    def expected(self):
+        rows = []
+        for d, document in enumerate(self.documents):
+            for sentence in document.sentences:
+                deps = sentence.dependencies[None]
+                heads = dict(zip(deps.dependents, deps.heads))
+                rels = dict(zip(deps.dependents, deps.deprels))
+                for t in sentence.tokens:
+                    rows.append((d, sentence.index, t.index, heads[t.index], t.form, t.lemma,
+                                 t.pos, rels[t.index]))
+        return rows
+
+    def rows(self, columns, decode):
+        strings = [decode(k, columns[k]) for k in ('form', 'lemma', 'pos', 'deprel')]
+        ints = [list(columns[k]) for k in ('document', 'sentence', 'token', 'head')]
+        return list(zip(*(ints + strings)))
+
+    def test_add_lists(self):
+        for outputs in (self.outputs, [to_json(e) for e in self.outputs], self.documents):
+            table = export.TokenTable()
+            table.add(outputs)
+            self.assertEqual(table.num_documents, 2)
+            self.assertEqual(len(table), sum(len(s.tokens) for d in self.documents
+                                             for s in d.sentences))
+
+    def test_npz(self):
+        path = os.path.join(self.dir, 'tokens')
+        export.export(self.outputs, path, format='npz', batch_size=10)
+        self.assertGreater(len([p for p in os.listdir(path) if p.endswith('.npz')]), 1)
+        columns, dictionaries = export.load_npz(path)
+        decode = lambda k, codes: list(dictionaries[k].decode(codes))
+        self.assertEqual(self.rows(columns, decode), self.expected())
+
+    @unittest.skipUnless(export and export.pa, 'pyarrow is not installed')
+    def test_parquet(self):
+        path = os.path.join(self.dir, 'tokens.parquet')
+        with export.ColumnarWriter(path, format='parquet', batch_size=10) as writer:
+            writer.write(self.outputs)
+        table = export.pq.read_table(path).to_pydict()
+        self.assertEqual(self.rows(table, lambda k, values: values), self.expected())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from pyjigg.metrics import annotator_profile, format_profile, parse_metrics
+
+from fixtures import METRICS
+
+
+class TestParseMetrics(unittest.TestCase):
+
+    def test_samples(self):
+        samples = parse_metrics(METRICS)
+        self.assertEqual(len(samples), 11)
+        self.assertEqual(samples[('jigg_annotator_seconds_sum', (('annotator', 'depccg'),))], 3.5)
+        self.assertEqual(samples[('jigg_server_rejected_requests_total', ())], 3.0)
+
+    def test_labels(self):
+        samples = parse_metrics('a{x="1",annotator="q\\"\\\\\\n"} 2\n')
+        self.assertEqual(list(samples), [('a', (('annotator', 'q"\\\n'), ('x', '1')))])
+
+    def test_invalid_lines(self):
+        samples = parse_metrics('# a comment\n\nnot a sample\nb 1e-3\nc{x="1"} NaN\n')
+        self.assertEqual(samples[('b', ())], 0.001)
+        self.assertNotEqual(samples[('c', (('x', '1'),))], samples[('c', (('x', '1'),))])
+        self.assertEqual(len(samples), 2)
+
+
+class TestAnnotatorProfile(unittest.TestCase):
+
+    def test_profile(self):
+        profile = annotator_profile(parse_metrics(METRICS))
+        self.assertEqual([p['annotator'] for p in profile], ['depccg', 'tokenize', 'ssplit'])
+        depccg, tokenize, ssplit = profile
+        self.assertEqual(depccg, {
+            'annotator': 'depccg', 'calls': 2, 'seconds': 3.5, 'share': 0.7,
+            'sentences': 10, 'ms_per_sentence': 350.0, 'process_calls': 10,
+            'process_seconds': 3.25})
+        self.assertEqual(tokenize['ms_per_sentence'], 100.0)
+        self.assertIsNone(ssplit['ms_per_sentence'])
+        self.assertEqual(ssplit['process_calls'], 0)
+
+    def test_empty(self):
+        self.assertEqual(annotator_profile(parse_metrics('')), [])
+        profile = annotator_profile({('jigg_annotator_sentences_total', (('annotator', 'a'),)): 1})
+        self.assertEqual(profile[0]['share'], 0.0)
+
+    def test_format(self):
+        lines = format_profile(annotator_profile(parse_metrics(METRICS))).split('\n')
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[1].split(),
+                         ['depccg', '2', '3.500', '70.0%', '10', '350.000', '3.250'])
+        self.assertEqual(lines[3].split()[5], '-')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import xml.etree.ElementTree as ET
+
+from pyjigg.model import load_documents
+
+from fixtures import checker_output, to_json
+
+# The coreferences of documentKNP, which refer to the basic phrases of the KNP fixture.
+KNP_COREFERENCES = '''<coreferences annotators="knpDoc">
+  <coreference id="d0_knpcr0" mentions="s0_knpbp0 s0_knpbp5"/>
+  <coreference id="d0_knpcr1" mentions="s0_knpbp1"/>
+</coreferences>'''
+
+
+class TestKNP(unittest.TestCase):
+
+    def setUp(self):
+        self.root = checker_output('knp/test_knp.py')
+        if self.root is None:
+            self.skipTest('.checker/tests/knp is not found')
+
+    def outputs(self):
+        '''The output in XML and JSON.'''
+        return [('xml', self.root), ('json', to_json(self.root))]
+
+    def test_dependencies_of_chunks_and_basic_phrases(self):
+        for form, output in self.outputs():
+            with self.subTest(form=form):
+                sentence = load_documents(output)[0].sentences[0]
+                self.assertEqual(len(sentence.tokens), 12)
+                self.assertEqual(len(sentence.chunks), 7)
+                self.assertEqual(len(sentence.basic_phrases), 7)
+                self.assertEqual(set(sentence.dependencies),
+                                 {(None, 'chunk'), (None, 'basicPhrase')})
+                chunks = sentence.dependencies[(None, 'chunk')]
+                basic_phrases = sentence.dependencies[(None, 'basicPhrase')]
+                self.assertEqual(chunks.unit, 'chunk')
+                self.assertEqual(basic_phrases.unit, 'basicPhrase')
+                # s0_knpbp0 -> s0_knpbp6, s0_knpbp1 -> s0_knpbp2
+                self.assertEqual(list(basic_phrases.dependents[:2]), [0, 1])
+                self.assertEqual(list(basic_phrases.heads[:2]), [6, 2])
+                self.assertEqual([ne.label for ne in sentence.nes], ['PERSON'])
+
+    def test_coreferences_of_basic_phrases(self):
+        self.root.find('document').append(ET.fromstring(KNP_COREFERENCES))
+        for form, output in self.outputs():
+            with self.subTest(form=form):
+                document = load_documents(output)[0]
+                self.assertEqual(len(document.coreferences), 2)
+                mentions = [document.mentions[m] for m in document.coreferences[0].mentions]
+                self.assertEqual([m.id for m in mentions], ['s0_knpbp0', 's0_knpbp5'])
+                self.assertEqual([m.sentence for m in mentions], [0, 0])
+                # s0_knpbp0 covers 太郎 and は.
+                self.assertEqual(list(mentions[0].tokens), [0, 1])
+
+    def test_coreferences_of_unknown_mentions_are_skipped(self):
+        self.root.find('document').append(ET.fromstring(
+            '<coreferences><coreference id="cr0" mentions="me0 s0_knpbp0"/></coreferences>'))
+        for form, output in self.outputs():
+            with self.subTest(form=form):
+                self.assertEqual(load_documents(output)[0].coreferences, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
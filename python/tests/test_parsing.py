@@ -0,0 +1,93 @@
+import io
+import unittest
+
+from pyjigg.parsing import (ResponseParseError, check_parser, iter_sentences, lxml_etree,
+                            parse_json, parse_xml)
+from pyjigg.pipeline import decode_output, split_documents
+
+XML = ('<root><document id="d0"><sentences>'
+       '<sentence id="s0">日本語の文。<tokens><token id="t0" form="日本語"/></tokens></sentence>'
+       '<sentence id="s1">二文目。</sentence>'
+       '</sentences></document>'
+       '<document id="d1"><sentences><sentence id="s2">三文目。</sentence></sentences>'
+       '</document></root>')
+
+PARSERS = ['etree'] + (['lxml'] if lxml_etree is not None else [])
+
+
+class TestParse(unittest.TestCase):
+
+    def test_parse_xml(self):
+        for parser in PARSERS:
+            with self.subTest(parser=parser):
+                for data in (XML, XML.encode('utf-8')):
+                    root = parse_xml(data, parser)
+                    self.assertEqual([s.text for s in root.iter('sentence')],
+                                     ['日本語の文。', '二文目。', '三文目。'])
+
+    def test_parse_xml_error(self):
+        for parser in PARSERS:
+            with self.subTest(parser=parser):
+                with self.assertRaises(ResponseParseError) as cm:
+                    parse_xml(b'<root><document>', parser)
+                self.assertEqual(cm.exception.data, b'<root><document>')
+
+    def test_parse_json(self):
+        self.assertEqual(parse_json(b'{".tag": "root"}'), {'.tag': 'root'})
+        with self.assertRaises(ResponseParseError) as cm:
+            parse_json('{".tag": ')
+        self.assertIsInstance(cm.exception, ValueError)
+
+    def test_check_parser(self):
+        for parser in ('etree', 'raw'):
+            check_parser(parser)
+        with self.assertRaises(ValueError):
+            check_parser('html')
+
+    @unittest.skipUnless(lxml_etree is None, 'lxml is installed')
+    def test_check_parser_without_lxml(self):
+        with self.assertRaises(ImportError):
+            check_parser('lxml')
+
+    def test_decode_output(self):
+        for parser in PARSERS:
+            with self.subTest(parser=parser):
+                documents = split_documents(decode_output(XML, {}, parser))
+                self.assertEqual([d.get('id') for d in documents], ['d0', 'd1'])
+        output = decode_output('{".tag": "root", ".child": [{".tag": "document"}]}',
+                               {'outputFormat': 'json'})
+        self.assertEqual(split_documents(output), [{'.tag': 'document'}])
+        self.assertEqual(split_documents(decode_output(b'<root/>', {}, 'raw')), b'<root/>')
+
+
+class TestIterSentences(unittest.TestCase):
+
+    def test_sentences(self):
+        for parser in PARSERS:
+            with self.subTest(parser=parser):
+                sentences = []
+                for s in iter_sentences(io.BytesIO(XML.encode('utf-8')), parser):
+                    sentences.append((s.get('id'), s.text, len(s.findall('tokens/token'))))
+                self.assertEqual(sentences, [('s0', '日本語の文。', 1), ('s1', '二文目。', 0),
+                                             ('s2', '三文目。', 0)])
+
+    def test_sentences_are_freed(self):
+        for parser in PARSERS:
+            with self.subTest(parser=parser):
+                yielded = list(iter_sentences(io.BytesIO(XML.encode('utf-8')), parser))
+                self.assertEqual([len(s) for s in yielded], [0, 0, 0])
+                self.assertEqual([s.get('id') for s in yielded], [None, None, None])
+
+    def test_broken(self):
+        for parser in PARSERS:
+            with self.subTest(parser=parser):
+                data = XML.encode('utf-8')
+                data = data[:data.index(b'<document id="d1">') + 30]
+                sentences = iter_sentences(io.BytesIO(data), parser)
+                self.assertEqual([next(sentences).get('id') for _ in range(2)], ['s0', 's1'])
+                with self.assertRaises(ResponseParseError):
+                    next(sentences)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+import json
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from pyjigg import Pipeline
+from pyjigg.parsing import ResponseParseError, ServerError, lxml_etree
+
+from fixtures import METRICS
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    '''A stub of PipelineServer, which keeps connections alive and counts them and the
+    health checks (`GET /`).'''
+    daemon_threads = True
+
+    def __init__(self):
+        super(StubServer, self).__init__(('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.health_checks = 0
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def verify_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        return True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''`/annotate` returns a document with a sentence for each line of `q`, or the
+    status of `q` like `error:500`; `/annotate_batch` returns one for each `q`.
+    `/annotate_stream` returns the lines of each `q` (see `stream_lines`), and
+    `/metrics` returns `METRICS`.'''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/':
+            with self.server.lock:
+                self.server.health_checks += 1
+            self.respond(200, 'Jigg PipelineServer')
+        elif self.path == '/metrics':
+            self.respond(200, METRICS)
+        else:
+            self.respond(404, 'not found')
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+        texts = form['q']
+        if texts[0].startswith('error:'):
+            self.respond(int(texts[0][6:]), 'annotation failed')
+        elif self.path == '/annotate':
+            self.respond(200, '<root>%s</root>' % document(0, texts[0]))
+        elif self.path == '/annotate_batch':
+            self.respond(200, '<root>%s</root>' % ''.join(
+                document(i, text) for i, text in enumerate(texts)))
+        elif self.path == '/annotate_stream':
+            unit = form.get('unit', ['sentence'])[0]
+            json_output = form.get('outputFormat') == ['json']
+            lines = [line for i, text in enumerate(texts)
+                     for line in stream_lines(i, text, unit, json_output)]
+            self.respond(200, ''.join(line + '\n' for line in lines))
+        else:
+            self.respond(404, 'not found')
+
+    def respond(self, status, body):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def sentences(text):
+    return ['<sentence id="s%d">%s</sentence>' % (i, line)
+            for i, line in enumerate(text.split('\n'))]
+
+
+def document(i, text):
+    return '<document id="d%d"><sentences>%s</sentences></document>' % (
+        i, ''.join(sentences(text)))
+
+
+def stream_lines(i, text, unit, json_output):
+    '''The lines of `annotate_stream` for the i-th text; the line of `broken` is not
+    valid.'''
+    if text == 'broken':
+        return ['<sentence id="s0"']
+    if json_output:
+        lines = [{'.tag': 'sentence', 'id': 's%d' % j, 'text': line}
+                 for j, line in enumerate(text.split('\n'))]
+        return [json.dumps(d) for d in lines + [{'.tag': 'document', 'id': 'd%d' % i}]]
+    if unit == 'document':
+        return [document(i, text)]
+    return sentences(text) + ['<document id="d%d"/>' % i]
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def start_server(self):
+        server = StubServer()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def pipeline(self, server, **kwargs):
+        pipeline = Pipeline(server.url, **kwargs)
+        self.addCleanup(pipeline.close)
+        return pipeline
+
+
+class TestSession(PipelineTestCase):
+
+    def test_annotate(self):
+        server = self.start_server()
+        root = self.pipeline(server).annotate('日本語の文。\n二文目。')
+        self.assertEqual([s.text for s in root.iter('sentence')], ['日本語の文。', '二文目。'])
+
+    def test_session_reuse(self):
+        server = self.start_server()
+        pipeline = self.pipeline(server)
+        for i in range(5):
+            pipeline.annotate('text%d' % i)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(server.health_checks, 1)
+
+    def test_health_check_interval(self):
+        server = self.start_server()
+        pipeline = self.pipeline(server, health_check_interval=0.2)
+        pipeline.annotate('text')
+        pipeline.annotate('text')
+        self.assertEqual(server.health_checks, 1)
+        time.sleep(0.3)
+        pipeline.annotate('text')
+        self.assertEqual(server.health_checks, 2)
+        pipeline.check_server(force=True)
+        self.assertEqual(server.health_checks, 3)
+
+    def test_server_error(self):
+        server = self.start_server()
+        pipeline = self.pipeline(server)
+        with self.assertRaises(ServerError) as cm:
+            pipeline.annotate('error:500')
+        self.assertEqual(cm.exception.status, 500)
+        self.assertEqual(cm.exception.body, 'annotation failed')
+        # The pipeline is still usable.
+        self.assertEqual(pipeline.annotate('text').find('document').get('id'), 'd0')
+
+    def test_server_stopped(self):
+        server = self.start_server()
+        pipeline = self.pipeline(server)
+        pipeline.annotate('text')
+        server.shutdown()
+        server.server_close()
+        pipeline.close()  # drops the kept-alive connection
+        with self.assertRaisesRegex(Exception, 'PipelineServer'):
+            pipeline.annotate('text')
+        # The next call checks the server again.
+        self.assertIsNone(pipeline._last_checked)
+
+
+class TestIterAnnotate(PipelineTestCase):
+
+    def test_sentences_and_documents(self):
+        server = self.start_server()
+        elements = list(self.pipeline(server).iter_annotate(['a\nb', 'c']))
+        self.assertEqual([(e.tag, e.get('id'), e.text) for e in elements],
+                         [('sentence', 's0', 'a'), ('sentence', 's1', 'b'),
+                          ('document', 'd0', None),
+                          ('sentence', 's0', 'c'), ('document', 'd1', None)])
+
+    def test_documents(self):
+        server = self.start_server()
+        elements = list(self.pipeline(server).iter_annotate(['a\nb', 'c'], unit='document'))
+        self.assertEqual([len(e.findall('sentences/sentence')) for e in elements], [2, 1])
+
+    def test_json(self):
+        server = self.start_server()
+        elements = list(self.pipeline(server).iter_annotate('a\nb', {'outputFormat': 'json'}))
+        self.assertEqual([(e['.tag'], e['id']) for e in elements],
+                         [('sentence', 's0'), ('sentence', 's1'), ('document', 'd0')])
+
+    def test_raw(self):
+        server = self.start_server()
+        elements = list(self.pipeline(server, parser='raw').iter_annotate('a'))
+        self.assertEqual(elements, [b'<sentence id="s0">a</sentence>', b'<document id="d0"/>'])
+
+    def test_server_error(self):
+        server = self.start_server()
+        elements = self.pipeline(server).iter_annotate(['error:503'])
+        with self.assertRaises(ServerError) as cm:
+            next(elements)
+        self.assertEqual(cm.exception.status, 503)
+
+    def test_broken_line(self):
+        server = self.start_server()
+        elements = self.pipeline(server).iter_annotate(['a', 'broken'])
+        self.assertEqual([e.tag for e in [next(elements), next(elements)]],
+                         ['sentence', 'document'])
+        with self.assertRaises(ResponseParseError) as cm:
+            next(elements)
+        self.assertEqual(cm.exception.data, b'<sentence id="s0"')
+
+    def test_stop_early(self):
+        server = self.start_server()
+        pipeline = self.pipeline(server)
+        elements = pipeline.iter_annotate(['a\nb\nc'] * 100)
+        next(elements)
+        elements.close()  # releases the response
+        self.assertEqual(len(list(pipeline.iter_annotate(['a']))), 2)
+
+
+class TestParsers(PipelineTestCase):
+
+    def test_iter_sentences(self):
+        server = self.start_server()
+        for parser in ['etree', 'raw'] + (['lxml'] if lxml_etree is not None else []):
+            with self.subTest(parser=parser):
+                pipeline = self.pipeline(server, parser=parser)
+                ids = [s.get('id') for s in pipeline.iter_sentences('a\nb\nc')]
+                self.assertEqual(ids, ['s0', 's1', 's2'])
+
+    @unittest.skipIf(lxml_etree is None, 'lxml is not installed')
+    def test_lxml(self):
+        server = self.start_server()
+        root = self.pipeline(server, parser='lxml').annotate('a')
+        self.assertIsInstance(root, lxml_etree._Element)
+        documents = self.pipeline(server, parser='lxml').annotate_batch(['a', 'b'])
+        self.assertEqual([d.get('id') for d in documents], ['d0', 'd1'])
+
+    def test_raw(self):
+        server = self.start_server()
+        output = self.pipeline(server, parser='raw').annotate('a')
+        self.assertEqual(output, ('<root>%s</root>' % document(0, 'a')).encode('utf-8'))
+
+    def test_unknown_parser(self):
+        with self.assertRaises(ValueError):
+            Pipeline('http://localhost:8080', parser='html')
+
+
+class TestMetrics(PipelineTestCase):
+
+    def test_metrics(self):
+        server = self.start_server()
+        samples = self.pipeline(server).metrics()
+        self.assertEqual(samples[('jigg_server_rejected_requests_total', ())], 3.0)
+
+    def test_profile(self):
+        server = self.start_server()
+        profile = self.pipeline(server).profile()
+        self.assertEqual([(p['annotator'], p['calls']) for p in profile],
+                         [('depccg', 2), ('tokenize', 4), ('ssplit', 2)])
+
+    def test_server_error(self):
+        server = self.start_server()
+        pipeline = Pipeline(server.url + '/missing')
+        self.addCleanup(pipeline.close)
+        with self.assertRaises(ServerError) as cm:
+            pipeline.metrics()
+        self.assertEqual(cm.exception.status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+'''Micro-benchmark of the output formats of `_depccg.py` (XML and compact).
+
+This parses the sentences (one tokenized sentence per line in `--input`, or a few
+built-in sentences repeated `-n` times) once with k-best output, and then reports the
+best time of `-r` runs to serialize the result in each format, with the size of the
+output. The time of parsing is shown for reference. It requires depccg and its model
+(see `-help depccg` of Jigg); the arguments of depccg, such as `--gpu`, can be given.
+
+ $ python script/benchmark_depccg_output.py --nbest 10 -n 500
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'main', 'resources', 'python'))
+
+import _depccg
+from depccg.__main__ import add_common_parser_arguments
+
+SENTENCES = [
+    'He ate pizza with a fork .',
+    'The quick brown fox jumps over the lazy dog .',
+    'Jigg is a pipeline framework for natural language processing .',
+    'I saw the man on the hill with a telescope yesterday .',
+    'Stocks fell sharply after the central bank unexpectedly raised interest rates .',
+]
+
+
+def best_time(f, runs):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lang', default='en', choices=['ja', 'en'])
+    parser.add_argument('--input', help='file of tokenized sentences')
+    parser.add_argument('-n', type=int, default=100, help='repeat the built-in sentences')
+    parser.add_argument('-r', type=int, default=3, help='number of runs')
+    add_common_parser_arguments(parser)
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            doc = [line.strip() for line in f if line.strip()]
+    else:
+        doc = [SENTENCES[i % len(SENTENCES)] for i in range(args.n)]
+
+    ccg_parser = _depccg.build_parser(args)
+
+    start = time.perf_counter()
+    parses = ccg_parser.parse_doc(doc)
+    parse_time = time.perf_counter() - start
+    num_trees = sum(len(kbest) for kbest in parses)
+    print('%d sentences, %d derivations (nbest=%d)' % (len(doc), num_trees, args.nbest))
+
+    def xml():
+        tagged_doc = _depccg.annotate_XX([sent.split(' ') for sent in doc], tokenize=None)
+        return _depccg.format_xml(parses, tagged_doc)
+
+    def compact():
+        return _depccg.format_compact(parses)
+
+    print('%-10s %10s %12s' % ('output', 'time (s)', 'size (MB)'))
+    print('%-10s %10.3f %12s' % ('(parse)', parse_time, '-'))
+    for name, f in [('xml', xml), ('compact', compact)]:
+        t, output = best_time(f, args.r)
+        print('%-10s %10.3f %12.2f' % (name, t, len(output.encode('utf-8')) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,20 @@
 
 import argparse
+import atexit
+import hashlib
+import json
 from lxml import etree
+import multiprocessing
+import os
+import pickle
+import select
+import signal
+import sqlite3
+import struct
 import sys
+import time
+
+import jigg_io
 
 from depccg.__main__ import add_common_parser_arguments
 from depccg.combinator import en_default_binary_rules, ja_default_binary_rules
@@ -18,19 +31,68 @@ Parsers = {'en': EnglishCCGParser, 'ja': JapaneseCCGParser}
 Usage: python depccg.py nbest lang gpu model
 """
 
-def print_xml(trees, tagged_doc):
-    print("<?xml version=\"1.0\" encoding=\"UTF-8\"?>")
-    print("<?xml-stylesheet type=\"text/xsl\" href=\"candc.xml\"?>")
-    print("<candc>")
-    for i, (kbest, tokens) in enumerate(zip(trees, tagged_doc), 1):
-        print("<ccgs sentence=\"{}\">".format(i))
-        for j, (t, _) in enumerate(kbest, 1):
-            ccg = t.xml(tokens)
-            ccg.set("sentence", str(i))
-            ccg.set("id", str(j))
-            print(etree.tostring(ccg, encoding='utf-8', pretty_print=True).decode('utf-8'))
-        print("</ccgs>")
-    print("</candc>")
+def format_ccgs(i, kbest, tokens):
+    """The <ccgs> element of the k-best derivations of the i-th sentence (1-origin)."""
+    lines = ["<ccgs sentence=\"{}\">".format(i)]
+    for j, (t, _) in enumerate(kbest, 1):
+        ccg = t.xml(tokens)
+        ccg.set("sentence", str(i))
+        ccg.set("id", str(j))
+        lines.append(etree.tostring(ccg, encoding='utf-8', pretty_print=True).decode('utf-8'))
+    lines.append("</ccgs>")
+    return "\n".join(lines)
+
+def wrap_xml(ccgs):
+    return "\n".join(["<?xml version=\"1.0\" encoding=\"UTF-8\"?>",
+                      "<?xml-stylesheet type=\"text/xsl\" href=\"candc.xml\"?>",
+                      "<candc>"] + ccgs + ["</candc>"])
+
+def format_xml(trees, tagged_doc):
+    return wrap_xml([format_ccgs(i, kbest, tokens)
+                     for i, (kbest, tokens) in enumerate(zip(trees, tagged_doc), 1)])
+
+def compact_tree(tree):
+    """A derivation as space-separated tokens in the prefix order. A rule is
+    `( type category children... )` and a leaf is its category. Leaves are the tokens
+    from left to right, so their positions are not written.
+    """
+    out = []
+    def rec(t):
+        if t.is_leaf:
+            out.append(str(t.cat))
+        else:
+            out.extend(('(', t.op_string, str(t.cat)))
+            for child in t.children:
+                rec(child)
+            out.append(')')
+    rec(tree)
+    return ' '.join(out)
+
+def format_compact_sentence(i, kbest):
+    """One line `i<TAB>derivation` for each of k-best derivations of the i-th sentence
+    (1-origin, as in the XML); read by DepCCGAnnotator with -depccg.compact.
+    """
+    return "\n".join("{}\t{}".format(i, compact_tree(t)) for t, _ in kbest)
+
+def format_compact(trees):
+    return join_output([format_compact_sentence(i, kbest)
+                        for i, kbest in enumerate(trees, 1)], compact=True)
+
+def format_sentences(parses, doc, indices, compact=False):
+    """Formats the parses of the sentences `doc`, whose indices in the whole input are
+    `indices` (0-origin), one string for each sentence.
+    """
+    if compact:
+        return [format_compact_sentence(i + 1, kbest) for i, kbest in zip(indices, parses)]
+    tagged_doc = annotate_XX([[word for word in sent.split(' ')] for sent in doc],
+                             tokenize=None)
+    return [format_ccgs(i + 1, kbest, tokens)
+            for i, kbest, tokens in zip(indices, parses, tagged_doc)]
+
+def join_output(sentences, compact=False):
+    if compact:
+        return "\n".join(s for s in sentences if s)
+    return wrap_xml(sentences)
 
 def build_parser(args):
     if args.lang == 'en':
@@ -66,31 +128,396 @@ def build_parser(args):
 
     return parser
 
-def input_and_parse(parser):
-    annotate_fun = annotate_XX
+def length_buckets(lengths, max_tokens):
+    """Groups sentence indices into buckets of similar lengths.
+
+    The indices are sorted by the length, and each bucket is filled until its padded
+    size (the longest length times the number of sentences) exceeds `max_tokens`.
+    A bucket has at least one sentence.
+
+    >>> length_buckets([5, 1, 3, 2, 4], 6)
+    [[1, 3], [2], [4], [0]]
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets, bucket = [], []
+    for i in order:
+        if bucket and lengths[i] * (len(bucket) + 1) > max_tokens:
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(i)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+def iter_buckets(parser, doc, max_tokens):
+    """Parses sentences in `doc` bucket by bucket (see `length_buckets`), and yields
+    the indices of each bucket and their results. If `max_tokens` <= 0, the whole `doc`
+    is a single bucket.
+    """
+    if max_tokens <= 0:
+        yield list(range(len(doc))), parser.parse_doc(doc)
+        return
+    lengths = [len(sent.split(' ')) for sent in doc]
+    for bucket in length_buckets(lengths, max_tokens):
+        yield bucket, parser.parse_doc([doc[i] for i in bucket])
+
+def parse_in_buckets(parser, doc, max_tokens):
+    """Parses sentences in `doc` by `iter_buckets`, and returns the results in the
+    original order.
+    """
+    parses = [None] * len(doc)
+    for bucket, results in iter_buckets(parser, doc, max_tokens):
+        for i, result in zip(bucket, results):
+            parses[i] = result
+    return parses
+
+def format_failure(i, reason, compact=False):
+    """The output of the i-th sentence (1-origin) that failed to be parsed: a <ccg>
+    with the `failure` attribute, or `i<TAB>!reason` in the compact form.
+    """
+    if compact:
+        return "{}\t!{}".format(i, reason)
+    return "<ccgs sentence=\"{0}\">\n<ccg sentence=\"{0}\" id=\"1\" failure=\"{1}\"/>\n</ccgs>".format(
+        i, reason)
+
+def is_failure(output, compact=False):
+    return ("\t!" in output) if compact else ("failure=\"" in output)
+
+def parse_sentences(parser, doc, indices, bucket_tokens=0, compact=False, guard=None):
+    """Parses `doc` and returns the formatted output of each sentence (see
+    `format_sentences`). With `guard`, the length cap and time budget are enforced.
+    """
+    if guard is not None:
+        return guard.parse_sentences(parser, doc, indices, bucket_tokens, compact)
+    parses = parse_in_buckets(parser, doc, bucket_tokens)
+    return format_sentences(parses, doc, indices, compact)
+
+def run_with_timeout(f, seconds):
+    """Runs `f()`, which yields its results one by one, in a forked process that shares
+    the model copy-on-write. Returns the list of the results received in `seconds`, and
+    None if `f` finished, or the reason why it did not: 'timeout', in which case the
+    process is killed, or 'error'.
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Nothing is written to stdout and stderr, which are read by Jigg.
+        os.close(r)
+        status = 1
+        try:
+            with os.fdopen(w, 'wb') as out:
+                for result in f():
+                    data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+                    out.write(struct.pack('>I', len(data)))
+                    out.write(data)
+                    out.flush()
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(w)
+    deadline = time.time() + seconds
+    results, buf = [], b''
+    try:
+        while True:
+            left = deadline - time.time()
+            if left <= 0 or not select.select([r], [], [], left)[0]:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                return results, 'timeout'
+            data = os.read(r, 1 << 16)
+            if not data:
+                break
+            buf += data
+            while len(buf) >= 4:
+                size = struct.unpack('>I', buf[:4])[0]
+                if len(buf) < 4 + size:
+                    break
+                results.append(pickle.loads(buf[4:4 + size]))
+                buf = buf[4 + size:]
+    finally:
+        os.close(r)
+    _, status = os.waitpid(pid, 0)
+    return results, (None if status == 0 and not buf else 'error')
+
+class Guard(object):
+    """A length cap and a time budget for each sentence.
+
+    A sentence longer than `max_tokens` (if > 0) is not parsed. If `timeout` > 0, the
+    sentences are parsed together in a forked process within `timeout` seconds per
+    sentence, and the outputs are sent back bucket by bucket. When the budget runs
+    out, the sentences in the buckets not yet sent back are parsed alone within
+    `timeout` each, and a sentence that still fails is retried with the tighter
+    pruning in `retry` (e.g., {'beta': 0.001, 'pruning_size': 10}). A failed sentence
+    has the output of `format_failure`, so the others are returned in time.
+    """
+
+    def __init__(self, max_tokens=0, timeout=0, retry=None):
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.retry = retry or {}
+
+    def parse_sentences(self, parser, doc, indices, bucket_tokens=0, compact=False):
+        outputs = [None] * len(doc)
+        todo = []
+        for k, (sent, i) in enumerate(zip(doc, indices)):
+            if self.max_tokens > 0 and len(sent.split(' ')) > self.max_tokens:
+                outputs[k] = format_failure(i + 1, 'length', compact)
+            else:
+                todo.append(k)
+        if not todo:
+            return outputs
+
+        def parse(positions, retry=False):
+            """Parses the sentences at `positions`, and returns the outputs of those
+            parsed in time, and None, or the reason of the failure of the others.
+            """
+            def f():
+                if retry:
+                    self._tighten(parser)  # only in the forked process
+                sub = [doc[k] for k in positions]
+                for bucket, parses in iter_buckets(parser, sub, bucket_tokens):
+                    sents = format_sentences(parses, [sub[j] for j in bucket],
+                                             [indices[positions[j]] for j in bucket], compact)
+                    yield [(positions[j], sent) for j, sent in zip(bucket, sents)]
+            if self.timeout <= 0:
+                return list(f()), None
+            return run_with_timeout(f, self.timeout * len(positions))
+
+        results, reason = parse(todo)
+        for bucket in results:
+            for k, output in bucket:
+                outputs[k] = output
+        if reason is None:
+            return outputs
+
+        for k in todo:
+            if outputs[k] is not None:
+                continue
+            results, reason = parse([k])
+            if reason == 'timeout' and self.retry:
+                results, reason = parse([k], retry=True)
+            outputs[k] = results[0][0][1] if reason is None else \
+                format_failure(indices[k] + 1, reason, compact)
+        return outputs
+
+    def check(self, parser):
+        """Drops the settings of `retry` that `parser` does not have, with a warning."""
+        missing = [name for name in self.retry if not hasattr(parser, name)]
+        if missing:
+            sys.stderr.write("depccg: cannot retry with {} on this version\n".format(
+                ", ".join(missing)))
+            self.retry = {k: v for k, v in self.retry.items() if k not in missing}
+
+    def _tighten(self, parser):
+        for name, value in self.retry.items():
+            setattr(parser, name, value)
+
+# The parser shared by the workers of WorkerPool, which is set before forking them.
+_worker_parser = None
+
+def _init_worker():
+    # Each worker parses with one thread, so that the workers do not oversubscribe
+    # the cores.
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+def _parse_chunk(chunk):
+    positions, doc, indices, bucket_tokens, compact, guard = chunk
+    return list(zip(positions, parse_sentences(
+        _worker_parser, doc, indices, bucket_tokens, compact, guard)))
+
+class WorkerPool(object):
+    """Parses with `n` processes forked after the model is loaded, which share the
+    weights copy-on-write, so the memory is about that of one model.
+
+    The sentences of a block are sorted by length and dealt to `n` chunks in turn, so
+    that the chunks have similar lengths; each chunk is parsed and formatted by a worker,
+    and the outputs are returned in the original order.
+    """
+
+    def __init__(self, parser, n):
+        global _worker_parser
+        _worker_parser = parser
+        self.n = n
+        self.pool = multiprocessing.get_context('fork').Pool(n, initializer=_init_worker)
+
+    def parse_sentences(self, doc, indices, bucket_tokens=0, compact=False, guard=None):
+        lengths = [len(sent.split(' ')) for sent in doc]
+        order = sorted(range(len(doc)), key=lambda i: lengths[i])
+        chunks = [(positions, [doc[k] for k in positions], [indices[k] for k in positions],
+                   bucket_tokens, compact, guard)
+                  for positions in (order[k::self.n] for k in range(self.n)) if positions]
+        outputs = [None] * len(doc)
+        for results in self.pool.imap_unordered(_parse_chunk, chunks):
+            for k, output in results:
+                outputs[k] = output
+        return outputs
+
+def reindex(output, old, new, compact=False):
+    """Changes the index of a sentence (1-origin) in its formatted output."""
+    if compact:
+        prefix = "{}\t".format(old)
+        return "\n".join("{}\t{}".format(new, line[len(prefix):])
+                         for line in output.split("\n")) if output else output
+    return output.replace("sentence=\"{}\"".format(old), "sentence=\"{}\"".format(new))
+
+# Arguments that change the output of a sentence, which are a part of the cache key.
+CACHE_SETTINGS = ['lang', 'model', 'config', 'weights', 'nbest', 'beta', 'root_cats',
+                  'unary_penalty', 'pruning_size', 'disable_beta', 'disable_seen_rules',
+                  'disable_category_dictionary', 'max_length', 'max_steps',
+                  'internal_compact']
+
+class ParseCache(object):
+    """An on-disk cache of the formatted output of each sentence in SQLite.
+
+    The key is the parser settings (`CACHE_SETTINGS`) and the tokens of a sentence, and
+    the value is its output formatted as the 0-th sentence (see `reindex`). At most
+    `max_entries` are kept by evicting the least recently used ones. The numbers of
+    hits and misses are printed to stderr at exit, and accumulated in the `stats` table.
+    """
+
+    def __init__(self, path, settings, max_entries=100000, compact=False):
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS parses "
+                          "(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS parses_used ON parses (used)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS stats "
+                          "(name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.commit()
+        settings = json.dumps(settings, sort_keys=True).encode('utf-8')
+        self.prefix = hashlib.sha1(settings).hexdigest() + " "
+        self.max_entries = max_entries
+        self.compact = compact
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        atexit.register(self.close)
+
+    def key(self, sentence):
+        # A sentence is already the tokens joined by spaces, as split by depccg.
+        return self.prefix + sentence
+
+    def parse_sentences(self, parse, doc, indices):
+        """Returns the output of each sentence, which is read from the cache or computed
+        by `parse(doc, indices)` for the missing sentences (each distinct one once).
+        """
+        keys = [self.key(sent) for sent in doc]
+        found = self._get(set(keys))
+        outputs = [None] * len(doc)
+        missing = {}  # key -> positions in doc
+        for k, (key, i) in enumerate(zip(keys, indices)):
+            if key in found:
+                outputs[k] = reindex(found[key], 0, i + 1, self.compact)
+                self.stats['hits'] += 1
+            else:
+                missing.setdefault(key, []).append(k)
+                self.stats['misses'] += 1
+
+        if missing:
+            first = [positions[0] for positions in missing.values()]
+            parsed = parse([doc[k] for k in first], [indices[k] for k in first])
+            values = []
+            for positions, output in zip(missing.values(), parsed):
+                value = reindex(output, indices[positions[0]] + 1, 0, self.compact)
+                if not is_failure(value, self.compact):  # may succeed next time
+                    values.append((keys[positions[0]], value))
+                for k in positions:
+                    outputs[k] = reindex(value, 0, indices[k] + 1, self.compact)
+            self._put(values)
+        self.conn.commit()
+        return outputs
+
+    def _get(self, keys):
+        keys = list(keys)
+        found = {}
+        for b in range(0, len(keys), 500):  # SQLite limits the number of variables
+            chunk = keys[b:b + 500]
+            found.update(self.conn.execute(
+                "SELECT key, value FROM parses WHERE key IN ({})".format(
+                    ",".join("?" * len(chunk))), chunk))
+        now = time.time()
+        self.conn.executemany("UPDATE parses SET used = ? WHERE key = ?",
+                              [(now, key) for key in found])
+        return found
+
+    def _put(self, values):
+        now = time.time()
+        self.conn.executemany("INSERT OR REPLACE INTO parses VALUES (?, ?, ?)",
+                              [(key, value, now) for key, value in values])
+        (size,) = self.conn.execute("SELECT COUNT(*) FROM parses").fetchone()
+        if size > self.max_entries:
+            self.conn.execute("DELETE FROM parses WHERE key IN "
+                              "(SELECT key FROM parses ORDER BY used LIMIT ?)",
+                              (size - self.max_entries,))
+            self.stats['evictions'] += size - self.max_entries
+
+    def close(self):
+        for name, value in self.stats.items():
+            self.conn.execute("INSERT OR IGNORE INTO stats VALUES (?, 0)", (name,))
+            self.conn.execute("UPDATE stats SET value = value + ? WHERE name = ?",
+                              (value, name))
+        self.conn.commit()
+        self.conn.close()
+        total = self.stats['hits'] + self.stats['misses']
+        try:
+            sys.stderr.write("depccg cache: {} hits, {} misses ({:.1f}% hit), "
+                             "{} evictions\n".format(
+                                 self.stats['hits'], self.stats['misses'],
+                                 100.0 * self.stats['hits'] / total if total else 0.0,
+                                 self.stats['evictions']))
+            sys.stderr.flush()
+        except (IOError, ValueError):
+            pass  # Jigg may have closed the stream
+
+def input_and_parse(parse):
     try:
         while True:
+            # A block may contain the sentences of many documents; Jigg sends all
+            # sentences to be annotated at once.
             doc = []
             while True:
                 line = input()
                 if line == "####EOD####": break
                 doc.append(line)
 
-            tagged_doc = annotate_fun([[word for word in sent.split(' ')]
-                                       for sent in doc],
-                                      tokenize=None)
-            parses = parser.parse_doc(doc)
-            print_xml(parses, tagged_doc)
+            print(parse(doc))
             print("END")
     except EOFError:
         pass
 
+def serve_framed(parse):
+    # A request is a block of sentences, one per line.
+    jigg_io.serve(lambda payload: parse(payload.split('\n')))
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser('depccg python wrapper in Jigg')
 
     parser.add_argument('--lang', default='en', choices=['ja', 'en'])
     parser.add_argument('--internal-model', default=None)
     parser.add_argument('--internal-nbest', default=1, type=int)
+    parser.add_argument('--internal-bucket-tokens', default=0, type=int,
+                        help='parse sentences sorted by length in buckets of at most '
+                        'this number of (padded) tokens; 0 parses all sentences at once')
+    parser.add_argument('--internal-framed', action='store_true',
+                        help='communicate with Jigg by frames (see jigg_io.py)')
+    parser.add_argument('--internal-compact', action='store_true',
+                        help='output derivations in the compact form instead of XML')
+    parser.add_argument('--internal-workers', default=1, type=int,
+                        help='if > 1, fork this number of workers after loading the model '
+                        'and parse the sentences of a block in parallel (CPU only)')
+    parser.add_argument('--internal-cache', default=None,
+                        help='path to a SQLite file to cache the output of each sentence')
+    parser.add_argument('--internal-cache-size', default=100000, type=int,
+                        help='maximum number of sentences in the cache')
+    parser.add_argument('--internal-max-tokens', default=0, type=int,
+                        help='do not parse a sentence longer than this (0 for no limit)')
+    parser.add_argument('--internal-timeout', default=0, type=float,
+                        help='time budget in seconds for each sentence (0 for no limit)')
+    parser.add_argument('--internal-retry-beta', default=None, type=float,
+                        help='beta to retry a sentence that runs out of time')
+    parser.add_argument('--internal-retry-pruning-size', default=None, type=int,
+                        help='pruning size to retry a sentence that runs out of time')
 
     add_common_parser_arguments(parser)
 
@@ -99,6 +526,39 @@ if __name__ == '__main__':
     args.model = args.internal_model or args.model
     args.nbest = args.internal_nbest if args.internal_nbest != 1 else args.nbest
 
+    if args.internal_workers > 1 and args.gpu >= 0:
+        parser.error('--internal-workers cannot be used with --gpu')
+
+    settings = {k: getattr(args, k, None) for k in CACHE_SETTINGS}
     parser = build_parser(args)
 
-    input_and_parse(parser)
+    bucket_tokens, compact = args.internal_bucket_tokens, args.internal_compact
+    guard = None
+    if args.internal_max_tokens > 0 or args.internal_timeout > 0:
+        retry = {'beta': args.internal_retry_beta,
+                 'pruning_size': args.internal_retry_pruning_size}
+        guard = Guard(args.internal_max_tokens, args.internal_timeout,
+                      {k: v for k, v in retry.items() if v is not None})
+        guard.check(parser)
+
+    if args.internal_workers > 1:
+        pool = WorkerPool(parser, args.internal_workers)
+        parse = lambda doc, indices: pool.parse_sentences(
+            doc, indices, bucket_tokens, compact, guard)
+    else:
+        parse = lambda doc, indices: parse_sentences(
+            parser, doc, indices, bucket_tokens, compact, guard)
+
+    if args.internal_cache:
+        cache = ParseCache(args.internal_cache, settings, args.internal_cache_size, compact)
+        parse_without_cache = parse
+        parse = lambda doc, indices: cache.parse_sentences(parse_without_cache, doc, indices)
+        # Exit normally when Jigg terminates the process, so that the cache is closed.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    parse_and_format = lambda doc: join_output(parse(doc, list(range(len(doc)))), compact)
+
+    if args.internal_framed:
+        serve_framed(parse_and_format)
+    else:
+        input_and_parse(parse_and_format)
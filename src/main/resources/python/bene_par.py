@@ -4,6 +4,8 @@ import sys
 
 import benepar
 
+import jigg_io
+
 # In Python2, wrap sys.stdin and sys.stdout to work with unicode.
 if sys.version_info[0] < 3:
     import codecs
@@ -15,23 +17,82 @@ if sys.version_info[0] < 3:
 if sys.version_info.major == 3:
     raw_input = input
 
-model = sys.argv[1] # maybe "benepar_en"
+EOD = '####EOD####'
+
+model = sys.argv[1] # maybe "benepar_en2"
+options = sys.argv[2:]
+framed = '--framed' in options
+compact = '--compact' in options
+batch_size = 64
+if '--batch-size' in options:
+    batch_size = int(options[options.index('--batch-size') + 1])
+
+parser = benepar.Parser(model, batch_size=batch_size)
 
-parser = benepar.Parser(model)
+def parse_all(sentences, make_output):
+    '''Parses a list of (tokens, tags) and returns the outputs in the same order.
 
-def parse(tokens, tags):
-    sentence = list(zip(tokens, tags))
-    parse_raw, tags_raw, sentence = next(parser._batched_parsed_raw([(tokens, sentence)]))
+    The sentences are sorted by length before being given to the parser, which
+    makes batches of `batch_size` sentences, so that each batch has little padding.
+    `make_output(sentence, tags_raw, parse_raw)` makes the output of each parse.
+    '''
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i][0]))
+    pairs = ((sentences[i][0], list(zip(*sentences[i]))) for i in order)
+    outputs = [None] * len(sentences)
+    for i, (parse_raw, tags_raw, sentence) in zip(order, parser._batched_parsed_raw(pairs)):
+        outputs[i] = make_output(sentence, tags_raw, parse_raw)
+    return outputs
+
+def format_tree(sentence, tags_raw, parse_raw):
+    # One tree per line.
     tree = parser._make_nltk_tree(sentence, tags_raw, *parse_raw)
-    return tree
+    return tree.pformat(margin=sys.maxsize)
+
+def format_compact(sentence, tags_raw, parse_raw):
+    '''Formats a parse as the POS tags and the labeled spans, separated by a tab:
+
+        PRP VBD NN .\t0 4 S 0 1 NP 1 3 VP
+
+    Each span is `begin end label` over token positions (end is exclusive), in
+    preorder; a unary chain is the spans of the same range from the top. This reads
+    the decoder output directly, as `_make_nltk_tree` does, without building a tree.
+    '''
+    if tags_raw is None:
+        tags = [tag for _, tag in sentence]
+    else:
+        tags = [parser._tag_vocab[tags_raw[i]] for i in range(len(sentence))]
+    _, p_i, p_j, p_label = parse_raw
+    spans = []
+    for i, j, label_idx in zip(p_i, p_j, p_label):
+        # Binarized nodes have an empty label and are skipped.
+        for sublabel in parser._label_vocab[label_idx]:
+            spans.append('%d %d %s' % (i, j, sublabel))
+    return ' '.join(tags) + '\t' + ' '.join(spans)
+
+make_output = format_compact if compact else format_tree
+
+def read_sentences(lines):
+    # A document is the pairs of the tokens line and the tags line.
+    sentences = []
+    for tokens, tags in zip(lines[0::2], lines[1::2]):
+        sentences.append((tokens.split(' '), tags.split(' ')))
+    return sentences
 
-while True:
-    tokens = raw_input()
-    tags = raw_input()
+def parse_request(payload):
+    lines = payload.split('\n') if payload else []
+    return '\n'.join(parse_all(read_sentences(lines), make_output))
 
-    tokens = tokens.split(' ')
-    tags = tags.split(' ')
+if framed:
+    jigg_io.serve(parse_request)
+else:
+    while True:
+        lines = []
+        while True:
+            line = raw_input()
+            if line == EOD: break
+            lines.append(line)
 
-    tree = parse(tokens, tags)
-    print(tree)
-    print("END")
+        for output in parse_all(read_sentences(lines), make_output):
+            print(output)
+        print("END")
+        sys.stdout.flush()
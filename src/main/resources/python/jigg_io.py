@@ -0,0 +1,113 @@
+"""The framed protocol between Jigg and the python wrappers.
+
+See `Frame` in IOCommunicator.scala. A frame is a header line `KIND id nbytes`,
+followed by the payload of `nbytes` bytes in UTF-8 and a newline. Jigg sends requests
+(`REQ`), and a wrapper answers each by a response (`RES`) or an error (`ERR`) with the
+same id. Since a payload may contain any string, no sentinel such as `END` is needed.
+
+Usage in a wrapper:
+
+    import jigg_io
+    jigg_io.serve(lambda payload: process(payload))
+"""
+
+from __future__ import print_function, unicode_literals
+import sys
+import threading
+import traceback
+from multiprocessing.pool import ThreadPool
+
+REQUEST = 'REQ'
+RESPONSE = 'RES'
+ERROR = 'ERR'
+READY = 'READY'
+
+
+def _binary(stream):
+    # sys.stdin.buffer in Python3; in Python2 the stream may be wrapped by codecs.
+    return getattr(stream, 'buffer', getattr(stream, 'stream', stream))
+
+
+class FrameChannel(object):
+    """Reads and writes frames on binary streams (stdin and stdout in default)."""
+
+    def __init__(self, input=None, output=None):
+        self.input = input or _binary(sys.stdin)
+        self.output = output or _binary(sys.stdout)
+
+    def read(self):
+        """Returns the next frame as (kind, id, payload), or None at the end of input.
+        Blank lines between frames are skipped.
+        """
+        while True:
+            line = self.input.readline()
+            if not line:
+                return None
+            fields = line.split()
+            if fields:
+                break
+        if len(fields) != 3:
+            raise ValueError('Invalid frame header: {!r}'.format(line))
+        kind, id, n = fields[0].decode('ascii'), int(fields[1]), int(fields[2])
+        payload = self.input.read(n)
+        if len(payload) < n:
+            return None
+        self.input.readline()  # the newline after the payload
+        return kind, id, payload.decode('utf-8')
+
+    def write(self, kind, id, payload):
+        data = payload.encode('utf-8')
+        header = '{} {} {}\n'.format(kind, id, len(data)).encode('ascii')
+        # One write per frame, so that frames of threads are not interleaved.
+        self.output.write(header + data + b'\n')
+        self.output.flush()
+
+    def write_line(self, line):
+        self.output.write((line + '\n').encode('utf-8'))
+        self.output.flush()
+
+
+def _answer(handle, id, payload):
+    try:
+        return RESPONSE, id, handle(payload)
+    except Exception:
+        return ERROR, id, traceback.format_exc()
+
+
+def serve(handle, channel=None, threads=1):
+    """Answers each request with `handle(payload)`, which returns a string, until the
+    input ends.
+
+    If `handle` raises an exception, its traceback is sent as an error frame and the
+    serving continues. Jigg may write several requests before reading the responses;
+    they are buffered in stdin and answered in order. With `threads > 1`, requests are
+    handled concurrently by a pool of threads and answered as they finish, so `handle`
+    must be thread-safe. `READY` is written first to tell Jigg that the wrapper is
+    loaded. Outputs of `print` (e.g., by a library) are sent to stderr so that they do
+    not break the frames; Jigg keeps stderr of a framed process apart from its stdout
+    (see `mergeErrorStream` in IOCommunicator.scala).
+    """
+    channel = channel or FrameChannel()
+    sys.stdout = sys.stderr
+    lock = threading.Lock()
+
+    def write(frame):
+        with lock:
+            channel.write(*frame)
+
+    pool = ThreadPool(threads) if threads > 1 else None
+    channel.write_line(READY)
+    while True:
+        frame = channel.read()
+        if frame is None:
+            break
+        kind, id, payload = frame
+        if kind != REQUEST:
+            write((ERROR, id, 'Unexpected frame: {}'.format(kind)))
+        elif pool is None:
+            write(_answer(handle, id, payload))
+        else:
+            pool.apply_async(_answer, (handle, id, payload), callback=write)
+    if pool is not None:
+        pool.close()
+        pool.join()
@@ -1,8 +1,12 @@
 
 from __future__ import print_function, unicode_literals
 import sys
+import threading
+from multiprocessing.pool import ThreadPool
 
-from ufal.udpipe import Model, Pipeline, ProcessingError
+from ufal.udpipe import InputFormat, Model, OutputFormat, Pipeline, ProcessingError, Sentence
+
+import jigg_io
 
 # In Python2, wrap sys.stdin and sys.stdout to work with unicode.
 if sys.version_info[0] < 3:
@@ -20,6 +24,12 @@ _MODE_ = ['all', 'tok|pos', 'pos|par', 'tok', 'pos', 'par']
 
 model = sys.argv[1]
 mode = sys.argv[2] # one of _MODE_
+options = sys.argv[3:]
+framed = '--framed' in options
+stream = '--stream' in options
+threads = 1
+if '--threads' in options:
+    threads = int(options[options.index('--threads') + 1])
 
 model = Model.load(model)
 
@@ -33,17 +43,88 @@ else: pos = Pipeline.NONE
 if mode == 'all' or mode.find('par') >= 0: parse = Pipeline.DEFAULT
 else: parse = Pipeline.NONE
 
-pipeline = Pipeline(
-    model, input_format, pos, parse, output_format)
-error = ProcessingError()
+# A Model is thread-safe and shared by all threads, while a Pipeline is not; each
+# thread makes its own Pipeline on the first document.
+local = threading.local()
+
+def process(text, strict=True):
+    if not hasattr(local, 'pipeline'):
+        local.pipeline = Pipeline(model, input_format, pos, parse, output_format)
+        local.error = ProcessingError()
+    result = local.pipeline.process(text, local.error)
+    if strict and local.error.occurred():
+        raise RuntimeError(local.error.message)
+    return result
+
+def read_documents():
+    while True:
+        inputs = []
+        while True:
+            try:
+                line = raw_input()
+            except EOFError:
+                return
+            if line == '####EOD####': break
+            inputs.append(line)
+        yield '\n'.join(inputs)
+
+def stream_sentences():
+    '''Tags and parses pre-tokenized CoNLL-U inputs one sentence at a time, without a
+    Pipeline (and its tokenizer), and writes each sentence as soon as it is processed.
+
+    Only one sentence is kept in memory, and each sentence is flushed as soon as it is
+    written, so Jigg reads the results while writing the rest of a document. An error
+    is written to stderr, which Jigg keeps apart from the results in this mode.
+    '''
+    reader = InputFormat.newConlluInputFormat()
+    writer = OutputFormat.newConlluOutputFormat()
+    error = ProcessingError()
 
-while True:
-    inputs = []
+    def process_sentence(lines):
+        reader.setText('\n'.join(lines) + '\n\n')
+        sentence = Sentence()
+        if not reader.nextSentence(sentence, error):
+            return
+        if pos == Pipeline.DEFAULT:
+            model.tag(sentence, Model.DEFAULT, error)
+        if parse == Pipeline.DEFAULT:
+            model.parse(sentence, Model.DEFAULT, error)
+        if error.occurred():
+            print(error.message, file=sys.stderr)
+        sys.stdout.write(writer.writeSentence(sentence))
+        sys.stdout.flush()
+
+    lines = []
     while True:
-        line = raw_input()
-        if line == '####EOD####': break
-        inputs.append(line)
+        try:
+            line = raw_input()
+        except EOFError:
+            return
+        if line == '####EOD####' or not line.strip():
+            if lines:
+                process_sentence(lines)
+                lines = []
+            if line == '####EOD####':
+                print('END')
+                sys.stdout.flush()
+        else:
+            lines.append(line)
+
+def process_lines(text):
+    return process(text, strict=False)
 
-    result = pipeline.process('\n'.join(inputs), error)
-    print(result)
-    print('END')
+if framed:
+    # A request is the input of a document.
+    jigg_io.serve(process, threads=threads)
+elif stream and input_format == 'conllu':
+    stream_sentences()
+else:
+    if threads > 1:
+        # Documents are read by the pool while the results are written in order.
+        results = ThreadPool(threads).imap(process_lines, read_documents())
+    else:
+        results = (process_lines(text) for text in read_documents())
+    for result in results:
+        print(result)
+        print('END')
+        sys.stdout.flush()
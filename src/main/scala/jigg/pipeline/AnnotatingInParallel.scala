@@ -45,9 +45,13 @@ trait AnnotatingInParallel extends Annotator { self=>
 
   type A <: BaseLocalAnnotator
 
-  trait BaseLocalAnnotator extends Annotator {
+  trait BaseLocalAnnotator extends EasyIO {
     override final def name = self.name
     override final def nThreads = 1
+    // A local annotator has no properties, so its processes, if any, are supervised
+    // with the settings of this annotator.
+    override def maxRestarts = EasyIO.maxRestarts(self)
+    override def prespawn = EasyIO.prespawn(self)
   }
 
   // We don't create local annotator here, since each local annotator may depend on
@@ -94,11 +98,17 @@ trait AnnotatingInParallel extends Annotator { self=>
 
   // protected def annotateSeq(annotations: Seq[Node], annotator: A): Seq[Node]
 
-  // TODO
-  private def annotateErrorToBatch(original: Seq[Node], error: Throwable): Seq[Node] = {
-    throw error
-    // original
-  }
+  /** A batch that failed because the process of the local annotator died again after
+    * restarting (see EasyIO) is annotated with the error, as SentencesAnnotator does
+    * for a sentence. Other errors are thrown.
+    */
+  private def annotateErrorToBatch(original: Seq[Node], error: Throwable): Seq[Node] =
+    error match {
+      case e: ProcessDiedError =>
+        System.err.println(s"Failed to annotate ${original.size} elements by $name.")
+        original map (Annotator.annotateError(_, name, e))
+      case e => throw e
+    }
 }
 
 trait AnnotatingSentencesInParallel extends AnnotatingInParallel {
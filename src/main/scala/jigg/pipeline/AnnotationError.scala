@@ -19,3 +19,8 @@ package jigg.pipeline
 class AnnotationError(msg: String) extends RuntimeException(msg)
 
 class ProcessError(msg: String) extends AnnotationError(msg)
+
+/** The supervised process of an annotator died, and could not be restarted any more for
+  * the inputs (see EasyIO).
+  */
+class ProcessDiedError(msg: String) extends ProcessError(msg)
@@ -19,14 +19,19 @@ package jigg.pipeline
 import java.io._
 import java.lang.{Process, ProcessBuilder}
 import java.util.Properties
-import java.util.concurrent.LinkedBlockingQueue
+import java.util.concurrent.{Executors, LinkedBlockingQueue, ThreadFactory}
 import scala.xml.{Node, Elem}
 import scala.reflect.ClassTag
 import scala.collection.GenSeq
+import scala.collection.mutable
+import scala.collection.mutable.ArrayBuffer
 import scala.collection.JavaConverters._
 import scala.collection.parallel.ForkJoinTaskSupport
+import scala.concurrent.{Await, ExecutionContext, Future, blocking}
+import scala.concurrent.duration.Duration
 import scala.concurrent.forkjoin.ForkJoinPool
-import jigg.util.PropertiesUtil
+import scala.util.Try
+import jigg.util.{Metrics, PropertiesUtil}
 import jigg.util.XMLUtil.RichNode
 
 trait Annotator extends PropsHolder {
@@ -171,24 +176,88 @@ trait EasyIO extends Annotator {
 
   def mkIO(communicator: IOCommunicator): IO = new IO(communicator)
 
-  class IO(val communicator: IOCommunicator) {
+  /** Start a new process to replace a dead one; None if this annotator cannot. IO is
+    * supervised only if this is given (see IO). IOCreator gives `mkCommunicator`.
+    */
+  protected def respawn: Option[()=>IOCommunicator] = None
+
+  /** The number of times a dead process is restarted to retry the same input. A process
+    * dying again with the retried input is regarded as an error of the input.
+    */
+  def maxRestarts: Int = EasyIO.maxRestarts(this)
+
+  /** If true, processes are started in background threads, so that an annotator can
+    * load its models while the processes are started, and a spare process is kept
+    * ready for restarting a dead one (which doubles the number of processes).
+    */
+  def prespawn: Boolean = EasyIO.prespawn(this)
+
+  protected def startInBackground(start: ()=>IOCommunicator): Future[IOCommunicator] =
+    Future(blocking(start()))(EasyIO.ioContext)
+
+  /** The process of IO is supervised if `respawn` is given: if it is found dead before
+    * writing an input, it is restarted, and if it dies before the output of the
+    * inputs written so far is read, it is restarted and the inputs are written again,
+    * at most `maxRestarts` times for the same inputs. Inputs written by `communicator`
+    * directly (not through IO) are not retried.
+    */
+  class IO(started: Future[IOCommunicator]) {
 
-    def close() = communicator.closeResource()
+    def this(communicator: IOCommunicator) = this(Future.successful(communicator))
 
-    def safeWriteWithFlush(text: String) =
-      errorIfFailWriting(communicator.safeWriteWithFlush(text))
+    @volatile private[this] var current = started
+
+    private[this] var spare: Option[Future[IOCommunicator]] =
+      if (prespawn) respawn map startInBackground else None
+
+    // The inputs written since the last output was read, and the number of restarts
+    // for them.
+    private[this] val inFlight = new ArrayBuffer[String]
+    private[this] var restarts = 0
+
+    // When the last input was written; used to measure the round-trip time.
+    private[this] var writtenAt = 0L
+
+    private[this] var nextFrameId = 0L
+
+    /** The current process; this waits for the process started in background. */
+    def communicator: IOCommunicator = Await.result(current, Duration.Inf)
+
+    def close() = {
+      communicator.closeResource()
+      for (s <- spare; c <- Try(Await.result(s, Duration.Inf))) c.closeResource()
+    }
 
-    def safeWriteWithFlush(lines: TraversableOnce[String]) =
-      errorIfFailWriting(communicator.safeWriteWithFlush(lines))
+    def safeWriteWithFlush(text: String) = write(Seq(text), true)
 
-    def safeWrite(lines: TraversableOnce[String]) =
-      errorIfFailWriting(communicator.safeWrite(lines))
+    def safeWriteWithFlush(lines: TraversableOnce[String]) = write(lines, true)
+
+    def safeWrite(lines: TraversableOnce[String]) = write(lines, false)
+
+    private def write(lines: TraversableOnce[String], flush: Boolean) = {
+      markWritten()
+      val toWrite = respawn match {
+        case Some(_) =>
+          if (inFlight.isEmpty) checkHealth()
+          val buffered = lines.toVector
+          inFlight ++= buffered
+          buffered
+        case None => lines
+      }
+      def send() =
+        if (flush) communicator.safeWriteWithFlush(toWrite)
+        else communicator.safeWrite(toWrite)
+      send() match {
+        case Left(e: IOException) if canRestart(inFlight.nonEmpty) => restart()
+        case result => errorIfFailWriting(result)
+      }
+    }
 
     /** Similar to readUntil, but first check whether the first line matches
       * to the predicate in `firstLine`. If not, throw an argumentError.
       */
     def readUntilIf(firstLine: String=>Boolean, lastLine: String=>Boolean) =
-      errorIfLeftOutput(communicator.readUntilIf(firstLine, lastLine, _==null))
+      observeRoundTrip(read(_.readUntilIf(firstLine, lastLine, _==null)))
 
     /** Reads until lastLine is detected. The matched line will be in in the last
       * index. Throw an argumentError if null line is detected.
@@ -196,15 +265,136 @@ trait EasyIO extends Annotator {
       * Assume that the successful last line is something except null, e.g., EOS.
       */
     def readUntil(lastLine: String=>Boolean) =
-      errorIfLeftOutput(communicator.readUntil(lastLine, _==null))
+      observeRoundTrip(read(_.readUntil(lastLine, _==null)))
+
+    private def read(
+      reading: IOCommunicator=>Either[(Seq[String], Iterator[String]), Seq[String]])
+        : Seq[String] = reading(communicator) match {
+      case Left((lines, _)) if outputEnded(lines) && canRestart(inFlight.nonEmpty) =>
+        restart()
+        read(reading)
+      case output =>
+        finished()
+        errorIfLeftOutput(output)
+    }
+
+    /** Send `payloads` as request frames, and return the responses in the same order.
+      * This is for the processes that support the framed protocol (see Frame).
+      * Throw an AnnotationError if the process returns an error frame for some request,
+      * after reading the responses to the others.
+      *
+      * The frames are written by another thread while the responses are read, since
+      * the process may write the responses before reading all the requests; waiting
+      * for the writing would block both when the payloads are larger than the pipes.
+      */
+    def request(payloads: Seq[String]): Seq[String] = {
+      if (respawn.nonEmpty) checkHealth()
+      val frames = payloads map { p => nextFrameId += 1; Frame(Frame.Request, nextFrameId, p) }
+      markWritten()
+
+      val responses = mutable.Map[Long, String]()
+      val errors = new ArrayBuffer[String]
+      def send(): Future[Either[Throwable, Unit]] = {
+        responses.clear()
+        errors.clear()
+        val c = communicator
+        Future(c.safeWriteFrames(frames))(EasyIO.ioContext)
+      }
+      var writing = send()
+      while (responses.size + errors.size < frames.size) communicator.readFrame() match {
+        case Right(Frame(Frame.Response, id, payload)) => responses(id) = payload
+        case Right(Frame(_, id, msg)) => errors += msg
+        case Left(output) =>
+          // The output ended, so the process is dead or useless; stop the writing.
+          if (!writing.isCompleted) Try(communicator.closeResource())
+          Await.ready(writing, Duration.Inf)
+          if (canRestart(true)) {
+            restart()
+            writing = send()
+          } else {
+            finished()
+            Await.result(writing, Duration.Inf) match {
+              case Left(e) if !e.isInstanceOf[IOException] => throw e
+              case _ => throw processError(output mkString "\n", true)
+            }
+          }
+      }
+      finished()
+      errorIfFailWriting(Await.result(writing, Duration.Inf))
+      if (errors.nonEmpty) throw new AnnotationError(errors mkString "\n")
+      observeRoundTrip(frames map { f => responses(f.id) })
+    }
+
+    def request(payload: String): String = request(Seq(payload)).head
+
+    /** Restart the process if it has died since the last input, e.g., by a signal. */
+    private def checkHealth() = if (!communicator.isAlive) {
+      System.err.println(s"The process of $name has exited. Restarting it.")
+      replace()
+    }
+
+    /** This is called only when the process is dying, i.e., its output has ended or
+      * its input is broken, so it exits soon if it is not restartable.
+      */
+    private def canRestart(pending: Boolean) =
+      respawn.nonEmpty && pending && restarts < maxRestarts && communicator.waitForExit(1000)
+
+    /** Whether `lines`, read until an error, end with the end of the output. */
+    private def outputEnded(lines: Seq[String]) = lines.lastOption.exists(_ == null)
+
+    /** ProcessDiedError if the process is supervised and has died, since it could not
+      * be restarted any more.
+      */
+    private def processError(msg: String, died: Boolean): ProcessError =
+      if (died && respawn.nonEmpty) new ProcessDiedError(msg) else new ProcessError(msg)
+
+    /** Restart the dead process, and write the inputs in flight again. */
+    private def restart(): Unit = {
+      restarts += 1
+      System.err.println(s"The process of $name died. Restarting it to retry the input ($restarts/$maxRestarts).")
+      replace()
+      if (inFlight.nonEmpty) communicator.safeWriteWithFlush(inFlight) match {
+        case Left(e: IOException) if canRestart(true) => restart()
+        case result => errorIfFailWriting(result)
+      }
+    }
+
+    private def replace() = {
+      PipelineMetrics.processRestarts.inc("annotator" -> name)
+      Try(communicator.closeResource())
+      val start = respawn.get
+      current = spare match {
+        case Some(s) =>
+          spare = Some(startInBackground(start))
+          s
+        case None => Future.successful(start())
+      }
+    }
+
+    private def finished() = {
+      inFlight.clear()
+      restarts = 0
+    }
+
+    private def markWritten() = if (writtenAt == 0L) writtenAt = System.nanoTime
+
+    private def observeRoundTrip(output: Seq[String]): Seq[String] = {
+      if (writtenAt != 0L) {
+        PipelineMetrics.processRoundTripSeconds.observe(
+          Metrics.secondsSince(writtenAt), "annotator" -> name)
+        writtenAt = 0L
+      }
+      output
+    }
 
     private def errorIfFailWriting(writeResult: Either[Throwable, Unit]): Unit =
       writeResult match {
         case Left(e: IOException) =>
           // Failing to write means that process is dead, so we can safely read remaining
           // inputs. Is this always true?
+          finished()
           val remainingMsg = communicator readAll() mkString "\n"
-          throw new ProcessError(remainingMsg)
+          throw processError(remainingMsg, true)
         case Left(e) => throw e
         case _ =>
       }
@@ -216,7 +406,7 @@ trait EasyIO extends Annotator {
         case Left((partial, iter)) =>
           val remainingMsg =
             partial.dropRight(1).mkString("\n") + readRemaining(iter)
-          throw new ProcessError(remainingMsg)
+          throw processError(remainingMsg, outputEnded(partial))
       }
   }
 
@@ -228,6 +418,30 @@ trait EasyIO extends Annotator {
   def readRemaining(iter: Iterator[String]): String = ""
 }
 
+object EasyIO {
+
+  def maxRestarts(annotator: Annotator): Int =
+    annotator.prop("maxRestarts").map(_.toInt) getOrElse (
+      PropertiesUtil.findProperty("maxRestarts", annotator.props).map(_.toInt) getOrElse 1)
+
+  def prespawn(annotator: Annotator): Boolean =
+    PropertiesUtil.getBoolean(annotator.name + ".prespawn", annotator.props) orElse (
+      PropertiesUtil.getBoolean("prespawn", annotator.props)) getOrElse false
+
+  /** The threads writing to (or starting) processes in the background. These are not
+    * taken from the global ExecutionContext, whose threads may all be reading the
+    * outputs of processes, which would then wait for the writing forever.
+    */
+  lazy val ioContext: ExecutionContext = ExecutionContext.fromExecutorService(
+    Executors.newCachedThreadPool(new ThreadFactory {
+      def newThread(r: Runnable) = {
+        val t = new Thread(r, "jigg-io")
+        t.setDaemon(true)
+        t
+      }
+    }))
+}
+
 /** This trait provides `mkIO()` and `mkCommunicator()`, an easy way to instantiate IO
   * object in EasyIO. `mkCommunicator()` is implemented so that it throws an error
   * message pointing to the software URL when failed to launch the process.
@@ -243,10 +457,17 @@ trait IOCreator extends EasyIO {
 
   def softwareUrl: String
 
-  def mkIO(): IO = mkIO(mkCommunicator()) // new IO(mkCommunicator())
+  def mkIO(): IO =
+    if (prespawn) new IO(startInBackground(mkCommunicator _))
+    else mkIO(mkCommunicator()) // new IO(mkCommunicator())
 
   def mkCommunicator(): IOCommunicator = new InstructiveProcessCommunicator
 
+  /** See ProcessCommunicator; should be false if the process speaks the framed protocol. */
+  def mergeErrorStream: Boolean = true
+
+  override protected def respawn = Some(mkCommunicator _)
+
   def launchErrorMessage = {
     val commandName = makeFullName("command")
     s"""
@@ -261,6 +482,8 @@ trait IOCreator extends EasyIO {
     def cmd = command
     def args = defaultArgs
 
+    override def mergeErrorStream = IOCreator.this.mergeErrorStream
+
     override def startError(e: Throwable) = launchError(launchErrorMessage)
 
     override def checkStartError() = for (LaunchTester(i, u, c) <- launchTesters) {
@@ -294,6 +517,11 @@ $msg
     */
   def launchTesters: Seq[LaunchTester] = Seq()
 
+  /** The launch tester for a process that speaks the framed protocol, which writes
+    * `Frame.Ready` when it starts to serve (see `jigg_io.py` in `resources/python`).
+    */
+  def framedLaunchTester = LaunchTester("", _ == Frame.Ready, _ == Frame.Ready)
+
   /** A tuple of:
     *
     * input = example input;
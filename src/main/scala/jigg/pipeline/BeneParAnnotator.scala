@@ -34,6 +34,9 @@ class BeneParAnnotator(override val name: String, override val props: Properties
   @Prop(gloss = "Path to 'activate' script of the virtual environment that you wish to run on depccg") var venv = ""
   @Prop(gloss = "Model name (should be installed)") var model = "benepar_en2"
   @Prop(gloss = "If true, launch multiple instances of the parsers for sentence-level parallel parsing") var parallel = false
+  @Prop(gloss = "If true, communicate with benepar by length-prefixed frames instead of lines") var framed = false
+  @Prop(gloss = "If true, benepar outputs labeled spans instead of tree strings (faster)") var compact = false
+  @Prop(gloss = "Number of sentences parsed at once by benepar; sentences are sorted by length before batching") var batchSize = 64
   readProps()
 
   override def nThreads = if (parallel) super.nThreads else 1
@@ -73,6 +76,24 @@ class BeneParAnnotator(override val name: String, override val props: Properties
     one benepar instances, following the global setting of "-nThreads" option. You can also
     customize the number of instances for this annotator, by setting "-${name}.nThreads".
     For example, to use two instances, set "-${name} parallel -${name}.nThreads 2".
+
+  Batching:
+    All sentences given to an instance (with "-${name}.parallel", its share of the
+    sentences of all documents) are sent to benepar at once, which sorts them by length and
+    parses them in batches of "-${name}.batchSize" sentences (default: 64). Batches of
+    similar lengths need little padding, which makes parsing several times faster on CPU
+    than parsing one sentence at a time. A larger value may be faster but uses more memory.
+
+  Compact output:
+    With "-${name}.compact true", benepar outputs the POS tags and the labeled spans of each
+    parse, taken directly from the decoder, instead of a bracketed tree, e.g.,
+      PRP VBD NN .<TAB>0 4 S 0 1 NP 1 3 VP
+    Neither benepar nor this annotator builds a tree object then. The result is the same.
+
+  Framed protocol:
+    With "-${name}.framed true", inputs and outputs are exchanged as frames prefixed by
+    the byte length instead of lines ending with "END", so that the output is read without
+    scanning every line. A process error is also reported for each call.
 """
 
   override def init() = {
@@ -83,13 +104,14 @@ class BeneParAnnotator(override val name: String, override val props: Properties
 
   def mkLocalAnnotator = new LocalBeneParAnnotator
 
-  class LocalBeneParAnnotator extends SentencesAnnotator with LocalAnnotator with IOCreator {
+  class LocalBeneParAnnotator extends LocalAnnotator with IOCreator {
 
     // Avoid reading resource at test time.
     lazy val script: File = ResourceUtil.readPython("bene_par.py")
     def command = {
       val venvcommand = if (venv == "") "" else s"source ${venv} && "
-      venvcommand + s"python ${script.getPath} ${model}"
+      venvcommand + s"python ${script.getPath} ${model} --batch-size ${batchSize}" +
+        (if (framed) " --framed" else "") + (if (compact) " --compact" else "")
     }
 
     def mkScript(): File = {
@@ -104,23 +126,54 @@ class BeneParAnnotator(override val name: String, override val props: Properties
       script
     }
 
-    override def launchTesters = Seq(
-      LaunchTester("a\nNN", _ == "END", _ == "END"))
+    override def launchTesters =
+      if (framed) Seq(framedLaunchTester)
+      else Seq(LaunchTester("a\nNN\n####EOD####", _ == "END", _ == "END"))
 
     def softwareUrl = "https://github.com/nikitakit/self-attentive-parser"
 
+    override def mergeErrorStream = !framed
+
     val benepar = mkIO()
     override def close() = benepar.close()
 
-    def newSentenceAnnotation(sentence: Node): Node = {
-      val tokens: NodeSeq = (sentence \ "tokens").head \ ("token")
-      val words = tokens map (_ \@ "form")
-      val postags = tokens map (_ \@ "pos")
+    override def annotate(annotation: Node) = {
+      assert(annotation.label == "sentences")
+
+      val sentences = annotation.child
+      val newSentences =
+        if (sentences.isEmpty) sentences
+        else try {
+          val outputs = runParser(sentences map mkInput)
+          assert(outputs.size == sentences.size)
+
+          sentences zip outputs map { case (sentence, output) =>
+            val parse =
+              if (compact) compactToNode(output, sentence)
+              else TreesUtil.streeToNode(output, sentence, name)
+            sentence addChild parse
+          }
+        } catch {
+          case e: AnnotationError =>
+            System.err.println(s"Failed to annotate sentences by $name.")
+            sentences map (Annotator.annotateError(_, name, e))
+        }
 
-      val tree = runParser(mkInput(sentence)).mkString("")
-      val node = TreesUtil.streeToNode(tree, sentence, name)
+      annotation.asInstanceOf[Elem].copy(child = newSentences)
+    }
+
+    // "PRP VBD NN .\t0 4 S 0 1 NP 1 3 VP" => the <parse> node
+    def compactToNode(output: String, sentence: Node): Node = {
+      val tab = output.indexOf('\t')
+      val fields = output.substring(tab + 1).split(" ")
+      val numTokens = ((sentence \ "tokens").head \ "token").size
+      if (tab < 0 || output.substring(0, tab).split(" ").size != numTokens || fields.size % 3 != 0)
+        throw new AnnotationError(s"Unexpected output of benepar: $output")
 
-      sentence addChild node
+      val spans = (0 until fields.size by 3) map { i =>
+        (fields(i).toInt, fields(i + 1).toInt, fields(i + 2))
+      }
+      TreesUtil.spansToNode(spans, sentence, name)
     }
 
     def mkInput(sentence: Node): String = {
@@ -131,10 +184,13 @@ class BeneParAnnotator(override val name: String, override val props: Properties
       words.mkString(" ") + "\n" + postags.mkString(" ")
     }
 
-    def runParser(input: String): Seq[String] = {
-      benepar.safeWriteWithFlush(input)
-      benepar.readUntil(_ == "END").dropRight(1)
-    }
+    // Returns one tree per sentence, in the order of inputs.
+    def runParser(inputs: Seq[String]): Seq[String] =
+      if (framed) benepar.request(inputs.mkString("\n")).split("\n")
+      else {
+        benepar.safeWriteWithFlush(inputs.mkString("\n") + "\n####EOD####")
+        benepar.readUntil(_ == "END").dropRight(1)
+      }
   }
 
   override def requires = Set(Requirement.Ssplit, Requirement.Tokenize, Requirement.POS)
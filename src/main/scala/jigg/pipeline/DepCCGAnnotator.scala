@@ -20,6 +20,7 @@ import java.io.File
 import java.util.Properties
 
 import scala.xml._
+import scala.collection.mutable.ArrayBuffer
 import scala.sys.process.Process
 
 import jigg.util.IOUtil
@@ -37,6 +38,16 @@ class DepCCGAnnotator(override val name: String, override val props: Properties)
   @Prop(gloss = "Path to 'activate' script of the virtual environment that you wish to run on depccg") var venv = ""
   @Prop(gloss = "Name of conda enviroment that you wish to run on depccg (ignored when venv is non-empty.)") var conda = ""
   @Prop(gloss = "If true, launch multiple depccgs for parallel parsing. See -help depccg for more details.") var parallel = false
+  @Prop(gloss = "If > 0, sentences are sorted by length and parsed in buckets of at most this number of (padded) tokens. See -help depccg for more details.") var bucketTokens = 0
+  @Prop(gloss = "If true, communicate with depccg by length-prefixed frames instead of lines. See -help depccg for more details.") var framed = false
+  @Prop(gloss = "If true, depccg outputs derivations in a compact form instead of XML. See -help depccg for more details.") var compact = false
+  @Prop(gloss = "If > 1, depccg forks this number of workers after loading the model (pool mode). See -help depccg for more details.") var workers = 1
+  @Prop(gloss = "Path to a SQLite file, in which the output of each sentence is cached. See -help depccg for more details.") var cache = ""
+  @Prop(gloss = "Maximum number of sentences in the cache") var cacheSize = 100000
+  @Prop(gloss = "If > 0, a sentence with more tokens is not parsed. See -help depccg for more details.") var maxTokens = 0
+  @Prop(gloss = "If > 0, time budget in seconds to parse each sentence. See -help depccg for more details.") var timeout = 0.0
+  @Prop(gloss = "If > 0, a sentence that runs out of time is retried with this beta (e.g., 0.001)") var retryBeta = 0.0
+  @Prop(gloss = "If > 0, a sentence that runs out of time is retried with this pruning size (e.g., 10)") var retryPruningSize = 0
   readProps()
 
   override def nThreads = if (parallel) super.nThreads else 1
@@ -99,9 +110,76 @@ class DepCCGAnnotator(override val name: String, override val props: Properties)
   many overheads in particular longer model loading and large memory consumption, we
   recommend to use "OpenMPed" depccg with "-${name}.parallel false".
 
+  Without OpenMP, -${name}.workers n (n > 1) is an alternative to -${name}.parallel.
+  It launches a single depccg, which loads the model once and then forks n worker
+  processes sharing the model weights (copy-on-write). The sentences given at once are
+  divided into n chunks of similar lengths, which are parsed by the workers in parallel.
+  This uses all cores at roughly the memory of one model. This pool mode is for CPU, so
+  it cannot be used with "--gpu" in -${name}.args, nor with -${name}.parallel.
+
+  Batching
+  --------------------
+  All sentences to be annotated at once (e.g., all documents in a request of
+  PipelineServer's annotate_batch) are sent to depccg together. With
+  -${name}.bucketTokens n (n > 0), depccg sorts them by length and parses them in
+  buckets, each of which has at most n tokens including paddings (the longest length
+  times the number of sentences). This reduces the paddings of the supertagger and is
+  effective when the inputs are many short sentences. A value around a few thousands
+  (e.g., 4000) is a good starting point on GPU. The output is the same as without this
+  option.
+
+  Framed protocol
+  --------------------
+  In default, inputs and outputs are exchanged line by line, and the end of each is
+  marked by a special line (e.g., "####EOD####"), so a sentence that equals such a line
+  breaks the communication. With -${name}.framed true, they are exchanged as frames
+  prefixed by the byte length, which can contain any string and are read without
+  scanning every line.
+
+  Compact output
+  --------------------
+  In default, depccg outputs derivations in the XML of C&C, which is built and printed
+  by lxml for each derivation, and parsed again by Jigg. With -${name}.compact true,
+  each derivation is written in one line as a bracketed form, e.g., "( fa NP NP/N N )",
+  and converted to spans directly. The annotation is the same, but it is faster to
+  produce and read, in particular with -${name}.kBest.
+
+  Cache
+  --------------------
+  With -${name}.cache path/to/cache.db, the output of each sentence is cached in a
+  SQLite file, and a sentence that has been parsed with the same settings (the model,
+  -${name}.kBest, the arguments such as --beta and --root-cats, and the output format) is
+  not parsed again. This is effective for corpora with many repeated sentences, or
+  when annotating again a mostly unchanged corpus. At most -${name}.cacheSize
+  sentences are kept, by evicting the least recently used ones. The numbers of hits and
+  misses are accumulated in the `stats` table of the file, e.g.:
+
+    > sqlite3 path/to/cache.db "select * from stats"
+
+  The file can be shared by the instances with -${name}.parallel.
+
+  Length cap and time budget
+  --------------------
+  A long sentence may keep depccg busy for minutes, and block the whole input. With
+  -${name}.maxTokens n, a sentence with more than n tokens is not parsed. With
+  -${name}.timeout t, the sentences are parsed in a forked process (sharing the model)
+  within t seconds per sentence in total; if it runs out, each sentence not parsed yet
+  (see -${name}.bucketTokens) is parsed alone within t seconds, and one that still runs
+  out is retried once with tighter pruning given by
+  -${name}.retryBeta and/or -${name}.retryPruningSize (e.g., 0.001 and 10), if any.
+  A sentence that fails in the end gets a placeholder with the reason (length, timeout,
+  or error), and the other sentences are annotated as usual:
+
+    <ccg annotators="${name}" id="ccg0" failure="timeout"/>
+
+  Forking costs a little for each input, so set -${name}.timeout generously (e.g.,
+  a few seconds).
+
 """
 
   override def init() = {
+    if (parallel && workers > 1)
+      throw new ArgumentError(s"-${name}.parallel and -${name}.workers cannot be used together.")
     System.err.println(s"Loading depccg... (${nThreads} instances)")
     localAnnotators
     System.err.println("done.")
@@ -121,7 +199,16 @@ class DepCCGAnnotator(override val name: String, override val props: Properties)
       }
       val options = (s"--lang $lang "
         + (if (model != "") s"--internal-model $model " else "")
-        + (if (kBest != 1) s"--internal-nbest $kBest " else ""))
+        + (if (kBest != 1) s"--internal-nbest $kBest " else "")
+        + (if (bucketTokens > 0) s"--internal-bucket-tokens $bucketTokens " else "")
+        + (if (framed) "--internal-framed " else "")
+        + (if (compact) "--internal-compact " else "")
+        + (if (workers > 1) s"--internal-workers $workers " else "")
+        + (if (cache != "") s"--internal-cache $cache --internal-cache-size $cacheSize " else "")
+        + (if (maxTokens > 0) s"--internal-max-tokens $maxTokens " else "")
+        + (if (timeout > 0) s"--internal-timeout $timeout " else "")
+        + (if (retryBeta > 0) s"--internal-retry-beta $retryBeta " else "")
+        + (if (retryPruningSize > 0) s"--internal-retry-pruning-size $retryPruningSize " else ""))
 
       venvcommand + s"python ${script.getPath} ${args} ${options}"
     }
@@ -138,10 +225,13 @@ class DepCCGAnnotator(override val name: String, override val props: Properties)
       script
     }
 
-    override def launchTesters = Seq(
-      LaunchTester("a\n####EOD####", _ == "END", _ == "END"))
+    override def launchTesters =
+      if (framed) Seq(framedLaunchTester)
+      else Seq(LaunchTester("a\n####EOD####", _ == "END", _ == "END"))
     def softwareUrl = "https://github.com/masashi-y/depccg"
 
+    override def mergeErrorStream = !framed
+
     val depccg = mkIO()
     override def close() = depccg.close()
 
@@ -150,25 +240,42 @@ class DepCCGAnnotator(override val name: String, override val props: Properties)
 
       val sentences = annotation.child
 
-      val input = sentences.map(mkInput).mkString("\n") + "\n####EOD####"
-      val result = runDepccg(input)
+      val output = runDepccg(sentences.map(mkInput))
+      val newSentences =
+        if (compact) annotateWithCompact(sentences, output)
+        else annotateWithXML(sentences, output)
 
-      // result is given by candc-style xml
-      // First line is parser-internal error msg (1..), which should be ignored.
-      val resultNode = XML.loadString(result.drop(1).mkString("\n"))
+      annotation.asInstanceOf[Elem].copy(child = newSentences)
+    }
+
+    // output is given by candc-style xml
+    def annotateWithXML(sentences: Seq[Node], output: Seq[String]): Seq[Node] = {
+      // In the line protocol, first line is parser-internal error msg (1..), which
+      // should be ignored.
+      val resultNode = XML.loadString((if (framed) output else output.drop(1)).mkString("\n"))
 
       val outputs = resultNode \\ "ccgs"
       assert(outputs.size == sentences.size)
 
-      val newSentences = sentences zip outputs map {
+      sentences zip outputs map {
         case (sentence, ccgs) =>
           val kbest = ccgs \ "ccg"
           kbest.foldLeft(sentence) { (current, ccg) =>
-            CandCAnnotator.annotateCCGSpans(current, ccg, name)
+            ccg \@ "failure" match {
+              case "" => CandCAnnotator.annotateCCGSpans(current, ccg, name)
+              case reason => current addChild failedCCG(reason)
+            }
           }
       }
+    }
 
-      annotation.asInstanceOf[Elem].copy(child = newSentences)
+    def annotateWithCompact(sentences: Seq[Node], output: Seq[String]): Seq[Node] = {
+      val derivations = compactDerivations(output)
+      sentences.zipWithIndex map { case (sentence, i) =>
+        derivations.getOrElse(i + 1, Seq()).foldLeft(sentence) { (current, derivation) =>
+          annotateCompactCCG(current, derivation)
+        }
+      }
     }
 
     // Input looks like "This|X|X is|X|X ..."
@@ -177,10 +284,80 @@ class DepCCGAnnotator(override val name: String, override val props: Properties)
       forms mkString " "
     }
 
-    def runDepccg(input: String): Seq[String] = {
-      depccg.safeWriteWithFlush(input)
-      depccg.readUntil(_ == "END").dropRight(1)
+    def runDepccg(inputs: Seq[String]): Seq[String] =
+      if (framed) depccg.request(inputs mkString "\n").split("\n")
+      else {
+        depccg.safeWriteWithFlush(inputs.mkString("\n") + "\n####EOD####")
+        depccg.readUntil(_ == "END").dropRight(1)
+      }
+  }
+
+  /** Derivations in the compact output, grouped by the sentence index (1-origin).
+    * Other lines, such as messages of the parser, are ignored.
+    */
+  def compactDerivations(output: Seq[String]): Map[Int, Seq[String]] = {
+    val Line = """(\d+)\t(.+)""".r
+    output.collect { case Line(i, derivation) => (i.toInt, derivation) }
+      .groupBy(_._1).map { case (i, ds) => (i, ds.map(_._2)) }
+  }
+
+  /** Add a ccg node read from a derivation in the compact output to `sentence`.
+    *
+    * A derivation is space-separated fields in the prefix order, in which a rule is
+    * `( type category children... )` and a leaf is its category; leaves correspond to
+    * the tokens from left to right. A failed sentence has `!reason` (see `failedCCG`). The result is the same as
+    * `CandCAnnotator.annotateCCGSpans` on the XML output, but we build the spans in one
+    * pass without the XML.
+    */
+  def annotateCompactCCG(sentence: Node, derivation: String): Node =
+    if (derivation startsWith "!") sentence addChild failedCCG(derivation.substring(1))
+    else annotateCompactSpans(sentence, derivation)
+
+  /** A placeholder ccg of a sentence that depccg failed to parse, e.g., because it
+    * runs out of the time budget (-timeout).
+    */
+  def failedCCG(reason: String): Node =
+    <ccg annotators={ name } id={ Annotation.CCG.nextId } failure={ reason }/>
+
+  private def annotateCompactSpans(sentence: Node, derivation: String): Node = {
+    val tokens = sentence \\ "token"
+    val fields = derivation.split(" ")
+    val spans = new ArrayBuffer[Node]
+    var pos = 0
+    var nextLeaf = 0
+
+    // Returns (id, begin, end) of the node starting at `pos`. Ids are assigned in the
+    // prefix order, as in CandCAnnotator.assignId.
+    def read(): (String, Int, Int) = {
+      val id = Annotation.CCGSpan.nextId
+      val index = spans.size
+      spans += null // filled after the children
+      if (fields(pos) == "(") {
+        val rule = fields(pos + 1)
+        val symbol = fields(pos + 2)
+        pos += 3
+        val children = new ArrayBuffer[(String, Int, Int)]
+        while (fields(pos) != ")") children += read()
+        pos += 1
+        val (begin, end) = (children.head._2, children.last._3)
+        spans(index) = <span id={ id } begin={ begin + "" } end={ end + "" } symbol={ symbol } rule={ rule } children={ children.map(_._1) mkString " " }/>
+        (id, begin, end)
+      } else {
+        val symbol = fields(pos)
+        pos += 1
+        val begin = nextLeaf
+        nextLeaf += 1
+        spans(index) = <span id={ id } begin={ begin + "" } end={ (begin + 1) + "" } symbol={ symbol } children={ tokens(begin) \@ "id" }/>
+        (id, begin, begin + 1)
+      }
+    }
+
+    val root = try read()._1 catch {
+      case e: IndexOutOfBoundsException =>
+        throw new AnnotationError(s"Invalid derivation of depccg: $derivation")
     }
+    sentence addChild (
+      <ccg annotators={ name } root={ root } id={ Annotation.CCG.nextId }>{ spans }</ccg>)
   }
 
   override def requires = lang match {
@@ -17,10 +17,13 @@ package jigg.pipeline
  */
 
 
+import scala.annotation.tailrec
 import scala.collection.JavaConverters._
+import scala.collection.mutable
 import scala.util.control
 import java.lang.Process
 import java.io._
+import java.util.concurrent.{LinkedBlockingQueue, TimeUnit}
 
 
 /** IOCommunicator abstracts IO communication mechanism, and provides several utility
@@ -40,6 +43,11 @@ trait IOCommunicator {
 
   def isAlive: Boolean
 
+  /** Wait at most `millis` milliseconds for the process to exit, e.g., after its output
+    * ended. Return true if it has exited.
+    */
+  def waitForExit(millis: Long): Boolean = !isAlive
+
   def readingIter: Iterator[String]
 
   def closeResource() = {}
@@ -59,6 +67,26 @@ trait IOCommunicator {
   def safeWrite(lines: TraversableOnce[String]): Either[Throwable, Unit] =
     control.Exception.allCatch either { for (line <- lines) writeln(line) }
 
+  /** Write a frame (without flush). Only communicators that can read and write bytes,
+    * such as ProcessCommunicator, support frames.
+    */
+  def writeFrame(frame: Frame): Unit = unsupportedFrame()
+
+  /** Read the next frame. Lines before the header, e.g., warnings written to stderr by
+    * the process, are skipped. Return the skipped lines on the left of Either if the
+    * stream ends before a frame.
+    */
+  def readFrame(): Either[Seq[String], Frame] = unsupportedFrame()
+
+  def safeWriteFrames(frames: Seq[Frame]): Either[Throwable, Unit] =
+    control.Exception.allCatch either {
+      frames foreach writeFrame
+      flush()
+    }
+
+  private def unsupportedFrame() = throw new UnsupportedOperationException(
+    s"${getClass.getName} does not support frames.")
+
   /** Call `readUntil` if the first line matches to `firstLine`.
     * Otherwise, return the (unmatched) first line and the remaining input iterator
     * on the left of Either.
@@ -129,8 +157,9 @@ trait ProcessCommunicator extends IOCommunicator {
 
   val process: Process = startProcess()
 
-  val processIn = new BufferedReader(new InputStreamReader(process.getInputStream, "UTF-8"))
-  val processOut = new BufferedWriter(new OutputStreamWriter(process.getOutputStream, "UTF-8"))
+  val processIn = new ProcessInput(process.getInputStream)
+  private[this] val processOutStream = new BufferedOutputStream(process.getOutputStream)
+  val processOut = new BufferedWriter(new OutputStreamWriter(processOutStream, "UTF-8"))
 
   checkStartError()
 
@@ -149,8 +178,32 @@ trait ProcessCommunicator extends IOCommunicator {
 
   def isAlive: Boolean = !isExited
 
+  override def waitForExit(millis: Long) = process.waitFor(millis, TimeUnit.MILLISECONDS)
+
   def readingIter = Iterator.continually(processIn.readLine())
 
+  override def writeFrame(frame: Frame) = {
+    processOut.flush() // lines written so far precede the frame
+    processOutStream.write(frame.toBytes)
+  }
+
+  override def readFrame(): Either[Seq[String], Frame] = {
+    @tailrec
+    def read(skipped: Vector[String]): Either[Seq[String], Frame] =
+      processIn.readLine() match {
+        case null => Left(skipped)
+        case Frame.Header(kind, id, n) =>
+          processIn.readString(n.toInt) match {
+            case null => Left(skipped)
+            case payload =>
+              processIn.readLine() // the newline after the payload
+              Right(Frame(kind, id.toLong, payload))
+          }
+        case line => read(skipped :+ line)
+      }
+    read(Vector())
+  }
+
   protected def startProcess(): Process =
     control.Exception.allCatch either startWithRedirectError() match {
       case Right(process)
@@ -159,10 +212,17 @@ trait ProcessCommunicator extends IOCommunicator {
       case Left(error) => startError(error)
     }
 
+  /** If false, the stderr of the process goes to the stderr of Jigg instead of being
+    * merged into the output, e.g., for the framed protocol, where a line written to
+    * stderr could break a frame.
+    */
+  def mergeErrorStream: Boolean = true
+
   private def startWithRedirectError() = {
     val fullcmd = (cmd +: args).mkString(" ")
     val pb = new ProcessBuilder("bash", "-c", fullcmd)
-    pb.redirectErrorStream(true)
+    if (mergeErrorStream) pb.redirectErrorStream(true)
+    else pb.redirectError(ProcessBuilder.Redirect.INHERIT)
     pb.start
   }
 
@@ -181,6 +241,95 @@ object ProcessCommunicator {
     catch { case e: IllegalThreadStateException => false }
 }
 
+/** A frame of the framed protocol with external processes (see `jigg_io.py` in
+  * `resources/python`).
+  *
+  * A frame is a header line `KIND id nbytes`, followed by the payload of `nbytes` bytes
+  * in UTF-8 and a newline. `KIND` is `REQ` (a request from Jigg), `RES` (the response to
+  * the request of `id`), or `ERR` (an error message for the request of `id`). Unlike the
+  * line protocol, where the end of an output is marked by a line such as `END`, a payload
+  * may contain any string. Since responses are matched by ids, several requests can be
+  * written before reading the responses.
+  */
+case class Frame(kind: String, id: Long, payload: String) {
+
+  def toBytes: Array[Byte] = {
+    val body = payload.getBytes("UTF-8")
+    val header = s"$kind $id ${body.size}\n".getBytes("UTF-8")
+    val bytes = new Array[Byte](header.size + body.size + 1)
+    System.arraycopy(header, 0, bytes, 0, header.size)
+    System.arraycopy(body, 0, bytes, header.size, body.size)
+    bytes(bytes.size - 1) = '\n'
+    bytes
+  }
+}
+
+object Frame {
+  val Request = "REQ"
+  val Response = "RES"
+  val Error = "ERR"
+
+  /** The line written by a process when it starts to serve frames. */
+  val Ready = "READY"
+
+  val Header = """(REQ|RES|ERR) (\d+) (\d+)""".r
+}
+
+/** A buffered input of a process, from which we can read both lines and payloads of a
+  * given number of bytes. Unlike BufferedReader, this does not decode beyond what is
+  * read, so both can be mixed on the same stream.
+  */
+class ProcessInput(in: InputStream, bufferSize: Int = 1 << 16) {
+
+  private[this] val buf = new Array[Byte](bufferSize)
+  private[this] var pos = 0
+  private[this] var limit = 0
+
+  private def fill(): Boolean = {
+    pos = 0
+    limit = math.max(in.read(buf), 0)
+    limit > 0
+  }
+
+  /** Read a line in UTF-8 without the line terminator, or null at the end of stream. */
+  def readLine(): String = {
+    val line = new ByteArrayOutputStream
+    var eol = false
+    var eof = false
+    while (!eol && !eof) {
+      if (pos == limit && !fill()) eof = true
+      else {
+        var i = pos
+        while (i < limit && buf(i) != '\n') i += 1
+        line.write(buf, pos, i - pos)
+        eol = i < limit
+        pos = if (eol) i + 1 else i
+      }
+    }
+    if (eof && line.size == 0) null
+    else {
+      val bytes = line.toByteArray
+      val size = if (bytes.size > 0 && bytes(bytes.size - 1) == '\r') bytes.size - 1 else bytes.size
+      new String(bytes, 0, size, "UTF-8")
+    }
+  }
+
+  /** Read `n` bytes in UTF-8, or null if the stream ends before. */
+  def readString(n: Int): String = {
+    val bytes = new Array[Byte](n)
+    var read = math.min(n, limit - pos)
+    System.arraycopy(buf, pos, bytes, 0, read)
+    pos += read
+    while (read < n) in.read(bytes, read, n - read) match {
+      case -1 => return null
+      case r => read += r
+    }
+    new String(bytes, "UTF-8")
+  }
+
+  def close() = in.close()
+}
+
 /** An example class of IOCommunicator
   */
 class CommonProcessCommunicator(val cmd: String, val args: Seq[String])
@@ -206,6 +355,24 @@ class StubExternalCommunicator(outputs: Seq[String]) extends IOCommunicator {
     i += 1
     iter
   }
+
+  // Frames are written by another thread while the responses are read (see EasyIO).
+  private[this] val frameIds = new LinkedBlockingQueue[java.lang.Long]
+
+  override def writeFrame(frame: Frame) = frameIds.put(frame.id)
+
+  override def readFrame() =
+    if (i < outputs.size) StubExternalCommunicator.nextFrame(frameIds) match {
+      case null => Left(Seq())
+      case id =>
+        i += 1
+        Right(Frame(Frame.Response, id, outputs(i - 1)))
+    } else Left(Seq())
+}
+
+object StubExternalCommunicator {
+  /** The next frame written, or null if none is written in a while. */
+  def nextFrame[A](frames: LinkedBlockingQueue[A]): A = frames.poll(10, TimeUnit.SECONDS)
 }
 
 class MapStubExternalCommunicator(responces: Map[String, String]) extends IOCommunicator {
@@ -222,4 +389,13 @@ class MapStubExternalCommunicator(responces: Map[String, String]) extends IOComm
     val o = responces(currentIn)
     o.split("\n").toIterator
   }
+
+  private[this] val frames = new LinkedBlockingQueue[Frame]
+
+  override def writeFrame(frame: Frame) = frames.put(frame)
+
+  override def readFrame() = StubExternalCommunicator.nextFrame(frames) match {
+    case null => Left(Seq())
+    case request => Right(Frame(Frame.Response, request.id, responces(request.payload)))
+  }
 }
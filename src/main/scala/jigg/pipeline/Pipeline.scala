@@ -37,6 +37,8 @@ class Pipeline(val properties: Properties = new Properties) extends PropsHolder
   @Prop(gloss="Print this message and descriptions of specified annotators, e.g., -help ssplit,mecab") var help = ""
   @Prop(gloss="You can add an abbreviation for a custom annotator class with \"-customAnnotatorClass.xxx path.package\"") var customAnnotatorClass = ""
   @Prop(gloss="Number of threads for parallel annotation (use all if <= 0)") var nThreads = -1
+  @Prop(gloss="Number of times a dead external process is restarted to retry the same input (no restart if 0)") var maxRestarts = 1
+  @Prop(gloss="Start external processes in background, and keep a spare process for restarting a dead one") var prespawn = false
   @Prop(gloss="Output format, [xml/json]. Default value is 'xml'.") var outputFormat = "xml"
   @Prop(gloss="Check requirement, [true/false/warn]. Default value is 'true'.") var checkRequirement = "true"
   @Prop(gloss="Input format, [text/xml/json]. Default value is 'text'.") var inputFormat = "text"
@@ -360,12 +362,22 @@ Currently the annotators listed below are installed. See the detail of each anno
 
   def annotate(text: String) = annotateText(text)
 
+  /** Annotate each text as a separate document. All documents are annotated at once,
+    * so annotators that are parallel over documents or sentences can use all of them.
+    */
+  def annotateTexts(texts: Seq[String], verbose: Boolean = false): Node = process { annotators =>
+    val root = <root>{ texts map documentXML }</root>
+    annotate(root, annotators, verbose)
+  }
+
   protected def annotate(root: Node, annotators: List[Annotator], verbose: Boolean): Node = {
     def annotateRecur(input: Node, unprocessed: List[Annotator]): Node = unprocessed match {
       case annotator :: tail =>
-        val newNode = verbose match {
-          case true => track(s"${annotator.name}: ", "", 2) { annotator.annotate(input) }
-          case false => annotator.annotate(input)
+        val newNode = PipelineMetrics.annotate(annotator) {
+          verbose match {
+            case true => track(s"${annotator.name}: ", "", 2) { annotator.annotate(input) }
+            case false => annotator.annotate(input)
+          }
         }
         annotateRecur(newNode, tail)
       case Nil => input
@@ -376,7 +388,8 @@ Currently the annotators listed below are installed. See the detail of each anno
 
     removeTextInDoc(annotateRecur(root, annotators))
   }
-  protected def rootXML(raw: String) = <root><document id={ documentIDGen.next }>{ raw }</document></root>
+  protected def rootXML(raw: String) = <root>{ documentXML(raw) }</root>
+  protected def documentXML(raw: String) = <document id={ documentIDGen.next }>{ raw }</document>
 
   def printHelp(os: PrintStream) = {
     os.println("Usage:")
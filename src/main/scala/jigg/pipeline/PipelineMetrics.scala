@@ -0,0 +1,64 @@
+package jigg.pipeline
+
+/*
+ Copyright 2013-2017 Hiroshi Noji
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+*/
+
+import scala.xml.Node
+
+import jigg.util.Metrics
+
+/** The metrics collected in a process running pipelines, which PipelineServer exposes
+  * at /metrics.
+  */
+object PipelineMetrics {
+
+  val annotatorSeconds = Metrics.summary("jigg_annotator_seconds",
+    "Wall time of the annotate calls of each annotator in a pipeline.")
+
+  val annotatorSentences = Metrics.counter("jigg_annotator_sentences_total",
+    "Number of sentences processed by each annotator.")
+
+  val processRoundTripSeconds = Metrics.summary("jigg_process_roundtrip_seconds",
+    "Time from writing an input to an external process until reading its output.")
+
+  val processRestarts = Metrics.counter("jigg_process_restarts_total",
+    "Number of external processes restarted after they died.")
+
+  val queueWaitSeconds = Metrics.summary("jigg_server_queue_wait_seconds",
+    "Time a request waits for a worker in the server.")
+
+  val serializeSeconds = Metrics.summary("jigg_server_serialize_seconds",
+    "Time to serialize an annotation into the output format.")
+
+  val rejectedRequests = Metrics.counter("jigg_server_rejected_requests_total",
+    "Number of requests rejected because the queue is full.")
+
+  val timedOutRequests = Metrics.counter("jigg_server_timed_out_requests_total",
+    "Number of requests dropped because they timed out before they were annotated.")
+
+  /** Record the time of `body`, an annotation by `annotator`, and the number of sentences
+    * in its result.
+    */
+  def annotate(annotator: Annotator)(body: =>Node): Node = {
+    val label = "annotator" -> annotator.name
+    val output = annotatorSeconds.time(label)(body)
+    annotatorSentences.add(numSentences(output), label)
+    output
+  }
+
+  private[this] def numSentences(root: Node): Int =
+    (root \ "document" \ "sentences" \ "sentence").size
+}
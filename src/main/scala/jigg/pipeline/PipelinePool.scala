@@ -0,0 +1,99 @@
+package jigg.pipeline
+
+/*
+ Copyright 2013-2017 Hiroshi Noji
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+*/
+
+import java.util.Properties
+import java.util.concurrent.TimeoutException
+
+import scala.collection.mutable.ArrayStack
+import scala.concurrent.duration.Deadline
+
+/** A pool of at most `size` pipelines with the same properties.
+  *
+  * A pipeline is not thread-safe (e.g., it may communicate with external processes), so
+  * each caller of `using` gets a pipeline for its exclusive use. Pipelines are created
+  * lazily, so a pool is cheap until it is used. If all pipelines are in use, `using`
+  * blocks until one is returned, or until the deadline, if given, when it throws
+  * TimeoutException.
+  */
+class PipelinePool(val props: Properties, val size: Int) {
+  assert(size > 0)
+
+  // Guarded by this, which is notified when a pipeline is returned or a slot is released.
+  private[this] val idle = new ArrayStack[Pipeline]
+  private[this] var created = 0
+  @volatile private[this] var closed = false
+
+  def using[A](f: Pipeline=>A): A = use(None, f)
+
+  def using[A](deadline: Deadline)(f: Pipeline=>A): A = use(Some(deadline), f)
+
+  private[this] def use[A](deadline: Option[Deadline], f: Pipeline=>A): A = {
+    val pipeline = borrow(deadline)
+    try f(pipeline) finally giveBack(pipeline)
+  }
+
+  def numCreated: Int = synchronized { created }
+
+  /** Close the idle pipelines. Those in use are closed when they are returned. */
+  def close() = {
+    closed = true
+    closeIdle()
+  }
+
+  /** An idle pipeline, or a new one if fewer than `size` pipelines exist. */
+  private[this] def borrow(deadline: Option[Deadline]): Pipeline = {
+    val reused = synchronized {
+      while (idle.isEmpty && created >= size) deadline match {
+        case Some(d) =>
+          val left = d.timeLeft.toMillis
+          if (left <= 0) throw new TimeoutException("No pipeline is available before the deadline.")
+          wait(left)
+        case None => wait()
+      }
+      if (idle.nonEmpty) Some(idle.pop())
+      else { created += 1; None }
+    }
+    reused getOrElse create()
+  }
+
+  private[this] def create(): Pipeline =
+    try new Pipeline(props)
+    catch { case e: Throwable => release(); throw e }
+
+  private[this] def release() = synchronized {
+    created -= 1
+    notify()
+  }
+
+  private[this] def giveBack(pipeline: Pipeline) = {
+    synchronized {
+      idle.push(pipeline)
+      notify()
+    }
+    if (closed) closeIdle()
+  }
+
+  private[this] def closeIdle() = {
+    val pipelines = synchronized {
+      val all = idle.toList
+      idle.clear()
+      all
+    }
+    pipelines foreach (_.close())
+  }
+}
@@ -17,6 +17,7 @@ package jigg.pipeline
 */
 
 import java.util.Properties
+import java.util.concurrent.{RejectedExecutionException, TimeoutException}
 import java.io.{ByteArrayOutputStream, PrintStream}
 
 import scala.xml.{XML, Node}
@@ -25,9 +26,11 @@ import scala.collection.JavaConverters._
 import scala.concurrent._
 import scala.concurrent.duration._
 import scala.io.StdIn
+import scala.util.Try
 
 import jigg.util.LogUtil.{ track, multipleTrack }
-import jigg.util.{PropertiesUtil => PU, IOUtil, XMLUtil, JSONUtil}
+import jigg.util.{PropertiesUtil => PU, IOUtil, XMLUtil, JSONUtil, Metrics}
+import jigg.util.XMLUtil.RichNode
 
 import akka.Done
 import akka.actor.{Actor, ActorRef, ActorSystem, Props}
@@ -37,26 +40,52 @@ import akka.http.scaladsl.Http
 import akka.http.scaladsl.marshalling.ToResponseMarshaller
 import akka.http.scaladsl.model._
 import akka.http.scaladsl.model.StatusCodes.MovedPermanently
+import akka.http.scaladsl.server.{ExceptionHandler, Route}
 import akka.http.scaladsl.server.Directives._
 import akka.http.scaladsl.unmarshalling.FromRequestUnmarshaller
 import akka.pattern.ask
 import akka.stream.ActorMaterializer
-import akka.util.Timeout
-
-class PipelineActor extends Actor {
+import akka.stream.scaladsl.Source
+import akka.util.{ByteString, Timeout}
+import com.typesafe.config.ConfigFactory
+
+/** Keeps the pools of recently used pipelines, at most `cacheSize`, keyed by their core
+  * params. Each pool has at most `poolSize` pipelines.
+  *
+  * Building a pipeline may take long (loading models and launching external processes),
+  * so clients alternating between several configurations should not rebuild them each
+  * time. The least recently used pool is closed and evicted when the cache is full,
+  * or when the ratio of free heap memory falls below `minFreeMemory`.
+  *
+  * This actor only hands out the pools; pipelines are built and used by the workers
+  * (see `PipelinePool`), so a slow build does not block the requests to other pools.
+  */
+class PipelineActor(cacheSize: Int = 4, minFreeMemory: Double = 0.2, poolSize: Int = 1)
+    extends Actor {
   import PipelineServer.Params
+  import akka.actor.Status
 
   val log = Logging(context.system, this)
 
   var lastParams: Params = null
-  var lastPipeline: Pipeline = null
+
+  // With accessOrder = true, the iteration starts from the least recently used entry.
+  val pools = new java.util.LinkedHashMap[Params, PipelinePool](16, 0.75f, true)
+
+  var hits = 0L
+  var misses = 0L
 
   def receive = {
     case params: Params => {
       val coreParams = removeNonCore(params)
       // If params are empty, use the same params as before.
-      if (coreParams != lastParams && !coreParams.isEmpty) reset(coreParams)
-      sender ! lastPipeline
+      if (!coreParams.isEmpty || lastParams == null) lastParams = coreParams
+      try sender ! get(lastParams)
+      catch { case e: Exception =>
+        // Reply the error instead of crashing this actor, which would lose the cache.
+        lastParams = null
+        sender ! Status.Failure(e)
+      }
     }
   }
 
@@ -64,22 +93,63 @@ class PipelineActor extends Actor {
     // The server is agnostic to the changes of these properties
     // (not creating a new pipeline).
     val noncore = Seq("props", "file", "output", "help", "outputFormat",
-      "checkRequirement", "inputFormat")
-    Params(params.kvs filter { case (k, v) => !(noncore contains k) })
+      "checkRequirement", "inputFormat", "unit", "timeout")
+    Params(params.kvs collect {
+      case (k, v) if !(noncore contains k.trim) => (k.trim, v.trim)
+    })
   }
 
-  def reset(params: Params) = {
-    lastParams = params
+  def get(params: Params): PipelinePool = pools.get(params) match {
+    case null =>
+      misses += 1
+      // Release the memory before loading new models.
+      while (!pools.isEmpty && isLowMemory) evictEldest("low memory")
+      val pool = reset(params)
+      pools.put(params, pool)
+      while (pools.size > math.max(cacheSize, 1)) evictEldest("cache is full")
+      logStats()
+      pool
+    case pool =>
+      hits += 1
+      pool
+  }
 
+  def reset(params: Params) = {
     val props = new Properties
     for ((k, v) <- params.kvs) props.setProperty(k, v)
 
-    lastPipeline = new Pipeline(props)
+    log.info("Pipeline pool is created. New property: " + props)
+
+    new PipelinePool(props, poolSize)
+  }
+
+  def evictEldest(reason: String) = {
+    val it = pools.entrySet.iterator
+    val eldest = it.next
+    it.remove()
+    log.info(s"Pipeline is closed ($reason): " + eldest.getKey.kvs)
+    eldest.getValue.close()
+  }
 
-    log.info("Pipeline is updated. New property: " + props)
-    log.info("Number of threads: " + lastPipeline.nThreads)
+  // Garbage is counted as used memory, so collect it before judging.
+  def isLowMemory = freeMemoryRatio < minFreeMemory && {
+    System.gc()
+    freeMemoryRatio < minFreeMemory
+  }
 
-    lastPipeline
+  def freeMemoryRatio: Double = {
+    val rt = Runtime.getRuntime
+    val used = rt.totalMemory - rt.freeMemory
+    1.0 - used.toDouble / rt.maxMemory
+  }
+
+  def logStats() =
+    log.info(s"Pipeline cache: size=${pools.size}, hits=$hits, misses=$misses")
+
+  override def postStop() = {
+    val it = pools.values.iterator
+    while (it.hasNext) it.next.close()
+    pools.clear()
   }
 }
 
@@ -89,9 +159,19 @@ class PipelineServer(val properties: Properties = new Properties) extends PropsH
 
   @Prop(gloss="Port to serve on (default: 8080)") var port = 8080
   @Prop(gloss="Host to serve on (default: localhost. Use 0.0.0.0 to make public)") var host = "localhost"
+  @Prop(gloss="Maximum number of pipelines with different properties kept loaded (default: 4)") var cacheSize = 4
+  @Prop(gloss="Close the least recently used pipelines before loading a new one if the ratio of free heap memory is below this value (default: 0.2)") var minFreeMemory = 0.2
+  @Prop(gloss="Maximum number of pipeline instances with the same properties, which annotate in parallel (default: 1)") var poolSize = 1
+  @Prop(gloss="Number of threads annotating the requests (default: number of processors)") var workers = Runtime.getRuntime.availableProcessors
+  @Prop(gloss="Maximum number of requests waiting for a worker. The server responds 503 to the requests beyond this (default: 100)") var queueSize = 100
+  @Prop(gloss="Default timeout of a request in seconds, which can be overridden by \"timeout\" parameter of each request (default: 60)") var timeout = 60.0
+  @Prop(gloss="Maximum timeout of a request in seconds. Requests with a larger \"timeout\" are rejected (default: 600)") var maxTimeout = 600.0
 
   readProps()
 
+  if (timeout <= 0 || timeout > maxTimeout)
+    argumentError("timeout", s"timeout must be positive and at most maxTimeout ($maxTimeout).")
+
   def printHelp(os: PrintStream) = os.println(this.description)
 
   override def description: String = s"""Usage:
@@ -109,6 +189,29 @@ Another usage via curl is that:
 The data with the key "q" is treated as an input text. Multiple "q"s in a query
 are allowed and are concatenated.
 
+To annotate many documents in one request, use "annotate_batch" instead, where each
+"q" is treated as a separate document:
+
+  > curl --data-urlencode 'annotators=corenlp[tokenize,ssplit]' \\
+         --data-urlencode 'q=The first document.' \\
+         --data-urlencode 'q=The second document.' \\
+         'http://localhost:8080/annotate_batch'
+
+The output contains one <document> element (or JSON object) for each "q" in the order
+of the inputs.
+
+For large inputs, "annotate_stream" returns the result incrementally as a chunked
+response, one element per line. As in "annotate_batch", each "q" is a separate document,
+and the documents are annotated one by one. With "unit=sentence" (default), each
+<sentence> is output on its own line, followed by its <document> without <sentences>,
+which keeps the document-level annotations (e.g., coreferences); with "unit=document",
+each line is a whole <document>. With "outputFormat=json", each line is a JSON object
+(NDJSON); otherwise, each line is an unformatted XML element.
+
+  > curl --data-urlencode 'annotators=corenlp[tokenize,ssplit]' \\
+         --data-urlencode 'q=The first document. It is long.' \\
+         'http://localhost:8080/annotate_stream?outputFormat=json'
+
 Currently this server only supports POST method and the input text should be a raw text
 (not XML or JSON, which will be supported in future). For each call, users must specify
 the properties as the parameters.
@@ -116,9 +219,32 @@ the properties as the parameters.
 The annotation for the first input may be very slow due to loading all annotator models,
 which may take 30 ~ 60 secs if you use heavy components of Stanford CoreNLP (e.g., coref).
 
-The annotation for the followed inputs should be reasonably fast, but note that if you
-call the server with different parameters than the last call, the internal pipeline will
-be reconstructed, and the loading time will be taken again.
+The annotation for the followed inputs should be reasonably fast. The server keeps the
+pipelines of the recently used parameters (at most "cacheSize"), so alternating between
+a few configurations does not reload the models. If you call the server with parameters
+that are not cached, the internal pipeline will be constructed, and the loading time will
+be taken again. When the cache is full, or the free heap memory is less than
+"minFreeMemory" (ratio), the least recently used pipeline is closed.
+
+Requests are annotated in parallel by "workers" threads. Each pipeline instance handles
+one request at a time, so to annotate several requests with the same parameters in
+parallel, increase "poolSize" (each instance loads its own models). When more than
+"queueSize" requests are waiting, the server responds with 503 (Service Unavailable).
+A request that takes longer than "timeout" seconds also gets 503. The timeout of each
+request can be changed by its "timeout" parameter, up to "maxTimeout" seconds:
+
+  > curl --data-urlencode 'annotators=corenlp[tokenize,ssplit]' \\
+         --data-urlencode 'q=Please annotate me!' \\
+         'http://localhost:8080/annotate?timeout=600'
+
+A request that times out before a worker or a pipeline becomes available is dropped,
+while one being annotated runs to the end. In "annotate_stream", the timeout applies to
+each document.
+
+The metrics of the server, e.g., the time spent by each annotator, the number of
+processed sentences, the time waiting for a worker, and the round-trip time of external
+processes, are available in the text format of Prometheus at:
+  http://localhost:8080/metrics
 
 To see the valid options, call "jigg.pipeline.Pipeline -help", or after starting the
 server, access to e.g.,
@@ -132,16 +258,90 @@ where <annotator name> may be specific name such as corenlp or kuromoji."""
 
     case class OutputType(format: String)
 
-    implicit val timeout = Timeout(5.seconds)
+    // akka-http closes a connection idle for "idle-timeout", even while its request is
+    // being annotated, so this must be longer than any timeout of a request.
+    val config = ConfigFactory.parseString(s"""
+      akka.http.server.request-timeout = ${(timeout * 1000).toLong}ms
+      akka.http.server.idle-timeout = ${(maxTimeout * 1000).toLong + 10000}ms
+    """).withFallback(ConfigFactory.load())
 
-    implicit val system = ActorSystem("jigg-server")
+    implicit val system = ActorSystem("jigg-server", config)
     implicit val materializer = ActorMaterializer()
     // needed for the future flatMap/onComplete in the end
     implicit val executionContext = system.dispatcher
 
-    val actor = system.actorOf(Props[PipelineActor])
+    val actor = system.actorOf(Props(new PipelineActor(cacheSize, minFreeMemory, poolSize)))
+
+    val workerPool = new WorkerPool(workers, queueSize)
+
+    def onWorker[A](deadline: Deadline)(body: => A): Future[A] = workerPool.submit(deadline)(body)
+
+    def isBusy = workerPool.isBusy
+
+    // Requests that cannot be annotated in time due to the load get 503; a request timed
+    // out while waiting for a worker or a pipeline fails with TimeoutException.
+    val busyHandler = ExceptionHandler {
+      case e: RejectedExecutionException =>
+        PipelineMetrics.rejectedRequests.inc()
+        complete(StatusCodes.ServiceUnavailable,
+          s"The server is busy ($queueSize requests are waiting). Please retry later.")
+      case e: TimeoutException =>
+        complete(StatusCodes.ServiceUnavailable,
+          "The server is busy (the request timed out before it was annotated). Please retry later.")
+    }
+
+    def poolFor(params: Map[String, String], t: FiniteDuration): Future[PipelinePool] =
+      actor.ask(PipelineServer.Params(params))(Timeout(t)).mapTo[PipelinePool]
+
+    /** Complete with `inner`, given the timeout of this request. */
+    def withTimeout(params: Map[String, String])(inner: FiniteDuration => Route): Route =
+      params get "timeout" map (t => Try(t.toDouble).toOption) getOrElse Some(timeout) match {
+        case Some(t) if t > 0 && t <= maxTimeout =>
+          val d = (t * 1000).toLong.millis
+          withRequestTimeout(d) { inner(d) }
+        case _ =>
+          complete(StatusCodes.BadRequest,
+            s"Invalid timeout: ${params.getOrElse("timeout", timeout)}. It must be positive and at most $maxTimeout.")
+      }
+
+    /** Annotate with the pipeline for `params` and serialize the result in the
+      * requested output format.
+      */
+    def annotateWith(params: Map[String, String])(annotate: Pipeline => Node): Route =
+      withTimeout(params) { t =>
+        val deadline = t.fromNow
+        val result = poolFor(params, t) flatMap { pool =>
+          onWorker(deadline) {
+            pool.using(deadline) { pipeline =>
+              try {
+                val annotation = annotate(pipeline)
+
+                def outputBy(format: String): String =
+                  PipelineMetrics.serializeSeconds.time("format" -> format) {
+                    format match {
+                      case "json" => JSONUtil.toJSON(annotation).toString
+                      case _ =>
+                        val w = new java.io.StringWriter
+                        pipeline.writeTo(w, annotation)
+                        w.toString
+                    }
+                  }
+                params get "outputFormat" match {
+                  case Some(a) if a == "json" || a == "xml" => outputBy(a)
+                  case _ => outputBy("xml")
+                }
+              } catch { case e: Throwable =>
+                  val sw = new java.io.StringWriter
+                  e.printStackTrace(new java.io.PrintWriter(sw))
+                  sys.error(sw.toString)
+              }
+            }
+          }
+        }
+        complete(result)
+      }
 
-    val route =
+    val route = handleExceptions(busyHandler) {
       path("annotate") {
         post {
           parameterSeq { _params =>
@@ -154,33 +354,68 @@ where <annotator name> may be specific name such as corenlp or kuromoji."""
 
               val params = _params.toMap ++ formParamSeq.toMap
 
-              val maybePipeline = (actor ? PipelineServer.Params(params)).mapTo[Pipeline]
+              annotateWith(params) { _.annotate(text) }
+            }
+          }
+        }
+      } ~ path("annotate_batch") {
+        post {
+          parameterSeq { _params =>
+            formFieldSeq { _forms =>
+              // Unlike /annotate, each "q" is a separate document.
+              val (textSeq, formParamSeq) = _forms.partition(_._1 == "q")
+              val texts = textSeq map (_._2)
 
-              val maybeResult = maybePipeline map { pipeline =>
-                try {
-                  val annotation = pipeline.annotate(text)
+              val params = _params.toMap ++ formParamSeq.toMap
 
-                  def outputBy(format: String): String = format match {
-                    case "json" => JSONUtil.toJSON(annotation).toString
-                    case _ =>
-                      val w = new java.io.StringWriter
-                      pipeline.writeTo(w, annotation)
-                      w.toString
-                  }
-                  params get "outputFormat" match {
-                    case Some(a) if a == "json" || a == "xml" => outputBy(a)
-                    case _ => outputBy("xml")
-                  }
-                } catch { case e: Throwable =>
-                    val sw = new java.io.StringWriter
-                    e.printStackTrace(new java.io.PrintWriter(sw))
-                    sys.error(sw.toString)
-                }
+              annotateWith(params) { _.annotateTexts(texts) }
+            }
+          }
+        }
+      } ~ path("annotate_stream") {
+        post {
+          parameterSeq { _params =>
+            formFieldSeq { _forms =>
+              val (textSeq, formParamSeq) = _forms.partition(_._1 == "q")
+              val texts = textSeq map (_._2)
+
+              val params = _params.toMap ++ formParamSeq.toMap
+              val unit = params.getOrElse("unit", "sentence")
+              val (serialize, contentType) = params get "outputFormat" match {
+                case Some("json") => (JSONUtil.toCompactJSON _, PipelineServer.`application/x-ndjson`)
+                case _ => (PipelineServer.toXMLLine _, ContentTypes.`text/plain(UTF-8)`)
+              }
+
+              if (!PipelineServer.streamUnitNames.contains(unit)) {
+                complete(StatusCodes.BadRequest,
+                  s"Unknown unit: $unit. Choose from ${PipelineServer.streamUnitNames mkString ", "}.")
+              } else if (isBusy) {
+                // The response cannot be 503 once streaming is started.
+                throw new RejectedExecutionException
+              } else withTimeout(params) { t =>
+                // Each document is annotated only when the previous one has been sent,
+                // so the server holds at most one annotated document at a time.
+                val lines = Source.fromFuture(poolFor(params, t)) flatMapConcat { pool =>
+                  Source(texts.toList).mapAsync(1) { text =>
+                    val deadline = t.fromNow
+                    onWorker(deadline) {
+                      pool.using(deadline) { pipeline =>
+                        val document = (pipeline.annotateTexts(Seq(text)) \ "document").head
+                        PipelineServer.streamUnits(document, unit).toList
+                      }
+                    }
+                  }.mapConcat(identity)
+                } map { node => ByteString(serialize(node) + "\n") }
+
+                complete(HttpEntity.Chunked.fromData(contentType, lines))
               }
-              complete(maybeResult)
             }
           }
         }
+      } ~ path("metrics") {
+        get {
+          complete(Metrics.render())
+        }
       } ~ pathPrefix("help") {
         pathEnd {
           complete(mkHelp("true"))
@@ -196,6 +431,7 @@ where <annotator name> may be specific name such as corenlp or kuromoji."""
           }
         }
       }
+    }
 
     val bindingFuture = Http().bindAndHandle(route, host, port)
 
@@ -207,7 +443,10 @@ where <annotator name> may be specific name such as corenlp or kuromoji."""
 
     bindingFuture
       .flatMap(_.unbind()) // trigger unbinding from the port
-      .onComplete(_ => system.terminate()) // and shutdown when done
+      .onComplete { _ =>
+        system.terminate() // and shutdown when done
+        workerPool.shutdown()
+      }
   }
 
   protected def waitForShutdownSignal(system: ActorSystem)(implicit ec: ExecutionContext): Future[Done] = {
@@ -235,6 +474,26 @@ object PipelineServer {
     def isEmpty() = kvs.isEmpty
   }
 
+  val `application/x-ndjson` =
+    MediaType.applicationWithFixedCharset("x-ndjson", HttpCharsets.`UTF-8`).toContentType
+
+  val streamUnitNames = Seq("sentence", "document")
+
+  /** Split an annotated document into the elements output by annotate_stream.
+    * For "sentence", these are the sentences followed by the document without them.
+    */
+  def streamUnits(document: Node, unit: String): Seq[Node] = unit match {
+    case "document" => Seq(document)
+    case "sentence" =>
+      val sentences = document \ "sentences" \ "sentence"
+      val rest = document.child filterNot (_.label == "sentences")
+      sentences :+ (document replaceChild rest)
+  }
+
+  /** One-line XML, where newlines in texts and attributes are escaped. */
+  def toXMLLine(node: Node): String =
+    <root>{ node }</root>.toUnformatted.child.mkString.replace("\r", "&#13;").replace("\n", "&#10;")
+
   def main(args: Array[String]): Unit = {
 
     val props = jigg.util.ArgumentsParser.parse(args.toList)
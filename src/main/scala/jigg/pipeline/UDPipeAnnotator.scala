@@ -21,6 +21,8 @@ import java.util.Properties
 
 import scala.xml._
 import scala.collection.mutable.ArrayBuffer
+import scala.concurrent.{Await, Future}
+import scala.concurrent.duration.Duration
 
 import jigg.util.PropertiesUtil
 import jigg.util.ResourceUtil
@@ -28,8 +30,8 @@ import jigg.util.XMLUtil.RichNode
 
 /** UDPipe annotator
   *
-  * We do not support parallel processing, for simplicity, and assuming UDPipe
-  * is already sufficiently fast.
+  * We do not launch more than one process, as the model is relatively large. Instead,
+  * documents may be processed concurrently by threads in the process (see `threads`).
   */
 trait UDPipeAnnotator extends Annotator with IOCreator {
 
@@ -37,6 +39,9 @@ trait UDPipeAnnotator extends Annotator with IOCreator {
 
   @Prop(gloss = "Path to 'activate' script of the virtual environment that you wish to run on depccg") var venv = ""
   @Prop(gloss = "Path to the model file (e.g., english-ud-2.0-170801.udpipe)", required = true) var model = ""
+  @Prop(gloss = "If true, communicate with udpipe by length-prefixed frames instead of lines") var framed = false
+  @Prop(gloss = "If true, stream CoNLL-U sentence by sentence to and from udpipe (only for pos and parse)") var stream = false
+  @Prop(gloss = "Number of threads in udpipe processing documents concurrently with a shared model") var threads = 1
   readProps()
 
   override def nThreads = 1
@@ -72,6 +77,26 @@ trait UDPipeAnnotator extends Annotator with IOCreator {
   "${name}[parse]" requires that "@feats" and "@upos" attributes for each token are
   annotated beforehand, and currently they are only given by "udpipe[pos]". So please
   specify "${name}[pos]" as a POS tagger, if you want to do dependency parsing on UDPipe.
+
+  With "-${name}.framed true", inputs and outputs are exchanged as frames prefixed by the
+  byte length instead of lines ending with "####EOD####" and "END". Then, a text
+  containing such a line is safe, and all documents in the annotation are sent at once
+  before reading the results.
+
+  With "-${name}.threads n" (n > 1), a pool of n threads in the udpipe process handles
+  documents concurrently. The threads share one loaded model, and each has its own
+  UDPipe pipeline, so the memory is that of a single model. All documents in the
+  annotation are then sent at once, with or without "-${name}.framed". This is effective
+  for an input with several documents, e.g., a file given with "-inputFormat json"; since
+  the threads run within the python binding of UDPipe, the speedup also depends on how
+  much the binding releases the GIL.
+
+  With "-${name}.stream true", which is valid for "${name}[pos]", "${name}[parse]",
+  and "${name}[pos,parse]" in the line protocol, the tokens are written sentence by
+  sentence while udpipe tags and parses each sentence directly with the model (without
+  setting up the tokenizer) and writes the result as soon as it is done. udpipe then
+  keeps only one sentence in memory, and the results of a long document start to
+  arrive before the whole input is written.
 """
 
   override def softwareUrl = ""
@@ -93,19 +118,28 @@ trait UDPipeAnnotator extends Annotator with IOCreator {
   lazy val script: File = ResourceUtil.readPython("udpipe.py")
   def command = {
     val venvcommand = if (venv == "") "" else s"source ${venv} && "
-    venvcommand + s"python ${script.getPath} $model '$mode'"
+    venvcommand + s"python ${script.getPath} $model '$mode'" +
+      (if (framed) " --framed" else "") + (if (threads > 1) s" --threads $threads" else "") +
+      (if (stream) " --stream" else "")
   }
 
   override def launchTesters = {
     // One CoNLL line can also be regarded as a raw input.
     val l = "1\tThis\tthis\tPRON\tDT\tNumber=Sing|PronType=Dem\t_\t_\t_\t_"
-    Seq(LaunchTester(l+"\n####EOD####", _ == "END", _ == "END"))
+    if (framed) Seq(framedLaunchTester)
+    else Seq(LaunchTester(l+"\n####EOD####", _ == "END", _ == "END"))
   }
 
+  // In stream mode, the errors of sentences written to stderr must not be read as
+  // results.
+  override def mergeErrorStream = !(framed || stream)
+
   lazy val udpipe = mkIO()
   override def close() = udpipe.close()
 
   override def init() = {
+    if (stream && (doTokenize || framed || threads > 1))
+      throw new ArgumentError(s"${name}.stream cannot be used with tokenize, framed, or threads > 1.")
     udpipe
   }
 
@@ -115,15 +149,58 @@ trait UDPipeAnnotator extends Annotator with IOCreator {
     * 2. give it to pipeline
     * 3. add information to root
     */
-  def annotate(annotation: Node) = {
-    annotation.replaceAll("document") { e =>
-      val input = mkInput(e)
+  def annotate(annotation: Node) =
+    if (framed) annotateFramed(annotation)
+    else if (threads > 1) annotatePipelined(annotation)
+    else if (stream) annotateStreaming(annotation)
+    else annotation.replaceAll("document") { e =>
+      val input = mkInput(e) + "\n####EOD####"
       val result = runUDPipe(input)
 
       val conllSentences = readCoNLLUSentences(result)
 
       addAnnotation(e, conllSentences)
     }
+
+  /** Send the inputs of all documents before reading the results.
+    */
+  private def annotateFramed(annotation: Node) = {
+    val results = udpipe.request((annotation \\ "document") map mkInput).toIterator
+    annotation.replaceAll("document") { e =>
+      val conllSentences = readCoNLLUSentences(results.next.split("\n"))
+      addAnnotation(e, conllSentences)
+    }
+  }
+
+  /** Send the inputs of all documents before reading the results, so that threads in
+    * udpipe can process them concurrently. udpipe keeps reading inputs while writing
+    * results, in the order of inputs.
+    */
+  private def annotatePipelined(annotation: Node) = {
+    udpipe.safeWriteWithFlush((annotation \\ "document") map (mkInput(_) + "\n####EOD####"))
+    annotation.replaceAll("document") { e =>
+      val conllSentences = readCoNLLUSentences(udpipe.readUntil(_ == "END").dropRight(1))
+      addAnnotation(e, conllSentences)
+    }
+  }
+
+  /** Write the tokens of each document in another thread, since udpipe writes the
+    * results of sentences while reading the remaining ones.
+    */
+  private def annotateStreaming(annotation: Node) = {
+    implicit val context = EasyIO.ioContext
+
+    annotation.replaceAll("document") { e =>
+      val writing = Future {
+        udpipe.communicator.safeWriteWithFlush(conlluLines(e) ++ Iterator("####EOD####"))
+      }
+      val result = udpipe.readUntil(_ == "END").dropRight(1)
+      Await.result(writing, Duration.Inf) match {
+        case Left(error) => throw error
+        case _ =>
+      }
+      addAnnotation(e, readCoNLLUSentences(result))
+    }
   }
 
   private def runUDPipe(input: String): Seq[String] = {
@@ -132,7 +209,7 @@ trait UDPipeAnnotator extends Annotator with IOCreator {
   }
 
   def mkInput(document: Node): String =
-    (if (doTokenize) node2raw(document) else node2conllu(document)) + "\n####EOD####"
+    if (doTokenize) node2raw(document) else node2conllu(document)
 
   def addAnnotation(document: Node, conllSentences: Seq[CoNLLSentence]): Node = {
     val sentencesNode = doTokenize match {
@@ -164,21 +241,29 @@ trait UDPipeAnnotator extends Annotator with IOCreator {
     */
   private def node2conllu(document: Node): String = {
     val sentences = document \ "sentences" \ "sentence"
-    sentences.flatMap { sentence =>
-      val tokens = sentence \ "tokens" \ "token"
-      val lines = tokens.zipWithIndex.map { case (token, i) =>
-        def underlineOr(r: String) = if (r == "") "_" else r
-
-        val form = token \@ "form"
-        val lemma = underlineOr(token \@ "lemma")
-        val pos = underlineOr(token \@ "pos")
-        val upos = underlineOr(token \@ "upos")
-        val feats = underlineOr(token \@ "feats")
-
-        s"${i+1}\t${form}\t${lemma}\t${upos}\t${pos}\t${feats}\t_\t_\t_\t_"
-      }
-      lines :+ "\n"
-    }.mkString("\n")
+    sentences.flatMap { sentence => sentence2conllu(sentence) :+ "\n" }.mkString("\n")
+  }
+
+  /** The same as `node2conllu` but given lazily as lines, one sentence at a time.
+    */
+  private def conlluLines(document: Node): Iterator[String] = {
+    val sentences = document \ "sentences" \ "sentence"
+    sentences.iterator.flatMap { sentence => sentence2conllu(sentence) :+ "" }
+  }
+
+  private def sentence2conllu(sentence: Node): Seq[String] = {
+    val tokens = sentence \ "tokens" \ "token"
+    tokens.zipWithIndex.map { case (token, i) =>
+      def underlineOr(r: String) = if (r == "") "_" else r
+
+      val form = token \@ "form"
+      val lemma = underlineOr(token \@ "lemma")
+      val pos = underlineOr(token \@ "pos")
+      val upos = underlineOr(token \@ "upos")
+      val feats = underlineOr(token \@ "feats")
+
+      s"${i+1}\t${form}\t${lemma}\t${upos}\t${pos}\t${feats}\t_\t_\t_\t_"
+    }
   }
 
   def readCoNLLUSentences(lines: Seq[String]) = {
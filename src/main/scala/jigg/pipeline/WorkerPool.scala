@@ -0,0 +1,86 @@
+package jigg.pipeline
+
+/*
+ Copyright 2013-2017 Hiroshi Noji
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+*/
+
+import java.util.concurrent.{LinkedBlockingQueue, RejectedExecutionException, ScheduledThreadPoolExecutor, ThreadFactory, ThreadPoolExecutor, TimeUnit, TimeoutException}
+
+import scala.concurrent.{ExecutionContext, Future, Promise}
+import scala.concurrent.duration.Deadline
+import scala.util.{Failure, Try}
+
+import jigg.util.Metrics
+
+/** The threads annotating the requests of PipelineServer.
+  *
+  * Annotation blocks the thread, so it is run by `workers` dedicated threads instead of
+  * the dispatcher of akka. At most `queueSize` requests wait for a worker; the others
+  * are rejected with RejectedExecutionException. A request still waiting at its deadline
+  * is removed from the queue, and fails with TimeoutException.
+  */
+class WorkerPool(workers: Int, queueSize: Int) {
+
+  private[this] val executor = new ThreadPoolExecutor(workers, workers, 0L,
+    TimeUnit.MILLISECONDS, new LinkedBlockingQueue[Runnable](queueSize))
+
+  private[this] val expiries = new ScheduledThreadPoolExecutor(1, new ThreadFactory {
+    def newThread(r: Runnable) = {
+      val t = new Thread(r, "jigg-expiry")
+      t.setDaemon(true)
+      t
+    }
+  })
+  expiries.setRemoveOnCancelPolicy(true)
+
+  /** Run `body` by a worker, unless `deadline` passes before a worker starts it. */
+  def submit[A](deadline: Deadline)(body: => A)(implicit ec: ExecutionContext): Future[A] = {
+    val submitted = System.nanoTime
+    val promise = Promise[A]()
+
+    def finish(result: Try[A]) = {
+      result match {
+        case Failure(e: TimeoutException) => PipelineMetrics.timedOutRequests.inc()
+        case _ =>
+      }
+      promise.tryComplete(result)
+    }
+    def timedOut = Failure(new TimeoutException("The request timed out before it was annotated."))
+
+    val task = new Runnable {
+      def run() = {
+        PipelineMetrics.queueWaitSeconds.observe(Metrics.secondsSince(submitted))
+        finish(if (deadline.isOverdue) timedOut else Try(body))
+      }
+    }
+    try {
+      executor.execute(task)
+      val expiry = expiries.schedule(new Runnable {
+        def run() = if (executor.remove(task)) finish(timedOut)
+      }, deadline.timeLeft.toNanos, TimeUnit.NANOSECONDS)
+      promise.future.onComplete { _ => expiry.cancel(false) }
+      promise.future
+    } catch { case e: RejectedExecutionException => Future.failed(e) }
+  }
+
+  def isBusy = executor.getQueue.remainingCapacity == 0
+
+  def numWaiting = executor.getQueue.size
+
+  def shutdown() = {
+    executor.shutdown()
+    expiries.shutdown()
+  }
+}
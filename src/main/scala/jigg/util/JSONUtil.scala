@@ -27,7 +27,26 @@ object JSONUtil {
 
   def toJSON(x: Node): String = toJSONFromNode(x)
 
+  /** Unlike `toJSON`, the output is a single line, and `x` itself, including its
+    * attributes and text, is the top-level object. This is used to output each
+    * element (e.g., sentence) on a separate line, as in NDJSON.
+    */
+  def toCompactJSON(x: Node): String =
+    compact(render(parse(escape(serializing(<root>{ x }</root>).toString))))
+
   private def toJSONFromNode(node: Node): String = {
+    val sb = new StringBuilder
+    sb.append('{')
+    sb.append(List("\".tag\":\"", node.label, "\",").mkString)
+    sb.append("\".child\":")
+    sb.append("[")
+    sb.append(serializing(node))
+    sb.append("]")
+    sb.append("}")
+    pretty(render(parse(escape(sb.toString))))
+  }
+
+  private def escape(jsonStr: String): String = {
     val unescapeMap = Map(
       // For JSON escaping
       "\r" -> "\\r",
@@ -39,19 +58,10 @@ object JSONUtil {
       "&amp;" -> "&",
       "&quot;" -> "\\\""
     )
-    val sb = new StringBuilder
-    sb.append('{')
-    sb.append(List("\".tag\":\"", node.label, "\",").mkString)
-    sb.append("\".child\":")
-    sb.append("[")
-    sb.append(serializing(node))
-    sb.append("]")
-    sb.append("}")
     // The "parse" method can't handle the string with several special characters,
     // because the "JString" class can't accept such kind of string.
     // To escape this issue, we replace such characters before throwing it to the "parse" method.
-    val escapedStr = unescapeMap.foldLeft(sb.toString.replace("\\","\\\\")) { (text, pair) => text.replace(pair._1, pair._2)}
-    pretty(render(parse(escapedStr)))
+    unescapeMap.foldLeft(jsonStr.replace("\\","\\\\")) { (text, pair) => text.replace(pair._1, pair._2)}
   }
 
   private def serializing[T <: Node](x: T): StringBuilder = {
@@ -63,8 +73,8 @@ object JSONUtil {
         val retsb = serializing(i)
         subsb.append(prefix)
         prefix = ","
-        subsb.append(List("{\".tag\":\"", i.label, "\",").mkString)
-        var prefix2 = ""
+        subsb.append(List("{\".tag\":\"", i.label, "\"").mkString)
+        var prefix2 = ","
         if (!i.textElem.isEmpty) {
           subsb.append(prefix2)
           val text = new StringBuilder
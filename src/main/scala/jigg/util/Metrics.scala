@@ -0,0 +1,113 @@
+package jigg.util
+
+/*
+ Copyright 2013-2017 Hiroshi Noji
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ */
+
+import java.util.concurrent.ConcurrentHashMap
+import java.util.concurrent.atomic.{DoubleAdder, LongAdder}
+
+import scala.collection.JavaConverters._
+import scala.collection.mutable.ArrayBuffer
+
+/** A minimal registry of counters and summaries (sum and count of observations), which
+  * can be rendered in the text format of Prometheus.
+  *
+  * All metrics are thread-safe and cheap to update, so they can be updated for every
+  * annotation.
+  */
+object Metrics {
+
+  type Labels = Seq[(String, String)]
+
+  sealed abstract class Metric(val name: String, val help: String, val kind: String) {
+    def samples: Seq[(String, Labels, Double)]
+
+    protected def get[A](map: ConcurrentHashMap[Labels, A], labels: Labels, mk: =>A): A =
+      map.get(labels) match {
+        case null =>
+          map.putIfAbsent(labels, mk)
+          map.get(labels)
+        case a => a
+      }
+  }
+
+  class Counter(name: String, help: String) extends Metric(name, help, "counter") {
+    private[this] val values = new ConcurrentHashMap[Labels, DoubleAdder]
+
+    def inc(labels: (String, String)*): Unit = add(1.0, labels: _*)
+
+    def add(n: Double, labels: (String, String)*): Unit =
+      get(values, labels, new DoubleAdder).add(n)
+
+    def samples = values.asScala.toSeq map { case (labels, v) => (name, labels, v.sum) }
+  }
+
+  class Summary(name: String, help: String) extends Metric(name, help, "summary") {
+    private[this] val sums = new ConcurrentHashMap[Labels, DoubleAdder]
+    private[this] val counts = new ConcurrentHashMap[Labels, LongAdder]
+
+    def observe(value: Double, labels: (String, String)*): Unit = {
+      get(sums, labels, new DoubleAdder).add(value)
+      get(counts, labels, new LongAdder).increment()
+    }
+
+    /** Observe the elapsed time of `body` in seconds. */
+    def time[A](labels: (String, String)*)(body: =>A): A = {
+      val start = System.nanoTime
+      try body finally observe(secondsSince(start), labels: _*)
+    }
+
+    def samples = sums.asScala.toSeq flatMap { case (labels, sum) =>
+      Seq((name + "_sum", labels, sum.sum),
+        (name + "_count", labels, get(counts, labels, new LongAdder).sum.toDouble))
+    }
+  }
+
+  private[this] val metrics = new ArrayBuffer[Metric]
+
+  def counter(name: String, help: String): Counter = register(new Counter(name, help))
+
+  def summary(name: String, help: String): Summary = register(new Summary(name, help))
+
+  private[this] def register[M <: Metric](metric: M): M = synchronized {
+    metrics += metric
+    metric
+  }
+
+  def secondsSince(nanoTime: Long): Double = (System.nanoTime - nanoTime) / 1e9
+
+  /** All metrics in the Prometheus text format. */
+  def render(): String = {
+    val sb = new StringBuilder
+    for (metric <- synchronized { metrics.toList }) {
+      sb ++= s"# HELP ${metric.name} ${metric.help}\n"
+      sb ++= s"# TYPE ${metric.name} ${metric.kind}\n"
+      for ((name, labels, value) <- metric.samples.sortBy(_._2.toString)) {
+        sb ++= name
+        if (labels.nonEmpty)
+          sb ++= labels map { case (k, v) => k + "=\"" + escape(v) + "\"" } mkString ("{", ",", "}")
+        sb ++= " " + format(value) + "\n"
+      }
+    }
+    sb.toString
+  }
+
+  private[this] def format(value: Double) =
+    if (value == value.floor && !value.isInfinite) value.toLong.toString else value.toString
+
+  private[this] def escape(v: String) =
+    v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+}
@@ -1,27 +1,35 @@
 package jigg.util
 
 import java.io.File
+import java.nio.file.Files
 
 object ResourceUtil {
 
+  /** Helper modules in `resources/python`, which are copied with every script. */
+  val pythonHelpers = Seq("jigg_io.py")
+
   /** Read a python script found in `resources/python/xxx.py`. Since these files cannot
-    * be executed directly we create a temporary file by copying the script first, and
-    * return the resulting temp file.
+    * be executed directly we create a temporary directory, copy the script and the
+    * helper modules (`pythonHelpers`) there, and return the copied script.
     *
     * @param name script name, corresponding to `xxx.py`.
     */
   def readPython(name: String): File = {
-    val script = File.createTempFile("jigg", ".py")
-      script.deleteOnExit
-      val stream = getClass.getResourceAsStream(s"/python/${name}")
-      IOUtil.writing(script.getPath) { o =>
-        scala.io.Source.fromInputStream(stream).getLines foreach { line =>
-          o.write(line + "\n")
-        }
+    val dir = Files.createTempDirectory("jigg").toFile
+    dir.deleteOnExit
+    for (helper <- pythonHelpers) copyResource(s"/python/${helper}", new File(dir, helper))
+    copyResource(s"/python/${name}", new File(dir, name))
+  }
+
+  private def copyResource(path: String, file: File): File = {
+    file.deleteOnExit // called after that of the directory, so deleted before it
+    val stream = getClass.getResourceAsStream(path)
+    IOUtil.writing(file.getPath) { o =>
+      scala.io.Source.fromInputStream(stream).getLines foreach { line =>
+        o.write(line + "\n")
       }
-      script
+    }
+    file
   }
 
 }
-
-
@@ -75,4 +75,45 @@ object TreesUtil {
     val (rootId, _) =  readTopdown(0)
     <parse root={ rootId } annotators={ annotator }>{ spans }</parse>
   }
+
+  /** Builds the same node as `streeToNode` from labeled spans over tokens, without
+    * reading a tree string.
+    *
+    * `spans` are `(begin, end, label)` (`end` is exclusive) in preorder, where a unary
+    * chain is given from the top. Tokens not covered by any child span become the
+    * children of the smallest span covering them.
+    */
+  def spansToNode(spans: Seq[(Int, Int, String)], sentence: Node, annotator: String) = {
+    val tokenIds = ((sentence \ "tokens").head \ "token") map (_ \@ "id")
+
+    class OpenSpan(val begin: Int, val end: Int, val label: String) {
+      val children = new ArrayBuffer[String]
+      var next = begin // the first token not yet added to children
+      def addTokensUntil(i: Int) = while (next < i) { children += tokenIds(next); next += 1 }
+    }
+
+    val nodes = new ArrayBuffer[Node]
+    val stack = new ArrayBuffer[OpenSpan]
+    var rootId = ""
+
+    def close() = {
+      val span = stack.remove(stack.size - 1)
+      span.addTokensUntil(span.end)
+      val id = Annotation.ParseSpan.nextId
+      nodes += <span id={ id } symbol={ span.label } children={ span.children mkString " " }/>
+      if (stack.isEmpty) rootId = id else stack.last.children += id
+    }
+
+    for ((begin, end, label) <- spans) {
+      while (stack.nonEmpty && (begin < stack.last.begin || end > stack.last.end)) close()
+      if (stack.nonEmpty) {
+        stack.last.addTokensUntil(begin)
+        stack.last.next = end
+      }
+      stack += new OpenSpan(begin, end, label)
+    }
+    while (stack.nonEmpty) close()
+
+    <parse root={ rootId } annotators={ annotator }>{ nodes }</parse>
+  }
 }
@@ -62,4 +62,78 @@ END"""
       <span id="sp2" symbol="S" children="sp0 sp1 t7"/>
       </parse>) (decided by sameElem)
   }
+
+  it should "parse all sentences of documents at once and keep the order" in {
+    val root =
+      <root>
+        <document id="d1">
+          <sentences>
+            <sentence id="s1" characterOffsetBegin="0" characterOffsetEnd="14">
+              He ate pizza .
+              <tokens annotators="corenlp">
+                <token characterOffsetEnd="2" characterOffsetBegin="0" id="t0" form="He" pos="PRP"/>
+                <token characterOffsetEnd="6" characterOffsetBegin="3" id="t1" form="ate" pos="VBD"/>
+                <token characterOffsetEnd="12" characterOffsetBegin="7" id="t2" form="pizza" pos="NN"/>
+                <token characterOffsetEnd="14" characterOffsetBegin="13" id="t3" form="." pos="."/>
+              </tokens>
+            </sentence>
+          </sentences>
+        </document>
+        <document id="d2">
+          <sentences>
+            <sentence id="s2" characterOffsetBegin="0" characterOffsetEnd="6">
+              He ran
+              <tokens annotators="corenlp">
+                <token characterOffsetEnd="2" characterOffsetBegin="0" id="t4" form="He" pos="PRP"/>
+                <token characterOffsetEnd="6" characterOffsetBegin="3" id="t5" form="ran" pos="VBD"/>
+              </tokens>
+            </sentence>
+          </sentences>
+        </document>
+      </root>
+
+    val output = """(S (NP (PRP He)) (VP (VBD ate) (NN pizza)) (. .))
+(S (NP (PRP He)) (VP (VBD ran)))
+END"""
+
+    Annotation.ParseSpan.idGen.reset()
+    val ann = new AnnotatorStub(output)
+    val annotation = ann.annotate(root)
+
+    val parses = annotation \\ "sentence" map (s => (s \ "parse").head)
+    parses.size should be(2)
+    parses(0) \@ "root" should be("sp2")
+    (parses(1) \ "span") map (_ \@ "children") should be(Seq("t4", "t5", "sp3 sp4"))
+  }
+
+  it should "read the compact output" in {
+    val sentence =
+      <sentence id="s1" characterOffsetBegin="0" characterOffsetEnd="14">
+        He ate pizza .
+        <tokens annotators="corenlp">
+          <token characterOffsetEnd="2" characterOffsetBegin="0" id="t4" form="He" pos="PRP"/>
+          <token characterOffsetEnd="6" characterOffsetBegin="3" id="t5" form="ate" pos="VBD"/>
+          <token characterOffsetEnd="12" characterOffsetBegin="7" id="t6" form="pizza" pos="NN"/>
+          <token characterOffsetEnd="14" characterOffsetBegin="13" id="t7" form="." pos="."/>
+        </tokens>
+      </sentence>
+
+    val props = new Properties
+    props.setProperty("benepar.compact", "true")
+    val ann = new BeneParAnnotator("benepar", props) {
+      override def mkLocalAnnotator = new LocalBeneParAnnotator {
+        override def mkCommunicator =
+          new StubExternalCommunicator(Seq("PRP VBD NN .\t0 4 S 0 1 NP 1 3 VP", "END").mkString("\n"))
+      }
+    }
+
+    Annotation.ParseSpan.idGen.reset()
+    val annotation = ann.annotate(<document id="d1"><sentences>{ sentence }</sentences></document>)
+
+    (annotation \\ "parse").head should equal(<parse annotators="benepar" root="sp2">
+      <span id="sp0" symbol="NP" children="t4"/>
+      <span id="sp1" symbol="VP" children="t5 t6"/>
+      <span id="sp2" symbol="S" children="sp0 sp1 t7"/>
+      </parse>) (decided by sameElem)
+  }
 }
@@ -146,4 +146,145 @@ END
     )
   }
 
+  it should "read the output in a frame with the framed protocol" in {
+    val framedP = new Properties
+    framedP.setProperty("depccg.framed", "true")
+
+    val ann = new DepCCGAnnotator("depccg", framedP) {
+      override def mkLocalAnnotator = new LocalDepCCGAnnotator {
+        override def mkCommunicator = new StubExternalCommunicator(
+          // no leading message and no END line; END is a valid token here.
+          """<candc><ccgs><ccg>
+<lf start="0" span="1" word="END" lemma="XX" pos="x" chunk="XX" entity="x" cat="NP" />
+</ccg></ccgs></candc>""")
+      }
+      override def nThreads = 1
+    }
+
+    val doc =
+      <document id="d1">
+        <sentences>
+          <sentence id="s1" characterOffsetBegin="0" characterOffsetEnd="3">
+            END
+            <tokens annotators="corenlp">
+              <token characterOffsetEnd="3" characterOffsetBegin="0" id="t0" form="END"/>
+            </tokens>
+          </sentence>
+        </sentences>
+      </document>
+
+    val spans = ann.annotate(doc) \\ "ccg" \ "span"
+    spans.size should equal (1)
+    spans.head \@ "symbol" should equal ("NP")
+    spans.head \@ "children" should equal ("t0")
+  }
+
+  it should "produce the same annotation from the compact output as from XML" in {
+    val compactP = new Properties
+    compactP.setProperty("depccg.compact", "true")
+
+    val ann = new DepCCGAnnotator("depccg", compactP) {
+      override def mkLocalAnnotator = new LocalDepCCGAnnotator {
+        override def mkCommunicator = new StubExternalCommunicator(Seq(
+          "1\t( rp S[dcl] ( ba S[dcl] NP ( fa S[dcl]\\NP (S[dcl]\\NP)/NP ( lex NP N ) ) ) . )",
+          "1\t( ba S[dcl] NP ( fa S[dcl]\\NP (S[dcl]\\NP)/NP ( lex NP N ) ) )",
+          "END").mkString("\n"))
+      }
+      override def nThreads = 1
+    }
+    val xmlAnn = new AnnotatorStub("""1..
+<candc><ccgs>
+<ccg>
+<rule cat="S[dcl]" type="rp">
+<rule cat="S[dcl]" type="ba">
+<lf cat="NP" word="He" span="1" start="0"/>
+<rule cat="S[dcl]\NP" type="fa">
+<lf cat="(S[dcl]\NP)/NP" word="ate" span="1" start="1"/>
+<rule cat="NP" type="lex"><lf cat="N" word="pizza" span="1" start="2"/></rule>
+</rule>
+</rule>
+<lf cat="." word="." span="1" start="3"/>
+</rule>
+</ccg>
+<ccg>
+<rule cat="S[dcl]" type="ba">
+<lf cat="NP" word="He" span="1" start="0"/>
+<rule cat="S[dcl]\NP" type="fa">
+<lf cat="(S[dcl]\NP)/NP" word="ate" span="1" start="1"/>
+<rule cat="NP" type="lex"><lf cat="N" word="pizza" span="1" start="2"/></rule>
+</rule>
+</rule>
+</ccg>
+</ccgs></candc>
+END""")
+
+    val doc =
+      <document id="d1">
+        <sentences>
+          <sentence id="s1" characterOffsetBegin="0" characterOffsetEnd="14">
+            He ate pizza .
+            <tokens annotators="corenlp">
+              <token characterOffsetEnd="2" characterOffsetBegin="0" id="t4" form="He"/>
+              <token characterOffsetEnd="6" characterOffsetBegin="3" id="t5" form="ate"/>
+              <token characterOffsetEnd="12" characterOffsetBegin="7" id="t6" form="pizza"/>
+              <token characterOffsetEnd="14" characterOffsetBegin="13" id="t7" form="."/>
+            </tokens>
+          </sentence>
+        </sentences>
+      </document>
+
+    def annotateFromZero(a: DepCCGAnnotator) = {
+      Annotation.CCGSpan.idGen.reset()
+      Annotation.CCG.idGen.reset()
+      a.annotate(doc) \\ "ccg"
+    }
+
+    val ccgs = annotateFromZero(ann)
+    ccgs.size should equal (2)
+    ccgs should equal (annotateFromZero(xmlAnn))
+  }
+
+  it should "add a placeholder ccg for a sentence that failed to be parsed" in {
+    val doc =
+      <document id="d1">
+        <sentences>
+          <sentence id="s1" characterOffsetBegin="0" characterOffsetEnd="1">
+            A
+            <tokens annotators="corenlp">
+              <token characterOffsetEnd="1" characterOffsetBegin="0" id="t0" form="A"/>
+            </tokens>
+          </sentence>
+          <sentence id="s2" characterOffsetBegin="2" characterOffsetEnd="3">
+            B
+            <tokens annotators="corenlp">
+              <token characterOffsetEnd="3" characterOffsetBegin="2" id="t1" form="B"/>
+            </tokens>
+          </sentence>
+        </sentences>
+      </document>
+
+    val ann = new AnnotatorStub("""1..
+<candc>
+<ccgs sentence="1"><ccg sentence="1" id="1" failure="timeout"/></ccgs>
+<ccgs sentence="2"><ccg><lf start="0" span="1" word="B" cat="N" /></ccg></ccgs>
+</candc>
+END""")
+    val ccgs = ann.annotate(doc) \\ "sentence" map (_ \ "ccg")
+    (ccgs(0) \@ "failure") should equal ("timeout")
+    (ccgs(0) \ "span") shouldBe empty
+    (ccgs(1) \ "span").size should equal (1)
+
+    val compactP = new Properties
+    compactP.setProperty("depccg.compact", "true")
+    val compactAnn = new DepCCGAnnotator("depccg", compactP) {
+      override def mkLocalAnnotator = new LocalDepCCGAnnotator {
+        override def mkCommunicator =
+          new StubExternalCommunicator("1\t!length\n2\tN\nEND")
+      }
+      override def nThreads = 1
+    }
+    val compactCCGs = compactAnn.annotate(doc) \\ "sentence" map (_ \ "ccg")
+    (compactCCGs(0) \@ "failure") should equal ("length")
+    (compactCCGs(1) \ "span").size should equal (1)
+  }
 }
@@ -0,0 +1,144 @@
+package jigg.pipeline
+
+/*
+ Copyright 2013-2017 Hiroshi Noji
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+*/
+
+import java.io.IOException
+import java.util.Properties
+import scala.collection.mutable
+import scala.xml.Node
+import org.scalatest._
+
+class EasyIOSpec extends FlatSpec with Matchers {
+
+  /** A process that answers the upper case of each input followed by EOS, and dies by
+    * an input for which `crash` is true.
+    */
+  class FlakyCommunicator(crash: String=>Boolean) extends IOCommunicator {
+    var alive = true
+    var waits = 0
+    val outputs = mutable.Queue[String]()
+
+    def isAlive = alive
+    override def waitForExit(millis: Long) = { waits += 1; !alive }
+    def write(line: String) = writeln(line)
+    def writeln(line: String) =
+      if (!alive) throw new IOException("Broken pipe")
+      else if (crash(line)) alive = false
+      else outputs ++= Seq(line.toUpperCase, "EOS")
+    def flush() = {}
+
+    def readingIter = Iterator.continually(if (outputs.nonEmpty) outputs.dequeue else null)
+  }
+
+  class SupervisedAnnotator(crash: String=>Boolean) extends EasyIO {
+    override def name = "flaky"
+    def annotate(annotation: Node) = annotation
+
+    var started = 0
+    override protected def respawn = Some(() => { started += 1; new FlakyCommunicator(crash) })
+    val communicator = respawn.get()
+    val io = mkIO(communicator)
+
+    def run(input: String): Seq[String] = {
+      io.safeWriteWithFlush(input)
+      io.readUntil(_ == "EOS").dropRight(1)
+    }
+  }
+
+  "IO" should "restart the dead process and retry the input" in {
+    var crashes = 0
+    val annotator = new SupervisedAnnotator(l => l == "b" && { crashes += 1; crashes == 1 })
+
+    annotator.run("a") should equal (Seq("A"))
+    annotator.run("b") should equal (Seq("B"))
+    annotator.run("c") should equal (Seq("C"))
+    annotator.started should equal (2)
+  }
+
+  it should "throw ProcessDiedError if the process dies again with the retried input" in {
+    val annotator = new SupervisedAnnotator(_ == "b")
+
+    a [ProcessDiedError] should be thrownBy annotator.run("b")
+    annotator.started should equal (2)
+    // The process dead after the error is restarted before the next input.
+    annotator.run("c") should equal (Seq("C"))
+    annotator.started should equal (3)
+  }
+
+  it should "retry all inputs written before reading the outputs" in {
+    var crashes = 0
+    val annotator = new SupervisedAnnotator(l => l == "a" && { crashes += 1; crashes == 1 })
+
+    annotator.io.safeWriteWithFlush(Seq("a", "b"))
+    annotator.io.readUntil(_ == "EOS") should equal (Seq("A", "EOS"))
+    annotator.io.readUntil(_ == "EOS") should equal (Seq("B", "EOS"))
+  }
+
+  it should "not restart the process without respawn" in {
+    val annotator = new EasyIO {
+      def annotate(annotation: Node) = annotation
+    }
+    val io = annotator.mkIO(new FlakyCommunicator(_ == "b"))
+    io.safeWriteWithFlush("b")
+    val e = the [ProcessError] thrownBy io.readUntil(_ == "EOS")
+    e.isInstanceOf[ProcessDiedError] should be (false)
+  }
+
+  it should "not wait for the live process when its output is unexpected" in {
+    val annotator = new SupervisedAnnotator(_ => false)
+
+    annotator.io.safeWriteWithFlush("a")
+    val e = the [ProcessError] thrownBy annotator.io.readUntilIf(_ == "X", _ == "EOS")
+    e.isInstanceOf[ProcessDiedError] should be (false)
+    annotator.communicator.waits should equal (0)
+    annotator.started should equal (1)
+  }
+
+  class ParallelAnnotator(error: Node=>Throwable) extends AnnotatingSentencesInParallel {
+    override def name = "flaky"
+    override def nThreads = 2
+    override val props = new Properties
+    props.setProperty("flaky.maxRestarts", "3")
+    props.setProperty("prespawn", "true")
+
+    def mkLocalAnnotator = new LocalAnnotator {
+      def annotate(annotation: Node) = throw error(annotation)
+    }
+    def local = localAnnotators.head
+  }
+
+  val sentences =
+    <root><document><sentences><sentence>a</sentence><sentence>b</sentence></sentences></document></root>
+
+  "A local annotator" should "be supervised with the settings of its annotator" in {
+    val annotator = new ParallelAnnotator(_ => new ProcessDiedError("died"))
+    annotator.local.maxRestarts should equal (3)
+    annotator.local.prespawn should equal (true)
+    annotator.local.props.isEmpty should be (true)
+  }
+
+  "AnnotatingInParallel" should "annotate a batch with the error if its process died" in {
+    val annotator = new ParallelAnnotator(_ => new ProcessDiedError("died"))
+    val errors = annotator.annotate(sentences) \\ "sentence" \ "error"
+    errors.size should equal (2)
+  }
+
+  it should "throw the other errors" in {
+    val annotator = new ParallelAnnotator(_ => new AnnotationError("bad output"))
+    an [AnnotationError] should be thrownBy annotator.annotate(sentences)
+  }
+}
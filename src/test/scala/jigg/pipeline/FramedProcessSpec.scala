@@ -0,0 +1,82 @@
+package jigg.pipeline
+
+/*
+ Copyright 2013-2017 Hiroshi Noji
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+*/
+
+import java.io.File
+import scala.concurrent.{Await, Future}
+import scala.concurrent.duration._
+import scala.concurrent.ExecutionContext.Implicits.global
+import scala.util.Try
+import scala.xml.Node
+import org.scalatest._
+
+import jigg.util.{IOUtil, ResourceUtil}
+
+/** Runs a wrapper serving by `jigg_io.py` as an external process; requires python. */
+class FramedProcessSpec extends FlatSpec with Matchers {
+
+  def hasPython = Try(new ProcessBuilder("python", "--version").start().waitFor() == 0) getOrElse false
+
+  /** A wrapper that answers each request by the reversed payload after printing a marker,
+    * by `threads` threads.
+    */
+  class EchoAnnotator(threads: Int) extends IOCreator {
+    override def name = "echo"
+    def annotate(annotation: Node) = annotation
+
+    lazy val script: File = {
+      val helper = ResourceUtil.readPython("jigg_io.py")
+      val script = new File(helper.getParentFile, "echo.py")
+      script.deleteOnExit
+      IOUtil.writing(script.getPath) { o =>
+        o.write(s"""import jigg_io
+def handle(payload):
+    print("echo")  # must not be read as a frame
+    return payload[::-1]
+jigg_io.serve(handle, threads=$threads)
+""")
+      }
+      script
+    }
+    def command = s"python ${script.getPath}"
+    def softwareUrl = ""
+    override def launchTesters = Seq(framedLaunchTester)
+    override def mergeErrorStream = false
+
+    lazy val io = mkIO()
+  }
+
+  def payloads = (0 until 8) map { i => (s"$i\nEND\n" * 20000) + "日本語" }
+
+  "IO.request" should "exchange payloads larger than the pipes without blocking" in {
+    assume(hasPython)
+    val annotator = new EchoAnnotator(1)
+    try {
+      val responses = Await.result(Future(annotator.io.request(payloads)), 60.seconds)
+      responses should equal (payloads map (_.reverse))
+    } finally annotator.io.close()
+  }
+
+  it should "not break frames by the outputs to stderr of threads" in {
+    assume(hasPython)
+    val annotator = new EchoAnnotator(4)
+    try {
+      val responses = Await.result(Future(annotator.io.request(payloads)), 60.seconds)
+      responses should equal (payloads map (_.reverse))
+    } finally annotator.io.close()
+  }
+}
@@ -0,0 +1,65 @@
+package jigg.pipeline
+
+/*
+ Copyright 2013-2017 Hiroshi Noji
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+*/
+
+import java.io.ByteArrayInputStream
+import org.scalatest._
+
+class IOCommunicatorSpec extends FlatSpec with Matchers {
+
+  def input(frames: Frame*)(lines: String*) = {
+    val bytes = frames.flatMap(_.toBytes) ++ lines.mkString("\n").getBytes("UTF-8")
+    new ProcessInput(new ByteArrayInputStream(bytes.toArray), 4)
+  }
+
+  "ProcessInput" should "read a frame whose payload contains any lines" in {
+    val payload = "a\nEND\n####EOD####\n日本語"
+    val in = input(Frame(Frame.Response, 3, payload))("next")
+
+    in.readLine() match {
+      case Frame.Header(kind, id, n) =>
+        kind should equal (Frame.Response)
+        id should equal ("3")
+        in.readString(n.toInt) should equal (payload)
+    }
+    in.readLine() should equal ("")
+    in.readLine() should equal ("next")
+    in.readLine() should equal (null)
+  }
+
+  it should "read lines in UTF-8 across the buffer" in {
+    val in = input()("日本語のテキスト\r", "", "abc")
+    in.readLine() should equal ("日本語のテキスト")
+    in.readLine() should equal ("")
+    in.readLine() should equal ("abc")
+    in.readLine() should equal (null)
+  }
+
+  it should "return null if the stream ends in a payload" in {
+    val in = input()("abc")
+    in.readString(10) should equal (null)
+  }
+
+  "StubExternalCommunicator" should "answer frames in the order of requests" in {
+    val communicator = new StubExternalCommunicator(Seq("a", "b"))
+    communicator.safeWriteFrames(Seq(Frame(Frame.Request, 1, "x"), Frame(Frame.Request, 2, "y")))
+
+    communicator.readFrame() should equal (Right(Frame(Frame.Response, 1, "a")))
+    communicator.readFrame() should equal (Right(Frame(Frame.Response, 2, "b")))
+    communicator.readFrame() should equal (Left(Seq()))
+  }
+}
@@ -20,6 +20,7 @@ import java.util.Properties
 import org.scalatest._
 import scala.xml._
 import jigg.util.{XMLUtil, JSONUtil}
+import jigg.util.XMLUtil.RichNode
 
 class PipelineSpec extends BaseAnnotatorSpec {
 
@@ -51,4 +52,17 @@ class PipelineSpec extends BaseAnnotatorSpec {
     annotators(1).name should equal("dummy")
     annotators(1).nThreads should equal(4)
   }
+
+  "annotateTexts" should "annotate each text as a separate document" in {
+    val p = new Properties
+    p.setProperty("annotators", "ssplit,spaceTokenize")
+
+    val pipeline = new Pipeline(p)
+    val annotation = pipeline.annotateTexts(Seq("a b", "c d e", "f"))
+
+    val documents = annotation \ "document"
+    documents.size should equal(3)
+    documents.map(d => (d \\ "token").size) should equal(Seq(2, 3, 1))
+    (documents(1) \\ "sentence").head.textElem should equal("c d e")
+  }
 }
@@ -0,0 +1,74 @@
+package jigg.pipeline
+
+/*
+ Copyright 2013-2017 Hiroshi Noji
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+*/
+
+import java.util.concurrent.{CountDownLatch, RejectedExecutionException, TimeoutException}
+import scala.concurrent.{Await, Future}
+import scala.concurrent.ExecutionContext.Implicits.global
+import scala.concurrent.duration._
+import org.scalatest._
+
+class WorkerPoolSpec extends FlatSpec with Matchers {
+
+  /** A pool of one worker kept busy until `release` is counted down. */
+  def busyPool(queueSize: Int, release: CountDownLatch): (WorkerPool, Future[Int]) = {
+    val pool = new WorkerPool(1, queueSize)
+    val started = new CountDownLatch(1)
+    val running = pool.submit(1.minute.fromNow) { started.countDown(); release.await(); 1 }
+    started.await()
+    (pool, running)
+  }
+
+  def failure(f: Future[_]): Throwable = Await.ready(f, 10.seconds).value.get.failed.get
+
+  "WorkerPool" should "run a request by a worker" in {
+    val pool = new WorkerPool(1, 1)
+    Await.result(pool.submit(1.minute.fromNow)(1 + 1), 10.seconds) should equal (2)
+    pool.shutdown()
+  }
+
+  it should "reject a request when the queue is full" in {
+    val release = new CountDownLatch(1)
+    val (pool, running) = busyPool(1, release)
+    val waiting = pool.submit(1.minute.fromNow)(2)
+    pool.isBusy should be (true)
+    failure(pool.submit(1.minute.fromNow)(3)) shouldBe a [RejectedExecutionException]
+
+    release.countDown()
+    Await.result(running, 10.seconds) should equal (1)
+    Await.result(waiting, 10.seconds) should equal (2)
+    pool.shutdown()
+  }
+
+  it should "drop a request that times out in a full queue" in {
+    val release = new CountDownLatch(1)
+    val (pool, running) = busyPool(1, release)
+    var annotated = false
+    val waiting = pool.submit(200.millis.fromNow) { annotated = true; 2 }
+    pool.isBusy should be (true)
+
+    // Fails while the worker is still busy, and leaves the queue for the others.
+    failure(waiting) shouldBe a [TimeoutException]
+    pool.numWaiting should equal (0)
+    val next = pool.submit(1.minute.fromNow)(3)
+
+    release.countDown()
+    Await.result(next, 10.seconds) should equal (3)
+    annotated should be (false)
+    pool.shutdown()
+  }
+}
@@ -85,6 +85,18 @@ class JSONUtilSpec extends FunSuite{
     parse(JSONUtil.toJSON(testNodeForBackslash)) should be (goldJSONForBackSlash)
     parse(JSONUtil.toJSON(testNodeForEscaping)) should be (goldJSONForEscaping)
   }
+  /**
+   * Unit testing toCompactJSON
+   */
+  test("toCompactJSON should generate one line including the attributes of the given node"){
+    val document = (testNode \ "document").head
+    val json = JSONUtil.toCompactJSON(document)
+    json should not include ("\n")
+    parse(json) should be (parse("""{".tag":"document","id":"d0","text":"Test Node"}"""))
+
+    val empty = JSONUtil.toCompactJSON(<sentence><tokens/></sentence>)
+    parse(empty) should be (parse("""{".tag":"sentence",".child":[{".tag":"tokens"}]}"""))
+  }
   /**
    * Unit testing JSON to XML
    */
@@ -123,4 +123,40 @@ class TreesUtilSpec extends BaseAnnotatorSpec {
 
     TreesUtil.streeToNode(ex, sent, "x") should equal(expected) (decided by sameElem)
   }
+
+  "spansToNode" should "build the same node as streeToNode" in {
+    val sent = <sentence><tokens>
+    <token form="the" pos="DT" id="t0"/>
+    <token form="dog" pos="NN" id="t1"/>
+    <token form="saw" pos="VBD" id="t2"/>
+    <token form="a" pos="DT" id="t3"/>
+    <token form="cat" pos="NN" id="t4"/>
+    <token form="in" pos="IN" id="t5"/>
+    <token form="town" pos="NN" id="t6"/>
+    <token form="." pos="." id="t7"/>
+    </tokens></sentence>
+
+    val tree = "(S (NP (DT the) (NN dog)) (VP (VBD saw) (NP (NP (DT a) (NN cat)) (PP (IN in) (NP (NN town))))) (. .))"
+    val spans = Seq((0, 8, "S"), (0, 2, "NP"), (2, 7, "VP"), (3, 7, "NP"), (3, 5, "NP"),
+      (5, 7, "PP"), (6, 7, "NP"))
+
+    Annotation.ParseSpan.idGen.reset()
+    val expected = TreesUtil.streeToNode(tree, sent, "x")
+
+    Annotation.ParseSpan.idGen.reset()
+    TreesUtil.spansToNode(spans, sent, "x") should equal(expected) (decided by sameElem)
+  }
+
+  it should "read a unary chain from the top" in {
+    Annotation.ParseSpan.idGen.reset()
+
+    val sent = <sentence><tokens><token form="Go" pos="VB" id="t0"/></tokens></sentence>
+
+    val expected = <parse annotators="x" root="sp1">
+      <span id="sp0" symbol="VP" children="t0"/>
+      <span id="sp1" symbol="S" children="sp0"/>
+    </parse>
+
+    TreesUtil.spansToNode(Seq((0, 1, "S"), (0, 1, "VP")), sent, "x") should equal(expected) (decided by sameElem)
+  }
 }